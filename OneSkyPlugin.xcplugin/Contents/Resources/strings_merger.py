@@ -0,0 +1,5703 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# ------------------------------------------------------------------------------
+#   @author     Markus Chmelar
+#   @date       2012-12-23
+#   @version    1
+# ------------------------------------------------------------------------------
+
+'''
+Copyright (c) 2012 Markus Chmelar / Innovaptor OG
+
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+'''
+# -- Import --------------------------------------------------------------------
+# Only what every merge needs is imported here, so that starting the script is
+# fast. Modules for optional features are imported where they are used.
+# Regular Expressions
+import re
+# Operation Systems and Path Operations
+import os
+# System Utilities
+import sys
+# Opening Files with different Encodings
+import codecs
+# Commandline Options parser
+import optparse
+# Logging
+import logging
+# Measuring Durations
+import time
+
+# -- Class ---------------------------------------------------------------------
+
+
+class LocalizedStringLineParser(object):
+    ''' Parses single lines and creates LocalizedString objects from them'''
+    def __init__(self):
+        # Possible Parsing states indicating what is waited for
+        self.ParseStates = {'COMMENT': 1, 'STRING': 2, 'TRAILING_COMMENT': 3,
+                            'STRING_MULTILINE': 4, 'COMMENT_MULTILINE' :5}
+        self.StateNames = dict(
+            (state, name.lower()) for name, state in self.ParseStates.items()
+        )
+        # The parsing state indicates what the last parsed thing was
+        self.parse_state = self.ParseStates['COMMENT']
+        self.key = None
+        self.value = None
+        self.comment = None
+
+    def parse_line(self, line):
+        ''' Parses a single line. Keeps track of the current state and creates
+        LocalizedString objects as appropriate
+
+        Keyword arguments:
+
+            line
+                The next line to be parsed
+
+        Examples
+
+            >>> parser = LocalizedStringLineParser()
+            >>> string = parser.parse_line('    ')
+            >>> string
+
+            >>> string = parser.parse_line('/* Comment1 */')
+            >>> string
+
+            >>> string = parser.parse_line('    ')
+            >>> string
+
+            >>> string = parser.parse_line('"key1" = "value1";')
+            >>> string.key
+            'key1'
+            >>> string.value
+            'value1'
+            >>> string.comment
+            'Comment1'
+
+            >>> string = parser.parse_line('/* Comment2 */')
+            >>> string
+
+            >>> string = parser.parse_line('"key2" = "value2";')
+            >>> string.key
+            'key2'
+            >>> string.value
+            'value2'
+            >>> string.comment
+            'Comment2'
+
+
+            >>> parser = LocalizedStringLineParser()
+            >>> string = parser.parse_line('"KEY3" = "VALUE3"; /* Comment3 */')
+            >>> string.key
+            'KEY3'
+            >>> string.value
+            'VALUE3'
+            >>> string.comment
+            'Comment3'
+
+
+
+            >>> parser = LocalizedStringLineParser()
+            >>> string = parser.parse_line('/* Comment4 */')
+            >>> string
+
+            >>> string = parser.parse_line('"KEY4" = "VALUE4')
+            >>> string
+
+            >>> string = parser.parse_line('VALUE4_LINE2";')
+            >>> string.key
+            'KEY4'
+            >>> string.value
+            'VALUE4\\nVALUE4_LINE2'
+
+            >>> parser = LocalizedStringLineParser()
+            >>> string = parser.parse_line('/* Line 1')
+
+            >>> string = parser.parse_line(' Line 2')
+
+            >>> string = parser.parse_line(' Line 3 */')
+
+            >>> string = parser.parse_line('"key" = "value";')
+
+            >>> string.key
+            'key'
+            >>> string.value
+            'value'
+            >>> string.comment
+            'Line 1\\n Line 2\\n Line 3 '
+        '''
+        stats = STATS
+        if stats is not None:
+            # Lines handled and expressions tried in each state
+            state_name = self.StateNames[self.parse_state]
+            stats.count('lines.line.' + state_name)
+            attempts = 'regex_attempts.line.' + state_name
+        if self.parse_state == self.ParseStates['COMMENT']:
+            if stats is not None:
+                stats.count(attempts)
+            (self.key, self.value, self.comment) = LocalizedString.parse_trailing_comment(line)
+            if self.key is not None and self.value is not None and self.comment is not None:
+                return self.build_localizedString()
+            if stats is not None:
+                stats.count(attempts)
+            self.comment = LocalizedString.parse_comment(line)
+            if self.comment is not None:
+                self.parse_state = self.ParseStates['STRING']
+                return None
+            # Maybe its a multiline comment
+            if stats is not None:
+                stats.count(attempts)
+                if line.strip():
+                    stats.count('multiline_fallbacks')
+            self.comment_partial = LocalizedString.parse_multiline_comment_start(line)
+            if self.comment_partial is not None:
+                self.parse_state = self.ParseStates['COMMENT_MULTILINE']
+            return None
+
+        elif self.parse_state == self.ParseStates['COMMENT_MULTILINE']:
+            if stats is not None:
+                stats.count(attempts)
+            comment_end = LocalizedString.parse_multiline_comment_end(line)
+            if comment_end is not None:
+                self.comment = self.comment_partial + '\n' + comment_end
+                self.comment_partial = None
+                self.parse_state = self.ParseStates['STRING']
+                return None
+            # Or its just an intermediate line
+            if stats is not None:
+                stats.count(attempts)
+            comment_line = LocalizedString.parse_multiline_comment_line(line)
+            if comment_line is not None:
+                self.comment_partial = self.comment_partial + '\n' + comment_line
+            return None
+
+        elif self.parse_state == self.ParseStates['TRAILING_COMMENT']:
+            if stats is not None:
+                stats.count(attempts)
+            self.comment = LocalizedString.parse_comment(line)
+            if self.comment is not None:
+                self.parse_state = self.ParseStates['COMMENT']
+                return self.build_localizedString()
+            return None
+
+        elif self.parse_state == self.ParseStates['STRING']:
+            if stats is not None:
+                stats.count(attempts)
+            (self.key, self.value) = LocalizedString.parse_localized_pair(
+                line
+            )
+            if self.key is not None and self.value is not None:
+                self.parse_state = self.ParseStates['COMMENT']
+                return self.build_localizedString()
+            # Otherwise, try if the Value is multi-line
+            if stats is not None:
+                stats.count(attempts)
+                if line.strip():
+                    stats.count('multiline_fallbacks')
+            (self.key, self.value_partial) = LocalizedString.parse_multiline_start(
+                line
+            )
+            if self.key is not None and self.value_partial is not None:
+                self.parse_state = self.ParseStates['STRING_MULTILINE']
+                self.value = None
+            return None
+        elif self.parse_state == self.ParseStates['STRING_MULTILINE']:
+            if stats is not None:
+                stats.count(attempts)
+            value_part = LocalizedString.parse_multiline_end(line)
+            if value_part is not None:
+                self.value = self.value_partial + '\n' + value_part
+                self.value_partial = None
+                self.parse_state = self.ParseStates['COMMENT']
+                return self.build_localizedString()
+            if stats is not None:
+                stats.count(attempts)
+            value_part = LocalizedString.parse_multiline_line(line)
+            if value_part is not None:
+                self.value_partial = self.value_partial + '\n' +  value_part
+            return None
+
+
+    def parse(self, text):
+        ''' Generates the LocalizedString objects found in the buffer line by
+        line, like LocalizedStringLexer.parse
+        '''
+        for line in text.splitlines(True):
+            localized_string = self.parse_line(line)
+            if localized_string is not None:
+                yield localized_string
+
+    def parse_chunks(self, chunks, positions=None):
+        ''' Generates the LocalizedString objects found in a sequence of
+        buffers line by line, like LocalizedStringLexer.parse_chunks
+
+        Keyword arguments:
+
+            chunks
+                Iterable of consecutive parts of a strings file
+
+            positions
+                optional ``list`` the offset in the text of the end of the
+                line each entry ends on is appended to
+
+        Examples
+
+            >>> text = '/* C1 */\\n"k1" = "v1";\\n/* C2 */\\n"k2" = "v\\n2";\\n'
+            >>> expected = list(LocalizedStringLineParser().parse(text))
+            >>> len(expected)
+            2
+            >>> all(list(LocalizedStringLineParser().parse_chunks(
+            ...     [text[i:i + size] for i in range(0, len(text), size)])) == expected
+            ...     for size in range(1, len(text) + 1))
+            True
+
+            >>> positions = []
+            >>> strings = list(LocalizedStringLineParser().parse_chunks([text], positions))
+            >>> [text[start:end] for start, end in zip([0] + positions, positions)][1]
+            '/* C2 */\\n"k2" = "v\\n2";\\n'
+        '''
+        # The last line of a buffer may continue in the next chunk, even if
+        # it ends in a carriage return. It is only split again once the
+        # buffer is twice as long, so a long line is not split again for
+        # each chunk.
+        rest = ''
+        pieces = []
+        size = 0
+        offset = 0
+        chunks = iter(chunks)
+        while True:
+            chunk = next(chunks, None)
+            if chunk is not None:
+                pieces.append(chunk)
+                size += len(chunk)
+                if size < len(rest):
+                    continue
+            lines = ''.join([rest] + pieces).splitlines(True)
+            rest = chunk is not None and lines and lines.pop() or ''
+            pieces = []
+            size = 0
+            for line in lines:
+                offset += len(line)
+                localized_string = self.parse_line(line)
+                if localized_string is not None:
+                    if positions is not None:
+                        positions.append(offset)
+                    yield localized_string
+            if chunk is None:
+                break
+
+    def build_localizedString(self):
+        localizedString = LocalizedString(
+            self.key,
+            self.value,
+            self.comment
+        )
+        self.key = None
+        self.value = None
+        self.comment = None
+        return localizedString
+
+
+class LocalizedStringLexer(object):
+    ''' Scans a whole buffer in a single pass and creates LocalizedString
+    objects from it.
+
+    Every character is consumed by exactly one token and no expression
+    backtracks beyond the next quote, so the running time is linear in the
+    size of the buffer. Pairs on a single line are read like the line parser
+    reads them, so key and value reach to the last quote on the line that
+    still fits and may contain unescaped quotes. Such a line is scanned once
+    from both ends by match_line_pair instead of by an expression. Other
+    strings may contain escaped quotes and span several lines, comments may
+    be ``/* block */`` or ``// line`` comments.
+
+    The lexer is an alternative to the LocalizedStringLineParser, not its
+    replacement, and only used with ``--parser lexer``. For the entries the
+    line parser reads the resulting objects are the same, except for the
+    known divergences ``benchmarks/differential.py`` reports: entries
+    followed by ``//`` comments, empty lines and escaped quotes before a
+    semicolon in multi-line values and unescaped quotes in multi-line
+    entries. Additionally the lexer reads entries the line parser drops:
+    pairs without a leading comment, empty values and indented lines. On
+    the generated corpus both read about the same number of entries per
+    second.
+    '''
+    TOKEN_PATTERN = (
+        # Whitespace including line breaks
+        r'(?P<space>\s+)'
+        # Block comment, an unterminated one runs to the end of the buffer
+        r'|/\*(?P<comment>.*?)(?:\*/|\Z)'
+        # Line comment
+        r'|(?P<line_comment>//[^\n]*)'
+        # Complete key/value pair without other quotes on its last line, the
+        # common case handled in one token
+        r'|(?P<pair>"(?P<key>[^"\\]*(?:\\.[^"\\]*)*)"\s*=\s*'
+        r'"(?P<value>[^"\\]*(?:\\.[^"\\]*)*)"\s*;(?=[^"\n]*(?:\n|\Z)))'
+        # Complete key/value pair followed by more quotes on its line
+        r'|(?P<open_pair>"(?P<open_key>[^"\\]*(?:\\.[^"\\]*)*)"\s*=\s*'
+        r'"(?P<open_value>[^"\\]*(?:\\.[^"\\]*)*)"\s*;)'
+        # Key/value pair cut by the end of the buffer, see CHUNK_TOKEN_EXPR
+        '{}'
+        # Quoted string with escapes, an unterminated one runs to the end
+        r'|"(?P<string>[^"\\]*(?:\\.[^"\\]*)*)"?'
+        # Separators
+        r'|(?P<equals>=)'
+        r'|(?P<semicolon>;)'
+        # Anything else
+        r'|(?P<other>.)'
+    )
+    TOKEN_EXPR = re.compile(TOKEN_PATTERN.format(''), re.DOTALL)
+    # Used for all but the last buffer: a key/value pair cut by the end of
+    # the buffer is one token, so that it is scanned again once complete
+    # instead of being read as separate strings
+    CHUNK_TOKEN_EXPR = re.compile(TOKEN_PATTERN.format(
+        r'|(?P<partial>"[^"\\]*(?:\\.[^"\\]*)*(?:\\?|"\s*(?:=\s*'
+        r'(?:"[^"\\]*(?:\\.[^"\\]*)*(?:\\?|"\s*))?)?)\Z)'
+    ), re.DOTALL)
+    # End of the value of a pair on one line, see match_line_pair
+    LINE_PAIR_END_EXPR = re.compile(r' ?;(?=[ \t]*(?:/\*|\Z))')
+    # Separator between key and value of a pair on one line
+    LINE_PAIR_SEPARATOR_EXPR = re.compile(r'" ?= ?"')
+    # States indicating what is waited for next
+    KEY, EQUALS, VALUE, SEMICOLON = range(4)
+    STATE_NAMES = ['key', 'equals', 'value', 'semicolon']
+    # Tokens that depend on the rest of their line
+    LINE_KINDS = frozenset(['pair', 'open_pair', 'string'])
+
+    @staticmethod
+    def clean_comment(comment):
+        ''' Strips the comment the way the line parser does: one space after
+        the opening marker, and one before the closing marker for
+        single-line comments.
+
+        Examples
+
+            >>> LocalizedStringLexer.clean_comment(' Comment ')
+            'Comment'
+            >>> LocalizedStringLexer.clean_comment(' Line 1\\n Line 2 ')
+            'Line 1\\n Line 2 '
+            >>> LocalizedStringLexer.clean_comment(' ')
+        '''
+        if comment.startswith(' '):
+            comment = comment[1:]
+        if comment.endswith(' ') and '\n' not in comment:
+            comment = comment[:-1]
+        return comment or None
+
+    def match_line_pair(self, buffer, start, end):
+        ''' Reads the pair on one line the way
+        LocalizedString.LOCALIZED_STRING_EXPR reads it: the value ends at the
+        last quote followed by a semicolon that ends the line or precedes a
+        comment, the key at the last separator before it. Both are found by
+        scanning the quotes of the line backwards once.
+
+        Keyword arguments:
+
+            buffer
+                Text containing the line
+
+            start
+                Offset of the opening quote at the start of the line
+
+            end
+                Offset of the end of the line
+
+        Returns
+
+            ``(key, value, end)`` with the offset at which the pair ends, or
+            None if the line holds no pair
+
+        Examples
+
+            >>> lexer = LocalizedStringLexer()
+            >>> line = '"greeting" = "He said "hi" today"; /* c */'
+            >>> lexer.match_line_pair(line, 0, len(line))
+            ('greeting', 'He said "hi" today', 34)
+            >>> line = '"a" = "b"; "c" = "d";'
+            >>> lexer.match_line_pair(line, 0, len(line))[:2]
+            ('a" = "b"; "c', 'd')
+            >>> lexer.match_line_pair('"a" "b" = ;', 0, 11)
+        '''
+        quote = buffer.rfind('"', start + 1, end)
+        while quote > start:
+            match = self.LINE_PAIR_END_EXPR.match(buffer, quote + 1, end)
+            if match is not None:
+                break
+            quote = buffer.rfind('"', start + 1, quote)
+        else:
+            return None
+        # The key needs at least one character after the opening quote
+        separator = buffer.rfind('"', start + 2, quote)
+        while separator > start + 1:
+            value = self.LINE_PAIR_SEPARATOR_EXPR.match(buffer, separator, quote)
+            # The value needs at least one character as well
+            if value is not None and value.end() < quote:
+                return (
+                    buffer[start + 1:separator], buffer[value.end():quote],
+                    match.end()
+                )
+            separator = buffer.rfind('"', start + 2, separator)
+        return None
+
+    def parse(self, text):
+        ''' Generates the LocalizedString objects found in the buffer
+
+        Keyword arguments:
+
+            text
+                The complete contents of a strings file
+
+        Examples
+
+            >>> lexer = LocalizedStringLexer()
+            >>> text = '/* Comment1 */\\n"key1" = "value1";\\n'
+            >>> [(s.key, s.value, s.comment) for s in lexer.parse(text)]
+            [('key1', 'value1', 'Comment1')]
+
+            >>> text = '"KEY3" = "VALUE3"; /* Comment3 */\\n"KEY4" = "A";'
+            >>> [(s.key, s.value, s.comment) for s in lexer.parse(text)]
+            [('KEY3', 'VALUE3', 'Comment3'), ('KEY4', 'A', None)]
+
+            >>> text = '/* Line 1\\n Line 2 */\\n"k\\\\"q" = "V1\\nV2";'
+            >>> [(s.key, s.value, s.comment) for s in lexer.parse(text)]
+            [('k\\\\"q', 'V1\\nV2', 'Line 1\\n Line 2 ')]
+
+            >>> text = '/* First */\\n/* Second */\\n// skipped\\n"k" = "";'
+            >>> [(s.key, s.value, s.comment) for s in lexer.parse(text)]
+            [('k', '', 'First')]
+
+        Unescaped quotes are read like the line parser reads them, and the
+        comment of an entry that cannot be read is dropped with it
+
+            >>> text = '/* c */\\n"greeting" = "He said "hi" today";\\n/* d */\\n"k2" = "v2";\\n'
+            >>> [(s.key, s.value, s.comment) for s in lexer.parse(text)]
+            [('greeting', 'He said "hi" today', 'c'), ('k2', 'v2', 'd')]
+            >>> text = '/* c */\\n"broken" = ;\\n/* d */\\n"k2" = "v2";\\n'
+            >>> [(s.key, s.value, s.comment) for s in lexer.parse(text)]
+            [('k2', 'v2', 'd')]
+
+        The result matches the line parser on the files it can read
+
+            >>> text = '/* C1 */\\n"k1" = "v1";\\n\\n/* C2 */\\n"k2" = "a\\nb";\\n'
+            >>> line_parser = LocalizedStringLineParser()
+            >>> lines = [line_parser.parse_line(l) for l in text.splitlines()]
+            >>> [s for s in lines if s] == list(lexer.parse(text))
+            True
+
+        Long lines of quotes that never form a pair take linear time
+
+            >>> import time
+            >>> text = '"a" "b" = "c" ' * 5000 + '\\n' + '"' * 50000
+            >>> start = time.time()
+            >>> list(lexer.parse(text))
+            []
+            >>> time.time() - start < 1
+            True
+        '''
+        return self.parse_chunks([text])
+
+    def parse_chunks(self, chunks, positions=None):
+        ''' Generates the LocalizedString objects found in a sequence of
+        buffers, for example a file read piece by piece. Tokens may span
+        several buffers.
+
+        Keyword arguments:
+
+            chunks
+                Iterable of consecutive parts of a strings file
+
+            positions
+                optional ``list`` the offset in the text at which each
+                entry ends is appended to. The lexer is in its initial
+                state again at these offsets, so the text between two of
+                them parses to exactly that one entry.
+
+        Examples
+
+            >>> text = '/* C1 */\\n"k1" = "v1";\\n/* C2 */\\n"k2" = "v\\\\"2";\\n'
+            >>> chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+            >>> lexer = LocalizedStringLexer()
+            >>> list(lexer.parse_chunks(chunks)) == list(lexer.parse(text))
+            True
+
+            >>> positions = []
+            >>> strings = list(lexer.parse_chunks(chunks, positions))
+            >>> [text[start:end] for start, end in zip([0] + positions, positions)][1]
+            '\\n/* C2 */\\n"k2" = "v\\\\"2";'
+
+        The entries do not depend on where the buffers end
+
+            >>> text = ('/* a */\\n"k1" = "v\\\\"1";\\n"k2" = "x "y" z"; /* b */\\n'
+            ...         '/* c */\\n"k3" = "l1 \\\\";\\nl2\\\\\\\\";\\n"k4"="v4"; // d\\n"k5" = "v5";')
+            >>> expected = list(lexer.parse(text))
+            >>> len(expected)
+            5
+            >>> all(list(lexer.parse_chunks([text[i:i + size] for i in range(0, len(text), size)]))
+            ...     == expected for size in range(1, len(text) + 1))
+            True
+        '''
+        state = self.KEY
+        key = value = None
+        comment = None
+        # A finished entry waiting for a trailing comment on the same line
+        pending = None
+        # Token expression matches and tokens taken in each state, only
+        # counted while collecting Stats
+        stats = STATS
+        attempts = tokens = None
+        if stats is not None:
+            attempts = [0] * len(self.STATE_NAMES)
+            tokens = [0] * len(self.STATE_NAMES)
+        chunks = iter(chunks)
+        buffer = next(chunks, '')
+        chunk = next(chunks, None)
+        # Offset of the buffer in the whole text
+        offset = 0
+        # Whether the buffer starts at the start of a line
+        line_begins = True
+        while True:
+            last = chunk is None
+            expr = last and self.TOKEN_EXPR or self.CHUNK_TOKEN_EXPR
+            # Start of the part of the buffer that still has to be scanned
+            rest = len(buffer)
+            # Start of the last line, which may continue in the next chunk
+            line_start = buffer.rfind('\n') + 1
+            pos = 0
+            while pos < len(buffer):
+                match = expr.match(buffer, pos)
+                if attempts is not None:
+                    attempts[state] += 1
+                kind = match.lastgroup
+                start, end = pos, match.end()
+                if not last and (end >= len(buffer) - 1 or
+                                 kind in self.LINE_KINDS and end >= line_start):
+                    # The token may continue in the next chunk. A string
+                    # cut after a backslash ends one character early, and
+                    # which kind of pair a line holds is only known once
+                    # the line is complete.
+                    rest = start
+                    break
+                if kind != 'pair' and buffer[start] == '"' and (
+                        buffer[start - 1] == '\n' if start else line_begins):
+                    line_end = buffer.find('\n', start)
+                    loose = self.match_line_pair(
+                        buffer, start, line_end < 0 and len(buffer) or line_end
+                    )
+                    if loose is not None:
+                        kind = 'loose_pair'
+                        loose_key, loose_value, end = loose
+                pos = end
+                if tokens is not None:
+                    tokens[state] += 1
+                if kind == 'space':
+                    if pending is not None and '\n' in match.group(kind):
+                        if positions is not None:
+                            positions.append(offset + start)
+                        yield pending
+                        pending = None
+                    continue
+                if pending is not None:
+                    if kind == 'comment' and pending.comment is None:
+                        pending.comment = self.clean_comment(match.group(kind))
+                        if positions is not None:
+                            positions.append(offset + end)
+                        yield pending
+                        pending = None
+                        continue
+                    trailing = kind in ('comment', 'line_comment')
+                    if positions is not None:
+                        # A trailing comment belongs to the entry
+                        positions.append(offset + (trailing and end or start))
+                    yield pending
+                    pending = None
+                    if trailing:
+                        # Trailing comment of an entry that already has one
+                        continue
+
+                if state == self.EQUALS and kind == 'equals':
+                    state = self.VALUE
+                    continue
+                if state == self.VALUE and kind == 'string':
+                    value = match.group(kind)
+                    state = self.SEMICOLON
+                    continue
+                if state == self.SEMICOLON and kind == 'semicolon':
+                    pending = LocalizedString(key, value, comment)
+                    key = value = comment = None
+                    state = self.KEY
+                    continue
+                # Unexpected token, drop the partial entry and start over
+                if state != self.KEY:
+                    # The comment belonged to the dropped entry
+                    comment = None
+                state = self.KEY
+                key = value = None
+
+                if kind == 'pair':
+                    pending = LocalizedString(
+                        match.group('key'), match.group('value'), comment
+                    )
+                    comment = None
+                elif kind == 'loose_pair':
+                    pending = LocalizedString(loose_key, loose_value, comment)
+                    comment = None
+                elif kind == 'open_pair':
+                    pending = LocalizedString(
+                        match.group('open_key'), match.group('open_value'), comment
+                    )
+                    comment = None
+                elif kind == 'string':
+                    key = match.group(kind)
+                    state = self.EQUALS
+                elif kind == 'comment':
+                    if comment is None:
+                        comment = self.clean_comment(match.group(kind))
+            if last:
+                break
+            if rest:
+                line_begins = buffer[rest - 1] == '\n'
+            # The cut token is only scanned again once the buffer is twice
+            # as long, so a long line is not scanned again for each chunk
+            carried = len(buffer) - rest
+            parts = [buffer[rest:]]
+            size = carried
+            while chunk is not None and (size == carried or size < 2 * carried):
+                parts.append(chunk)
+                size += len(chunk)
+                chunk = next(chunks, None)
+            buffer = ''.join(parts)
+            offset += rest
+        if tokens is not None:
+            for name, count in zip(self.STATE_NAMES, tokens):
+                stats.count('tokens.lexer.{}'.format(name), count)
+            for name, count in zip(self.STATE_NAMES, attempts):
+                stats.count('regex_attempts.lexer.{}'.format(name), count)
+        if pending is not None:
+            if positions is not None:
+                positions.append(offset + len(buffer))
+            yield pending
+
+
+class LocalizedString(object):
+    ''' A localizes string entry with key, value and comment'''
+    # No per-instance __dict__, tables hold hundreds of thousands of these
+    __slots__ = ('key', 'value', 'comment')
+
+    COMMENT_EXPR = re.compile(
+        # Line start
+        r'^\w*'
+        # Comment
+        r'/\* (?P<comment>.+) \*/'
+        # End of line
+        r'\w*$'
+    )
+    COMMENT_MULTILINE_START = re.compile(
+        # Line start
+        r'^\w*'
+        # Comment
+        r'/\* (?P<comment>.+)'
+        # End of line
+        r'\w*$'
+    )
+    COMMENT_MULTILINE_LINE = re.compile(
+        # Line start
+        '^'
+        # Value
+        '(?P<comment>.+)'
+        # End of line
+        '$'
+    )
+    COMMENT_MULTILINE_END = re.compile(
+        # Line start
+        '^'
+        # Comment
+        r'(?P<comment>.+)\*/'
+        # End of line
+        r'\s*$'
+    )
+    LOCALIZED_STRING_EXPR = re.compile(
+        # Line start
+        '^'
+        # Key
+        '"(?P<key>.+)"'
+        # Equals
+        ' ?= ?'
+        # Value
+        '"(?P<value>.+)"'
+        # Whitespace
+        ';'
+        # End of line
+        '$'
+    )
+    LOCALIZED_STRING_MULTILINE_START_EXPR = re.compile(
+        # Line start
+        '^'
+        # Key
+        '"(?P<key>.+)"'
+        # Equals
+        ' ?= ?'
+        # Value
+        '"(?P<value>.+)'
+        # End of line
+        '$'
+    )
+    LOCALIZED_STRING_MULTILINE_LINE_EXPR = re.compile(
+        # Line start
+        '^'
+        # Value
+        '(?P<value>.+)'
+        # End of line
+        '$'
+    )
+    LOCALIZED_STRING_MULTILINE_END_EXPR = re.compile(
+        # Line start
+        '^'
+        # Value
+        '(?P<value>.+)"'
+        # Whitespace
+        ' ?; ?'
+        # End of line
+        '$'
+    )
+    LOCALIZED_STRING_TRAILING_COMMENT_EXPR = re.compile(
+        # Line start
+        '^'
+        # Key
+        '"(?P<key>.+)"'
+        # Equals
+        ' ?= ?'
+        # Value
+        '"(?P<value>.+)"'
+        # Whitespace
+        ' ?; ?'
+        # Comment
+        r'/\* (?P<comment>.+) \*/'
+        # End of line
+        '$'
+
+    )
+
+    @classmethod
+    def parse_multiline_start(cls, line):
+        ''' Parse the beginning of a multi-line entry, "KEY"="VALUE_LINE1
+
+        Keyword arguments:
+
+            line
+                The line to be parsed
+
+        Returns
+            ``tuple`` with key, value and comment
+            ``None`` when the line was no comment
+
+        Examples
+
+            >>> line = '"key" = "value4'
+            >>> LocalizedString.parse_multiline_start(line)
+            ('key', 'value4')
+
+        '''
+        result = cls.LOCALIZED_STRING_MULTILINE_START_EXPR.match(line)
+        if result is not None:
+            return (result.group('key'),
+                    result.group('value'))
+        else:
+            return (None, None)
+
+    @classmethod
+    def parse_multiline_line(cls, line):
+        ''' Parse an intermediate line of a multi-line entry, only value
+
+        Keyword arguments:
+
+            line
+                The line to be parsed
+
+        Returns
+            ``String`` with the value
+            ``None`` when the line was no comment
+
+        Examples
+
+            >>> line = 'value4, maybe something else'
+            >>> LocalizedString.parse_multiline_line(line)
+            'value4, maybe something else'
+        '''
+        result = cls.LOCALIZED_STRING_MULTILINE_LINE_EXPR.match(line)
+        if result is not None:
+            return result.group('value')
+        return None
+
+
+    @classmethod
+    def parse_multiline_end(cls, line):
+        ''' Parse an end line of a multi-line entry, only value
+
+        Keyword arguments:
+
+            line
+                The line to be parsed
+
+        Returns
+            ``String`` the value
+            ``None`` when the line was no comment
+
+        Examples
+
+            >>> line = 'value4, maybe something else";'
+            >>> LocalizedString.parse_multiline_end(line)
+            'value4, maybe something else'
+        '''
+        result = cls.LOCALIZED_STRING_MULTILINE_END_EXPR.match(line)
+        if result is not None:
+            return result.group('value')
+        return None
+
+
+    @classmethod
+    def parse_trailing_comment(cls, line):
+        '''Extract the content of a line with a trailing comment.
+
+        Keyword arguments:
+
+            line
+                The line to be parsed
+
+        Returns
+            ``tuple`` with key, value and comment
+            ``None`` when the line was no comment
+
+        Examples
+
+            >>> line = '"key3" = "value3";/* Bla */'
+            >>> LocalizedString.parse_trailing_comment(line)
+            ('key3', 'value3', 'Bla')
+        '''
+        result = cls.LOCALIZED_STRING_TRAILING_COMMENT_EXPR.match(line)
+        if result is not None:
+            return (
+                result.group('key'),
+                result.group('value'),
+                result.group('comment')
+            )
+        else:
+            return (None, None, None)
+
+    @classmethod
+    def parse_multiline_comment_start(cls, line):
+        '''
+        Example:
+
+            >>> LocalizedString.parse_multiline_comment_start('/* Hello ')
+            'Hello '
+        '''
+        result = cls.COMMENT_MULTILINE_START.match(line)
+        if result is not None:
+            return result.group('comment')
+        else:
+            return None
+
+
+    @classmethod
+    def parse_multiline_comment_line(cls, line):
+        '''
+        Example:
+
+            >>> LocalizedString.parse_multiline_comment_line(' Line ')
+            ' Line '
+        '''
+        result = cls.COMMENT_MULTILINE_LINE.match(line)
+        if result is not None:
+            return result.group('comment')
+        else:
+            return None
+
+
+    @classmethod
+    def parse_multiline_comment_end(cls, line):
+        '''
+        Example:
+
+            >>> LocalizedString.parse_multiline_comment_end(' End */ ')
+            ' End '
+        '''
+        result = cls.COMMENT_MULTILINE_END.match(line)
+        if result is not None:
+            return result.group('comment')
+        else:
+            return None
+
+    @classmethod
+    def parse_comment(cls, line):
+        '''Extract the content of a comment line from a line.
+
+        Keyword arguments:
+
+            line
+                The line to be parsed
+
+        Returns
+            ``string`` with the Comment or
+            ``None`` when the line was no comment
+
+        Examples
+
+            >>> LocalizedString.parse_comment('This line is no comment')
+            >>> LocalizedString.parse_comment('')
+            >>> LocalizedString.parse_comment('/* Comment */')
+            'Comment'
+        '''
+        result = cls.COMMENT_EXPR.match(line)
+        if result is not None:
+            return result.group('comment')
+        else:
+            return None
+
+    @classmethod
+    def parse_localized_pair(cls, line):
+        '''Extract the content of a key/value pair from a line.
+
+        Keyword arguments:
+
+            line
+                The line to be parsed
+
+        Returns
+            ``tupple`` with key and value as strings
+            ``tupple`` (None, None) when the line was no match
+
+        Examples
+
+            >>> LocalizedString.parse_localized_pair('Some Line')
+            (None, None)
+            >>> LocalizedString.parse_localized_pair('/* Comment */')
+            (None, None)
+            >>> LocalizedString.parse_localized_pair('"key1" = "value1";')
+            ('key1', 'value1')
+        '''
+        result = cls.LOCALIZED_STRING_EXPR.match(line)
+        if result is not None:
+            return (
+                result.group('key'),
+                result.group('value')
+            )
+        else:
+            return (None, None)
+
+    def __eq__(self, other):
+        '''Tests Equality of two LocalizedStrings
+
+        >>> s1 = LocalizedString('key1', 'value1', 'comment1')
+        >>> s2 = LocalizedString('key1', 'value1', 'comment1')
+        >>> s3 = LocalizedString('key1', 'value2', 'comment1')
+        >>> s4 = LocalizedString('key1', 'value1', 'comment2')
+        >>> s5 = LocalizedString('key1', 'value2', 'comment2')
+        >>> s1 == s2
+        True
+        >>> s1 == s3
+        False
+        >>> s1 == s4
+        False
+        >>> s1 == s5
+        False
+        >>> s1 != s2
+        False
+        '''
+        if isinstance(other, LocalizedString):
+            return (self.key == other.key and self.value == other.value and
+                    self.comment == other.comment)
+        else:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if(result is NotImplemented):
+            return result
+        return not result
+
+    def __init__(self, key, value=None, comment=None):
+        super(LocalizedString, self).__init__()
+        self.key = key
+        self.value = value
+        self.comment = comment
+
+    def is_raw(self):
+        '''
+        Return True if the localized string has not been translated.
+
+        Examples
+            >>> l1 = LocalizedString('key1', 'valye1', 'comment1')
+            >>> l1.is_raw()
+            False
+            >>> l2 = LocalizedString('key2', 'key2', 'comment2')
+            >>> l2.is_raw()
+            True
+        '''
+        return self.value == self.key
+
+    def __str__(self):
+        '''
+        Examples:
+
+            >>> text = '/* Line 1\\n Line 2 */\\n"k" = "v";\\n'
+            >>> str(parse_text(text)['k']) == text
+            True
+        '''
+        if self.comment:
+            return '/* %s%s*/\n"%s" = "%s";\n' % (
+                self.comment, comment_end(self.comment), self.key or '', self.value or '',
+            )
+        else:
+            return '"%s" = "%s";\n' % (self.key or '', self.value or '')
+
+
+class FormatSerializer(object):
+    ''' Renders entries through LocalizedString.__str__. This is the
+    reference every other serializer has to match byte for byte.
+    '''
+    @staticmethod
+    def render(strings):
+        ''' Returns the text of a strings file with the entries in the
+        given order
+        '''
+        return ''.join(['%s\n' % string for string in strings])
+
+
+class ConcatSerializer(object):
+    ''' Renders entries by joining their parts, without a format call and
+    a method lookup per entry
+
+    Examples
+
+        >>> strings = [LocalizedString('k', 'v', 'c'), LocalizedString('e', ''),
+        ...            LocalizedString('m', 'v', 'Line 1\\n Line 2 ')]
+        >>> ConcatSerializer.render(strings) == FormatSerializer.render(strings)
+        True
+    '''
+    @staticmethod
+    def render(strings):
+        parts = []
+        append = parts.append
+        for string in strings:
+            if string.comment:
+                append('/* ')
+                append(string.comment)
+                append(comment_end(string.comment))
+                append('*/\n"')
+            else:
+                append('"')
+            append(string.key or '')
+            append('" = "')
+            append(string.value or '')
+            append('";\n\n')
+        return ''.join(parts)
+
+
+class StringPool(object):
+    ''' Interns strings so that equal keys and comments of all tables parsed
+    with the same pool share a single object. Storyboard tables repeat the
+    same generated comments and every language repeats the same keys.
+    '''
+    __slots__ = ('strings',)
+
+    def __init__(self):
+        self.strings = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, string):
+        ''' Returns the pooled object equal to string
+
+        Examples
+
+            >>> pool = StringPool()
+            >>> first = pool.intern(''.join(['com', 'ment']))
+            >>> pool.intern(''.join(['comm', 'ent'])) is first
+            True
+            >>> pool.intern(None)
+        '''
+        if string is None:
+            return None
+        return self.strings.setdefault(string, string)
+
+    def intern_string(self, localized_string):
+        ''' Interns key and comment of a LocalizedString in place. A raw value
+        shares the key object.
+        '''
+        localized_string.key = self.intern(localized_string.key)
+        localized_string.comment = self.intern(localized_string.comment)
+        if localized_string.value == localized_string.key:
+            localized_string.value = localized_string.key
+        return localized_string
+
+    def clear(self):
+        self.strings.clear()
+
+
+class StringsFileCache(object):
+    ''' Keeps parsed files in memory. An entry stays valid as long as size,
+    modification time and inode of the file are unchanged.
+
+    Lookups return the cached dictionary itself, it must not be modified.
+    merge_strings leaves the tables it merges as they are.
+    '''
+    def __init__(self, parser='line'):
+        self.parser = parser
+        # path -> (stat signature, dict of LocalizedStrings)
+        self.tables = {}
+        # Shared by all cached tables
+        self.pool = StringPool()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def signature(file_path):
+        stat = os.stat(file_path)
+        return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+    def parse(self, file_path):
+        ''' Returns the parsed strings of the file, parsing it only if it
+        changed since it was cached
+
+        Returns:    ``dict``
+        '''
+        path = os.path.abspath(file_path)
+        signature = self.signature(path)
+        entry = self.tables.get(path)
+        if entry is not None and entry[0] == signature:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        strings = parse_file(path, parser=self.parser, pool=self.pool)
+        self.tables[path] = (signature, strings)
+        return strings
+
+    def store(self, file_path, strings):
+        ''' Caches strings that were just written to the file
+        '''
+        path = os.path.abspath(file_path)
+        self.tables[path] = (self.signature(path), strings)
+
+    def clear(self):
+        self.tables.clear()
+        self.pool.clear()
+
+
+class ParseCache(object):
+    ''' Stores parsed files on disk, one pickle file per strings file in the
+    cache directory, so files that did not change since the last run are not
+    parsed again.
+
+    An entry is valid while size and modification time of the file are
+    unchanged. With verify_hash the SHA-1 of the file has to match as well,
+    which also catches changes within the timestamp resolution of the file
+    system and keeps touched but unchanged files cached. Files are only
+    hashed with verify_hash, entries stored without it are parsed again once
+    it is turned on. When the cache grows beyond max_size bytes, the least
+    recently used entries are removed. The cache directory is only scanned
+    for that on the first store and whenever the entries written since make
+    it larger than max_size, so entries written by other processes count
+    from the next scan on.
+
+    Only the configuration is kept in the object, so it can be handed to
+    worker processes.
+
+    Examples
+
+        >>> import shutil, tempfile
+        >>> cache = ParseCache(tempfile.mkdtemp())
+        >>> os.path.basename(cache.entry_path('Caf\\xc3\\xa9.strings')).endswith('.pickle')
+        True
+
+    The size of the stored entries is kept up to date between scans
+
+        >>> path = os.path.join(cache.directory, 'Main.strings')
+        >>> write_data(path, b'/* c */\\n"k" = "v";\\n')
+        'created'
+        >>> strings = cache.parse(path)
+        >>> cache.store(path, strings)
+        >>> def stored_size():
+        ...     names = [name for name in os.listdir(cache.directory) if name.endswith('.pickle')]
+        ...     return sum(os.path.getsize(os.path.join(cache.directory, name)) for name in names)
+        >>> cache.size == stored_size(), cache.misses, cache.parse(path) == strings
+        (True, 1, True)
+        >>> cache.max_size = 0
+        >>> cache.store(path, strings)
+        >>> cache.size, stored_size()
+        (0, 0)
+        >>> shutil.rmtree(cache.directory)
+    '''
+    # Bumped whenever the entry format or the parsers change
+    VERSION = 1
+
+    def __init__(self, directory, parser='line', max_size=256 * 1024 * 1024,
+                 verify_hash=False):
+        self.directory = directory
+        self.parser = parser
+        self.max_size = max_size
+        self.verify_hash = verify_hash
+        self.hits = 0
+        self.misses = 0
+        # Bytes in the cache at the last scan plus the entries written since,
+        # None before the first scan
+        self.size = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def entry_path(self, path):
+        import hashlib
+        name = '{}:{}:'.format(self.VERSION, self.parser).encode('ascii') + path_bytes(path)
+        return os.path.join(
+            self.directory, hashlib.sha1(name).hexdigest() + '.pickle'
+        )
+
+    def load(self, entry_path):
+        ''' Returns the stored entry or ``None``, removing unreadable ones '''
+        try:
+            import cPickle as pickle
+        except ImportError:
+            import pickle
+        try:
+            with open(entry_path, 'rb') as entry_file:
+                return pickle.load(entry_file)
+        except (IOError, OSError):
+            return None
+        except Exception as error:
+            logging.debug('Removing broken cache entry {}: {}'.format(entry_path, error))
+            self.remove(entry_path)
+            return None
+
+    def remove(self, entry_path):
+        try:
+            os.remove(entry_path)
+        except OSError:
+            pass
+
+    def parse(self, file_path):
+        ''' Returns the parsed strings of the file, from the cache if the file
+        did not change
+
+        Returns:    ``dict``
+        '''
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        signature = (stat.st_size, stat.st_mtime)
+        entry_path = self.entry_path(path)
+        entry = self.load(entry_path)
+        digest = None
+        if entry is not None and entry['path'] == path:
+            valid = entry['signature'] == signature
+            if self.verify_hash and (valid or entry['signature'][0] == signature[0]):
+                digest = file_digest(path)
+                if digest == entry['digest'] and not valid:
+                    # Touched but unchanged, remember the new timestamp
+                    entry['signature'] = signature
+                    self.write_entry(entry_path, entry)
+                valid = digest == entry['digest']
+            if valid:
+                self.hits += 1
+                os.utime(entry_path, None)
+                logging.debug('Parse cache hit: {}'.format(file_path))
+                return dict(
+                    (key, LocalizedString(key, value, comment))
+                    for key, value, comment in entry['strings']
+                )
+        self.misses += 1
+        strings = parse_file(path, parser=self.parser)
+        self.store(path, strings, signature, digest)
+        return strings
+
+    def store(self, file_path, strings, signature=None, digest=None):
+        ''' Stores the strings of a file that were just parsed or written.
+        The signature is the (size, mtime) the file had when it was read,
+        by default the current one. The digest is the SHA-1 of the file if
+        it is already known, otherwise it is only computed with verify_hash.
+        '''
+        path = os.path.abspath(file_path)
+        if signature is None:
+            stat = os.stat(path)
+            signature = (stat.st_size, stat.st_mtime)
+        if digest is None and self.verify_hash:
+            digest = file_digest(path)
+        entry = {
+            'path': path,
+            'signature': signature,
+            'digest': digest,
+            'strings': [
+                (string.key, string.value, string.comment) for string in strings.values()
+            ],
+        }
+        self.write_entry(self.entry_path(path), entry)
+        if self.size is None or self.size > self.max_size:
+            self.evict()
+
+    def write_entry(self, entry_path, entry):
+        ''' Writes the entry to a temporary file that replaces the old entry,
+        so other processes never read a partial entry
+        '''
+        try:
+            import cPickle as pickle
+        except ImportError:
+            import pickle
+        import tempfile
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as entry_file:
+                pickle.dump(entry, entry_file, pickle.HIGHEST_PROTOCOL)
+                size = entry_file.tell()
+            try:
+                replaced = os.path.getsize(entry_path)
+            except OSError:
+                replaced = 0
+            os.rename(temporary_path, entry_path)
+        except BaseException:
+            self.remove(temporary_path)
+            raise
+        if self.size is not None:
+            self.size += size - replaced
+
+    def evict(self):
+        ''' Removes the least recently used entries until the cache is no
+        larger than max_size
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for used, size, name in entries)
+        for used, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.remove(os.path.join(self.directory, name))
+            total -= size
+        self.size = total
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.pickle'):
+                self.remove(os.path.join(self.directory, name))
+        self.size = 0
+
+
+class LazyStringsTable(object):
+    ''' Read-only table of a strings file for looking up a few keys without
+    parsing the whole file.
+
+    Opening the table only builds an index of the byte range of every entry,
+    sorted by key. Values and comments are read from the file and decoded
+    when a key is looked up. With an index_directory, for example the
+    --cache_dir, the index is saved there and loaded instead of being built
+    again as long as size and modification time of the file are unchanged.
+
+    Entries are read with the parser, one of ``PARSERS``, so the table
+    holds the same strings as parse_file with that parser.
+
+    Examples
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> path = os.path.join(directory, 'Main.strings')
+        >>> text = u'/* c1 */\\n"b" = "B";\\n"a" = "A"; /* c2 */\\n/* c3 */\\n"c" = "\\xe4";\\n'
+        >>> write_data(path, text.encode('utf-16'))
+        'created'
+        >>> table = LazyStringsTable(path, directory)
+        >>> len(table), 'a' in table, 'x' in table
+        (3, True, False)
+        >>> str(table['a'].comment), table.get('x')
+        ('c2', None)
+        >>> [table[key] for key in table] == sort_strings(parse_file(path))
+        True
+        >>> table.close()
+        >>> with LazyStringsTable(path, directory) as table:
+        ...     table.loaded, table['c'].value == u'\\xe4'
+        (True, True)
+
+    Files with characters of different sizes are indexed exactly, even
+    when there are twice as many bytes as characters
+
+        >>> text = u'"a" = "";\\n"b" = "B";\\n'
+        >>> text = text.replace(u'""', u'"%s"' % (u'\\u20ac' * len(text)))
+        >>> write_data(path, text.encode('utf-8'))
+        'updated'
+        >>> with LazyStringsTable(path, None, 'lexer') as table:
+        ...     str(table['b'].value), table['a'].value == u'\\u20ac' * 21
+        ('B', True)
+
+    Entries without a comment are only read by the lexer
+
+        >>> write_data(path, u'"a" = "A";\\n/* c */\\n"b" = "B";\\n'.encode('utf-8'))
+        'updated'
+        >>> for parser in sorted(PARSERS):
+        ...     with LazyStringsTable(path, directory, parser) as table:
+        ...         print('{} {}'.format(parser, len(table)))
+        lexer 2
+        line 1
+        >>> shutil.rmtree(directory)
+    '''
+    # Bumped whenever the index format or the lexer changes
+    VERSION = 1
+
+    def __init__(self, file_path, index_directory=None, parser='line'):
+        self.file_path = os.path.abspath(file_path)
+        self.index_directory = index_directory
+        self.parser = parser
+        self.file = None
+        # Strings that were looked up already
+        self.strings = {}
+        self.loaded = False
+        stat = os.stat(self.file_path)
+        signature = (stat.st_size, stat.st_mtime)
+        index = None
+        if index_directory is not None:
+            index = self.load_index(signature)
+        if index is None:
+            index = self.build_index(signature)
+            if index_directory is not None:
+                self.save_index(index)
+        self.codec = index['codec']
+        self.keys = index['keys']
+        self.starts = index['starts']
+        self.ends = index['ends']
+
+    def index_path(self):
+        import hashlib
+        # marshal formats differ between Python versions
+        name = '{}:{}:{}:'.format(
+            self.VERSION, sys.version_info[0], self.parser).encode('ascii')
+        name += path_bytes(self.file_path)
+        return os.path.join(
+            self.index_directory, hashlib.sha1(name).hexdigest() + '.index'
+        )
+
+    def load_index(self, signature):
+        ''' Returns the saved index if it belongs to the file as it is now,
+        ``None`` otherwise
+        '''
+        import marshal
+        with stats_phase('index'):
+            try:
+                # Reading all at once, Python 3 reads files for marshal.load
+                # in small pieces
+                with open(self.index_path(), 'rb') as index_file:
+                    index = marshal.loads(index_file.read())
+            except (IOError, OSError):
+                return None
+            except Exception as error:
+                logging.debug('Ignoring broken index of {}: {}'.format(self.file_path, error))
+                return None
+        if (not isinstance(index, dict) or index.get('path') != self.file_path or
+                tuple(index.get('signature', ())) != signature):
+            return None
+        self.loaded = True
+        return index
+
+    def save_index(self, index):
+        ''' Writes the index to a temporary file that replaces the old one,
+        like ParseCache.write_entry
+        '''
+        import marshal
+        import tempfile
+        if not os.path.isdir(self.index_directory):
+            os.makedirs(self.index_directory)
+        handle, temporary_path = tempfile.mkstemp(dir=self.index_directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as index_file:
+                marshal.dump(index, index_file)
+            os.rename(temporary_path, self.index_path())
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def build_index(self, signature):
+        ''' Scans the file once and returns the byte range of every entry,
+        sorted by key. Of several entries with the same key the last one
+        counts, like in parse_file.
+        '''
+        with stats_phase('read'), open(self.file_path, 'rb') as raw_file:
+            data = raw_file.read()
+        codec, start = self.detect_codec(data)
+        try:
+            text = codecs.lookup(codec).decode(data[start:])[0]
+        except UnicodeError:
+            if not codec.startswith('utf-16'):
+                raise
+            # Like decode_data
+            count_stat('encoding_retries')
+            codec, start = 'utf-8', 0
+            text = codecs.lookup(codec).decode(data)[0]
+        with stats_phase('index'):
+            positions = []
+            ranges = {}
+            strings = get_backend(PARSERS, self.parser)().parse_chunks([text], positions)
+            encode = codecs.lookup(codec).encode
+            # Bytes per character if every character has the same size:
+            # one byte if there are as many bytes as characters, two bytes
+            # in UTF-16 without surrogate pairs. Otherwise every entry is
+            # encoded again to find its size.
+            width = None
+            if len(data) - start == len(text):
+                width = 1
+            elif codec.startswith('utf-16') and len(data) - start == 2 * len(text):
+                width = 2
+            previous = 0
+            for localized_string, position in zip(strings, positions):
+                if width is not None:
+                    end = start + width * (position - previous)
+                else:
+                    end = start + len(encode(text[previous:position])[0])
+                ranges[localized_string.key] = (start, end)
+                previous = position
+                start = end
+            keys = sorted(ranges)
+        count_stat('entries_indexed', len(keys))
+        return {
+            'path': self.file_path,
+            'signature': signature,
+            'codec': codec,
+            'keys': keys,
+            'starts': [ranges[key][0] for key in keys],
+            'ends': [ranges[key][1] for key in keys],
+        }
+
+    @staticmethod
+    def detect_codec(data):
+        ''' Returns the codec that decodes parts of the data without a byte
+        order mark and the length of the byte order mark, see
+        detect_encoding
+
+        Examples
+
+            >>> LazyStringsTable.detect_codec(codecs.BOM_UTF16_BE + b'\\x00"')
+            ('utf-16-be', 2)
+        '''
+        encoding = detect_encoding(data[:4])
+        if encoding == 'utf-16':
+            if data.startswith(codecs.BOM_UTF16_LE):
+                return 'utf-16-le', len(codecs.BOM_UTF16_LE)
+            return 'utf-16-be', len(codecs.BOM_UTF16_BE)
+        if encoding == 'utf-8-sig':
+            return 'utf-8', len(codecs.BOM_UTF8)
+        return encoding, 0
+
+    def position(self, key):
+        import bisect
+        index = bisect.bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return index
+        return None
+
+    def __getitem__(self, key):
+        localized_string = self.strings.get(key)
+        if localized_string is not None:
+            return localized_string
+        index = self.position(key)
+        if index is None:
+            raise KeyError(key)
+        if self.file is None:
+            self.file = open(self.file_path, 'rb')
+        start = self.starts[index]
+        self.file.seek(start)
+        data = self.file.read(self.ends[index] - start)
+        text = codecs.lookup(self.codec).decode(data)[0]
+        localized_string = next(iter(get_backend(PARSERS, self.parser)().parse(text)))
+        self.strings[key] = localized_string
+        return localized_string
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return self.position(key) is not None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        ''' Iterates over the keys in sorted order '''
+        return iter(self.keys)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.close()
+
+
+class KeyIndex(object):
+    ''' SQLite index of the keys of all strings tables below a project
+    directory, for questions across languages like which keys are missing
+    or untranslated where.
+
+    Tables are found in ``<language>.lproj`` folders. A table is named by
+    its path relative to the root with the ``.lproj`` folder left out, so
+    ``App/en.lproj/Main.strings`` and ``App/de.lproj/Main.strings`` are the
+    English and German versions of table ``App/Main.strings``. update only
+    parses files whose size or modification time changed.
+
+    Examples
+
+        >>> import shutil, tempfile
+        >>> root = tempfile.mkdtemp()
+        >>> for language, text in [('en', '"a" = "A";\\n"b" = "B";\\n"d" = "D";\\n'),
+        ...                        ('de', '"a" = "a";\\n"c" = "C";\\n"d" = "De";\\n')]:
+        ...     os.mkdir(os.path.join(root, language + '.lproj'))
+        ...     path = os.path.join(root, language + '.lproj', 'Main.strings')
+        ...     status = write_file(path, parse_text(text, 'lexer'))
+        >>> index = KeyIndex(os.path.join(root, 'index.sqlite'), 'lexer')
+        >>> index.update(root) == {'indexed': 2, 'unchanged': 0, 'removed': 0}
+        True
+        >>> [str(row['key']) for row in index.missing_keys('en')]
+        ['b']
+        >>> [str(row['key']) for row in index.raw_keys()]
+        ['a']
+        >>> [str(row['key']) for row in index.orphaned_keys('en')]
+        ['c']
+        >>> [(str(row['language']), row['translated']) for row in index.coverage('en')]
+        [('de', 1)]
+        >>> index.update(root)['unchanged']
+        2
+        >>> index.close()
+        >>> shutil.rmtree(root)
+    '''
+    # Bumped whenever the schema changes, older indexes are rebuilt
+    VERSION = 1
+    SCHEMA = [
+        'CREATE TABLE files (path TEXT PRIMARY KEY, table_name TEXT, language TEXT, '
+        'size INTEGER, mtime REAL)',
+        'CREATE TABLE strings (path TEXT, key TEXT, value_hash TEXT, comment TEXT, '
+        'raw INTEGER, PRIMARY KEY (path, key))',
+        'CREATE INDEX files_table ON files (table_name, language)',
+    ]
+    # Keys with the table and language of the file they are in
+    KEYS = ('SELECT f.table_name, f.language, s.key, s.value_hash, s.comment, s.raw '
+            'FROM strings s JOIN files f ON f.path = s.path')
+
+    def __init__(self, database_path, parser='line'):
+        import sqlite3
+        self.parser = parser
+        self.connection = sqlite3.connect(database_path)
+        self.connection.row_factory = sqlite3.Row
+        version = self.connection.execute('PRAGMA user_version').fetchone()[0]
+        if version != self.VERSION:
+            with self.connection:
+                self.connection.execute('DROP TABLE IF EXISTS files')
+                self.connection.execute('DROP TABLE IF EXISTS strings')
+                for statement in self.SCHEMA:
+                    self.connection.execute(statement)
+                self.connection.execute('PRAGMA user_version = {}'.format(self.VERSION))
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def find_tables(root):
+        ''' Generates (path, table name, language) for every strings file in
+        a ``.lproj`` folder below root
+        '''
+        for directory, folders, files in os.walk(root):
+            folders.sort()
+            if not directory.endswith('.lproj'):
+                continue
+            language = os.path.basename(directory)[:-len('.lproj')]
+            parent = os.path.relpath(os.path.dirname(directory), root)
+            for name in sorted(files):
+                if name.endswith('.strings'):
+                    yield (os.path.abspath(os.path.join(directory, name)),
+                           os.path.normpath(os.path.join(parent, name)), language)
+
+    def update(self, root):
+        ''' Indexes new and changed tables below root and drops the ones that
+        no longer exist
+
+        Returns
+
+            ``dict`` with the number of files ``indexed``, ``unchanged`` and
+            ``removed``
+        '''
+        counts = {'indexed': 0, 'unchanged': 0, 'removed': 0}
+        known = dict(
+            (row['path'], (row['size'], row['mtime']))
+            for row in self.connection.execute('SELECT path, size, mtime FROM files')
+        )
+        found = set()
+        for path, table_name, language in self.find_tables(root):
+            found.add(path)
+            stat = os.stat(path)
+            if known.get(path) == (stat.st_size, stat.st_mtime):
+                counts['unchanged'] += 1
+                continue
+            self.index_file(path, table_name, language, stat)
+            counts['indexed'] += 1
+        prefix = os.path.join(os.path.abspath(root), '')
+        with self.connection:
+            for path in known:
+                if path.startswith(prefix) and path not in found:
+                    self.connection.execute('DELETE FROM files WHERE path = ?', (path,))
+                    self.connection.execute('DELETE FROM strings WHERE path = ?', (path,))
+                    counts['removed'] += 1
+        return counts
+
+    def index_file(self, path, table_name, language, stat):
+        import hashlib
+        strings = parse_file(path, parser=self.parser)
+        rows = [
+            (path, key, hashlib.sha1(string.value.encode('utf8')).hexdigest(),
+             string.comment, string.is_raw() and 1 or 0)
+            for key, string in strings.items()
+        ]
+        with self.connection:
+            self.connection.execute('DELETE FROM strings WHERE path = ?', (path,))
+            self.connection.execute(
+                'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                (path, table_name, language, stat.st_size, stat.st_mtime)
+            )
+            self.connection.executemany('INSERT INTO strings VALUES (?, ?, ?, ?, ?)', rows)
+
+    def query(self, sql, parameters=()):
+        return [dict(zip(row.keys(), row)) for row in self.connection.execute(sql, parameters)]
+
+    def missing_keys(self, base_language):
+        ''' Returns the keys of the base language tables that are missing
+        in the other languages of the same table, as ``dict``s with
+        ``table_name``, ``language`` and ``key``
+        '''
+        return self.query(
+            'SELECT f.table_name, l.language, s.key FROM strings s '
+            'JOIN files f ON f.path = s.path '
+            'JOIN files l ON l.table_name = f.table_name AND l.language != f.language '
+            'WHERE f.language = ? AND NOT EXISTS ('
+            'SELECT 1 FROM strings o WHERE o.path = l.path AND o.key = s.key) '
+            'ORDER BY f.table_name, l.language, s.key', (base_language,)
+        )
+
+    def raw_keys(self, language=None):
+        ''' Returns the keys whose value is still the key itself, in all
+        languages or in the given one
+        '''
+        if language is None:
+            return self.query(self.KEYS + ' WHERE s.raw ORDER BY 1, 2, 3')
+        return self.query(self.KEYS + ' WHERE s.raw AND f.language = ? ORDER BY 1, 2, 3',
+                          (language,))
+
+    def untranslated_keys(self, base_language):
+        ''' Returns the keys of other languages that are raw or have the same
+        value as in the base language
+        '''
+        return self.query(
+            self.KEYS + ' JOIN files bf ON bf.table_name = f.table_name AND bf.language = ? '
+            'JOIN strings b ON b.path = bf.path AND b.key = s.key '
+            'WHERE f.language != ? AND (s.raw OR s.value_hash = b.value_hash) '
+            'ORDER BY 1, 2, 3', (base_language, base_language)
+        )
+
+    def orphaned_keys(self, base_language):
+        ''' Returns the keys of other languages that the base language table
+        does not have (any more)
+        '''
+        return self.query(
+            self.KEYS + ' JOIN files bf ON bf.table_name = f.table_name AND bf.language = ? '
+            'WHERE f.language != ? AND NOT EXISTS ('
+            'SELECT 1 FROM strings b WHERE b.path = bf.path AND b.key = s.key) '
+            'ORDER BY 1, 2, 3', (base_language, base_language)
+        )
+
+    def coverage(self, base_language):
+        ''' Returns per language other than the base language the number of
+        base language ``keys`` in the tables it has, how many of them are ``translated`` (present, not raw
+        and different from the base value) and the ``coverage`` as a
+        fraction
+        '''
+        rows = self.query(
+            'SELECT l.language, COUNT(*) AS keys, '
+            'SUM(s.key IS NOT NULL AND NOT s.raw AND s.value_hash != b.value_hash) '
+            'AS translated '
+            'FROM files bf JOIN strings b ON b.path = bf.path '
+            'JOIN files l ON l.table_name = bf.table_name AND l.language != bf.language '
+            'LEFT JOIN strings s ON s.path = l.path AND s.key = b.key '
+            'WHERE bf.language = ? GROUP BY l.language ORDER BY l.language',
+            (base_language,)
+        )
+        for row in rows:
+            row['translated'] = row['translated'] or 0
+            row['coverage'] = row['keys'] and float(row['translated']) / row['keys'] or 0.0
+        return rows
+
+
+class Stats(object):
+    ''' Collects the time spent in each phase of a run and counters like
+    lines read or entries parsed. The functions of this module only record
+    into the Stats that are active through collect_stats, so without them
+    nothing is measured.
+
+    Examples
+
+        >>> with collect_stats() as stats:
+        ...     strings = parse_text('/* c */\\n"k" = "v";\\n')
+        >>> stats.counters['entries_parsed']
+        1
+        >>> stats.phases['parse']['calls']
+        1
+        >>> sorted(stats.as_dict())
+        ['counters', 'peak_rss', 'phases']
+
+    The parsers count the lines or tokens they handle and the regular
+    expressions they try in each state
+
+        >>> with collect_stats() as stats:
+        ...     strings = parse_text('/* c */\\n"k" = "v";\\n')
+        ...     strings = parse_text('"k" = "v";\\n"l" = "w";\\n', 'lexer')
+        >>> stats.counters['lines.line.comment'], stats.counters['lines.line.string']
+        (1, 1)
+        >>> counters = stats.counters
+        >>> counters['regex_attempts.line.comment'], counters['regex_attempts.line.string']
+        (2, 1)
+        >>> 'multiline_fallbacks' in counters
+        False
+        >>> stats.counters['tokens.lexer.key'], stats.counters['tokens.lexer.value']
+        (4, 0)
+    '''
+    def __init__(self):
+        # Name: {'wall': seconds, 'cpu': seconds, 'calls': number}
+        self.phases = {}
+        self.counters = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def phase(self, name):
+        ''' Returns a context manager that adds the time spent in it to the
+        phase with the given name
+        '''
+        return StatsPhase(self, name)
+
+    def add_phase(self, name, wall, cpu):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = {'wall': 0.0, 'cpu': 0.0, 'calls': 0}
+        phase['wall'] += wall
+        phase['cpu'] += cpu
+        phase['calls'] += 1
+
+    def as_dict(self):
+        ''' Returns the phases, the counters and the peak resident set size
+        of the process in bytes, ``None`` where it cannot be measured
+        '''
+        return {
+            'phases': self.phases,
+            'counters': self.counters,
+            'peak_rss': peak_rss(),
+        }
+
+
+class StatsPhase(object):
+    ''' Context manager measuring one phase, see Stats.phase '''
+    __slots__ = ('stats', 'name', 'wall', 'cpu')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.cpu = cpu_time()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.stats.add_phase(self.name, time.time() - self.wall, cpu_time() - self.cpu)
+
+
+class NoPhase(object):
+    ''' Context manager that measures nothing, used while no Stats are
+    collected
+    '''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        pass
+
+
+class collect_stats(object):
+    ''' Context manager that makes the given Stats, or new ones, the active
+    Stats of this module while it is entered and returns them
+
+    Examples
+
+        >>> with collect_stats() as stats:
+        ...     with stats_phase('example'):
+        ...         pass
+        >>> stats.phases['example']['calls']
+        1
+        >>> STATS is None
+        True
+    '''
+    def __init__(self, stats=None):
+        self.stats = stats or Stats()
+        self.previous = None
+
+    def __enter__(self):
+        global STATS
+        self.previous = STATS
+        STATS = self.stats
+        return self.stats
+
+    def __exit__(self, error_type, error, traceback):
+        global STATS
+        STATS = self.previous
+
+
+class FileLock(object):
+    ''' Context manager holding an exclusive advisory lock on a strings file
+    while it is merged, so that merges running at the same time in other
+    processes write one after another instead of losing each other's
+    updates.
+
+    The lock is taken with fcntl on the lock file ``<file>.lock`` next to
+    the real path of the file, because the file itself is replaced on every
+    write. Keeping it beside the file means only users who may write the
+    file can create or hold its lock. The lock file is removed again on
+    release, so a process that locked a lock file that was removed in the
+    meantime opens the new one and tries again. Waiting for the lock gives
+    up after timeout seconds, ``None`` uses LOCK_TIMEOUT. Without fcntl
+    nothing is locked.
+
+    Examples
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> path = os.path.join(directory, 'Locked.strings')
+        >>> with FileLock(path):
+        ...     try:
+        ...         FileLock(path, timeout=0).acquire()
+        ...     except LockTimeoutError:
+        ...         print('locked')
+        locked
+        >>> with FileLock(path, timeout=0):
+        ...     pass
+        >>> os.listdir(directory)
+        []
+
+    Links share the lock of the file they point to
+
+        >>> if hasattr(os, 'symlink'):
+        ...     os.symlink(path, os.path.join(directory, 'Link.strings'))
+        ...     link = FileLock(os.path.join(directory, 'Link.strings'))
+        ...     same = link.lock_path() == FileLock(path).lock_path()
+        ... else:
+        ...     same = True
+        >>> same
+        True
+        >>> shutil.rmtree(directory)
+    '''
+    def __init__(self, file_path, timeout=None, interval=0.05):
+        self.file_path = file_path
+        self.timeout = timeout
+        if timeout is None:
+            self.timeout = LOCK_TIMEOUT
+        self.interval = interval
+        self.file = None
+
+    def lock_path(self):
+        return os.path.realpath(self.file_path) + '.lock'
+
+    def acquire(self):
+        import errno
+        try:
+            import fcntl
+        except ImportError:
+            logging.debug('No fcntl, merging {} without a lock'.format(self.file_path))
+            return
+        lock_path = self.lock_path()
+        deadline = time.time() + self.timeout
+        with stats_phase('lock'):
+            while True:
+                lock_file = open(lock_path, 'a')
+                try:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    if self.is_current(lock_file):
+                        break
+                except (IOError, OSError) as error:
+                    if error.errno not in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                        lock_file.close()
+                        raise
+                else:
+                    # Removed by the previous holder, lock the new one
+                    lock_file.close()
+                    continue
+                lock_file.close()
+                if time.time() >= deadline:
+                    raise LockTimeoutError(self.file_path, self.timeout)
+                time.sleep(self.interval)
+        self.file = lock_file
+
+    def is_current(self, lock_file):
+        ''' Whether the open lock file is still the one at lock_path '''
+        try:
+            stat = os.stat(self.lock_path())
+        except OSError:
+            return False
+        opened = os.fstat(lock_file.fileno())
+        return (stat.st_dev, stat.st_ino) == (opened.st_dev, opened.st_ino)
+
+    def release(self):
+        if self.file is not None:
+            # Removed while still locked, then closing the file releases the lock
+            try:
+                os.remove(self.lock_path())
+            except OSError:
+                pass
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self.release()
+
+
+# -- Methods -------------------------------------------------------------------
+
+ENCODINGS = ['utf16', 'utf8']
+# Byte order marks and the encodings that read them
+BOMS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# Files of at least this size in bytes are memory-mapped for reading
+MMAP_THRESHOLD = 1024 * 1024
+# Bytes read at a time when streaming
+CHUNK_SIZE = 64 * 1024
+# Entries sorted in memory at a time by external_sort
+RUN_SIZE = 100000
+# Entries encode_strings renders at once
+RENDER_BATCH = 512
+# Flags of a merge job and their defaults
+JOB_FLAGS = {
+    'keep_comment': False,
+    'replace_value': False,
+    'streaming': False,
+    'delta': False,
+    'check': False,
+}
+# Backends by name. Parsers generate the LocalizedString objects of a text
+# with parse, serializers render entries to text with render. The line
+# parser and the format serializer are the references the others are
+# checked against by benchmarks/differential.py.
+PARSERS = {'lexer': LocalizedStringLexer, 'line': LocalizedStringLineParser}
+REFERENCE_PARSER = 'line'
+SERIALIZERS = {'format': FormatSerializer, 'concat': ConcatSerializer}
+REFERENCE_SERIALIZER = 'format'
+# Serializer used where none is given, see use_serializer. concat writes the
+# same bytes as format about twice as fast.
+SERIALIZER = 'concat'
+# Seconds a merge waits for the lock of its old file, see use_lock_timeout
+LOCK_TIMEOUT = 60.0
+# Times a merge starts over when its old file changed while it was merged
+LOCK_RETRIES = 3
+# Names of language folders archive members can be mapped to
+LANGUAGE_EXPR = re.compile(r'^[A-Za-z0-9_@-]+$')
+# Queries on the KeyIndex and the methods answering them
+INDEX_QUERIES = {
+    'missing': 'missing_keys',
+    'raw': 'raw_keys',
+    'untranslated': 'untranslated_keys',
+    'orphaned': 'orphaned_keys',
+    'coverage': 'coverage',
+}
+# printf style format specifiers of NSString, %% is a literal percent sign.
+# The space flag is left out so that "50 % off" is not read as a specifier.
+PLACEHOLDER_EXPR = re.compile(
+    r"%(?:(?P<position>[1-9][0-9]*)\$)?[-+0#']*(?:[0-9]+|\*)?(?:\.(?:[0-9]+|\*))?"
+    r'(?P<length>hh|h|ll|l|q|L|z|t|j)?(?P<conversion>[@%dDiuUxXoOfFeEgGaAcCsSp])'
+)
+# Escape sequences allowed in strings files, anything else ends up in broken
+STRING_ESCAPE_EXPR = re.compile(
+    r'\\(?:[uU][0-9a-fA-F]{4}|[0-7]{1,3}|["\\\'abfnrtv]|(?P<broken>.|$))', re.DOTALL
+)
+# Problems validate_strings reports
+VALIDATION_CHECKS = ['duplicate_key', 'broken_escape', 'empty_value', 'placeholders']
+# Formats compile_strings writes tables for shipping in
+COMPILE_FORMATS = ['binary', 'utf8']
+BPLIST_HEADER = b'bplist00'
+# struct formats of big-endian unsigned integers by their size in bytes
+INT_FORMATS = {1: '>B', 2: '>H', 4: '>L', 8: '>Q'}
+# Escape sequences in keys and values: \U and four hex digits, up to three
+# octal digits or a single character
+ESCAPE_EXPR = re.compile(r'\\(?:[uU]([0-9a-fA-F]{4})|([0-7]{1,3})|(.))', re.DOTALL)
+ESCAPES = {'a': '\a', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+# Stats recorded into, set by collect_stats
+STATS = None
+NO_PHASE = NoPhase()
+
+
+def stats_phase(name):
+    ''' Returns a context manager measuring the phase with the given name in
+    the active Stats, or one doing nothing if there are none
+    '''
+    if STATS is None:
+        return NO_PHASE
+    return STATS.phase(name)
+
+
+def count_stat(name, amount=1):
+    ''' Adds to a counter of the active Stats, if there are any '''
+    if STATS is not None:
+        STATS.count(name, amount)
+
+
+def cpu_time():
+    ''' Returns the user and system CPU time of the process in seconds '''
+    times = os.times()
+    return times[0] + times[1]
+
+
+def peak_rss():
+    ''' Returns the peak resident set size of the process in bytes, or
+    ``None`` where it cannot be measured
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return peak
+
+
+def comment_end(comment):
+    '''Returns what goes between a comment and its closing marker. Multi-line
+    comments keep the space before the marker when they are parsed, see
+    LocalizedString.parse_multiline_comment_end, so it is not added twice
+    and merging a file again leaves it as it is.
+
+    Examples:
+
+        >>> comment_end('Comment'), comment_end('Line 1\\n Line 2 ')
+        (' ', '')
+    '''
+    if '\n' in comment and comment.endswith(' '):
+        return ''
+    return ' '
+
+
+def register_parser(name, backend):
+    '''Makes a parser backend available under name, for the parser
+    arguments and ``--parser``. A backend is a class whose instances have a
+    parse method generating the LocalizedString objects of a text, like
+    LocalizedStringLexer. A fresh instance is used for every text.
+    '''
+    PARSERS[name] = backend
+
+
+def register_serializer(name, backend):
+    '''Makes a serializer backend available under name, for use_serializer
+    and ``--serializer``. A backend has a render function returning the text
+    of a list of LocalizedString objects, like FormatSerializer.
+    '''
+    SERIALIZERS[name] = backend
+
+
+def get_backend(backends, name):
+    '''Returns the backend registered under name in PARSERS or SERIALIZERS,
+    raising ``ValueError`` for unknown names
+    '''
+    try:
+        return backends[name]
+    except KeyError:
+        raise ValueError('Unknown backend {}, use one of {}'.format(
+            name, ', '.join(sorted(backends))))
+
+
+def use_serializer(name):
+    '''Makes the serializer with the given name the one render_strings and
+    encode_strings use unless they are given another
+
+    Examples:
+
+        >>> strings = {'k': LocalizedString('k', 'v', 'c')}
+        >>> use_serializer('format')
+        >>> reference = render_strings(strings)
+        >>> use_serializer('concat')
+        >>> reference == render_strings(strings)
+        True
+    '''
+    global SERIALIZER
+    get_backend(SERIALIZERS, name)
+    SERIALIZER = name
+
+
+def use_lock_timeout(seconds):
+    '''Sets the seconds merges wait for the lock of their old file before
+    they fail with LockTimeoutError, see FileLock
+    '''
+    global LOCK_TIMEOUT
+    LOCK_TIMEOUT = seconds
+
+
+def merge_strings(old_strings, new_strings, keep_comment=False, replace_value=False):
+    '''Merges two dictionarys, one with the old strings and one with the new
+    strings. Neither dictionary nor its Strings are modified, so the new
+    strings can be merged into several old ones.
+    Old strings keep their value but their comment will be updated. Only if
+    the string is 'raw' which means its value is equal to its key, the value
+    will be replaced by the new one.
+    But because the method has to work with NSLocalizedStringWithDefaultValue
+    as well it is not possible to detect untranslated strings with default value
+    so if the default value changes this will not be updated!
+
+    Keyword arguments:
+
+        old_strings
+            Dictionary with the Strings that were already there
+
+        new_strings
+            Dictionary with the new Strings
+            
+        keep_comment
+            If True, the old comment will be kept. This is necessary for
+            translating Storyboard files because they have generated comments
+            which are not very helpful
+            
+        replace_value
+            If True, the old value will be replaced. This is necessary for
+            translating IB files because they are never `raw` strings
+            
+    Returns
+
+        Merged Dictionary
+
+    Examples:
+
+        >>> old_dict = {}
+        >>> old_dict['key1'] = LocalizedString('key1', 'value1', 'comment1')
+        >>> old_dict['key2'] = LocalizedString('key2', 'value2', 'comment2')
+        >>> old_dict['key3'] = LocalizedString('key3', 'key3', 'comment3')
+        >>> new_dict = {}
+        >>> new_dict['key1'] = LocalizedString('key1', 'key1', 'comment1')
+        >>> new_dict['key2'] = LocalizedString('key2', 'key2', 'comment2_new')
+        >>> new_dict['key4'] = LocalizedString('key4', 'key4', 'comment4')
+        >>> new_dict['key3'] = LocalizedString('key3', 'value3', 'comment3')
+        >>> merge_dict = merge_strings(old_dict, new_dict)
+        >>> merge_dict['key1'].value
+        'value1'
+        >>> merge_dict['key1'].comment
+        'comment1'
+        >>> merge_dict['key2'].value
+        'value2'
+        >>> merge_dict['key2'].comment
+        'comment2_new'
+        >>> merge_dict['key3'].value
+        'value3'
+        >>> merge_dict['key3'].comment
+        'comment3'
+        >>> merge_dict['key4'].value
+        'key4'
+        >>> merge_dict['key4'].comment
+        'comment4'
+        >>> sorted(new_dict), new_dict['key1'].value
+        (['key1', 'key2', 'key3', 'key4'], 'key1')
+
+        >>> old_dict_2 = {}
+        >>> new_dict_2 = {}
+        >>> old_dict_2['key1'] = LocalizedString('key1', 'value1', 'comment1')
+        >>> new_dict_2['key1'] = LocalizedString('key1', 'value1', 'comment2')
+        >>> merged_1 = merge_strings(old_dict_2, new_dict_2, keep_comment=False)
+        >>> merged_1['key1'].value
+        'value1'
+        >>> merged_1['key1'].comment
+        'comment2'
+        >>> old_dict_2['key1'] = LocalizedString('key1', 'value1', 'comment1')
+        >>> new_dict_2['key1'] = LocalizedString('key1', 'value1', 'comment2')
+        >>> merged_2 = merge_strings(old_dict_2, new_dict_2, keep_comment=True)
+        >>> merged_2['key1'].value
+        'value1'
+        >>> merged_2['key1'].comment
+        'comment1'
+    '''
+    merged_strings = {}
+    for key, old_string in old_strings.items():
+        if key in new_strings:
+            merged_strings[key] = merge_string(
+                old_string, new_strings[key], keep_comment, replace_value
+            )
+        else:
+            # If the String is not in the new Strings anymore it has been removed
+            # TODO: Include option to not remove old keys!
+            pass
+    # All strings that are not in the old_strings dict are really new and can be shared
+    for key, new_string in new_strings.items():
+        if key not in old_strings:
+            merged_strings[key] = new_string
+
+    return merged_strings
+
+
+def merge_string(old_string, new_string, keep_comment=False, replace_value=False):
+    '''Merges a string that is in both the old and the new strings, see
+    merge_strings. The merged string is returned as a new LocalizedString.
+
+    Examples:
+
+        >>> old = LocalizedString('key1', 'value1', 'comment1')
+        >>> new = LocalizedString('key1', 'key1', 'comment2')
+        >>> merged = merge_string(old, new)
+        >>> merged.value, merged.comment, new.value
+        ('value1', 'comment2', 'key1')
+    '''
+    value = new_string.value
+    comment = new_string.comment
+    if old_string.is_raw() or replace_value:
+        # if the old string is raw just take the new string
+        pass
+    else:
+        # otherwise take the value of the old string but the comment of the new string
+        value = old_string.value
+    if keep_comment:
+        comment = old_string.comment
+    return LocalizedString(new_string.key, value, comment)
+
+
+def compute_delta(old_strings, merged_strings):
+    '''Lists the keys a merge changed, so that only they have to be uploaded
+
+    Keyword arguments:
+
+        old_strings
+            Dictionary with the Strings before the merge
+
+        merged_strings
+            Dictionary with the Strings after the merge
+
+    Returns
+
+        ``dict`` with sorted lists of the keys that were ``added``,
+        ``removed`` or have a changed value (``value_changed``) or comment
+        (``comment_changed``)
+
+    Examples:
+
+        >>> old_dict = {}
+        >>> old_dict['key1'] = LocalizedString('key1', 'value1', 'comment1')
+        >>> old_dict['key2'] = LocalizedString('key2', 'value2', 'comment2')
+        >>> old_dict['key3'] = LocalizedString('key3', 'key3', 'comment3')
+        >>> new_dict = {}
+        >>> new_dict['key1'] = LocalizedString('key1', 'key1', 'comment1_new')
+        >>> new_dict['key3'] = LocalizedString('key3', 'value3', 'comment3')
+        >>> new_dict['key4'] = LocalizedString('key4', 'key4', 'comment4')
+        >>> delta = compute_delta(old_dict, merge_strings(old_dict, new_dict))
+        >>> for change in ('added', 'removed', 'value_changed', 'comment_changed'):
+        ...     print('{} {}'.format(change, ' '.join(delta[change])))
+        added key4
+        removed key2
+        value_changed key3
+        comment_changed key1
+    '''
+    delta = {'added': [], 'removed': [], 'value_changed': [], 'comment_changed': []}
+    for key, string in merged_strings.items():
+        old_string = old_strings.get(key)
+        if old_string is None:
+            delta['added'].append(key)
+            continue
+        if string.value != old_string.value:
+            delta['value_changed'].append(key)
+        if string.comment != old_string.comment:
+            delta['comment_changed'].append(key)
+    delta['removed'] = [key for key in old_strings if key not in merged_strings]
+    for keys in delta.values():
+        keys.sort()
+    return delta
+
+
+def detect_encoding(data):
+    ''' Detects the encoding of the contents of a strings file from its byte
+        order mark. Without one, zero bytes in the first character reveal
+        UTF-16, anything else is read as UTF-8.
+
+        Keyword arguments:
+
+            data
+                the first bytes of the file
+
+        Returns:    name of the encoding
+
+        Examples
+
+            >>> detect_encoding(codecs.BOM_UTF16_LE + '"'.encode('utf-16-le'))
+            'utf-16'
+            >>> detect_encoding(codecs.BOM_UTF8 + b'"k"')
+            'utf-8-sig'
+            >>> detect_encoding('"k"'.encode('utf-16-be'))
+            'utf-16-be'
+            >>> detect_encoding('"k"'.encode('utf-16-le'))
+            'utf-16-le'
+            >>> detect_encoding(b'"k" = "v";')
+            'utf-8'
+    '''
+    data = data[:4]
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            return encoding
+    if data[0:1] == b'\x00' and data[1:2] != b'\x00':
+        return 'utf-16-be'
+    if data[0:1] != b'\x00' and data[1:2] == b'\x00':
+        return 'utf-16-le'
+    return 'utf-8'
+
+
+def read_file(file_path, encoding=None):
+    ''' Reads a whole file and decodes it in one go. Files of at least
+        MMAP_THRESHOLD bytes are memory-mapped instead of read.
+
+        Keyword arguments:
+
+            file_path
+                path to the file that should be read
+
+            encoding
+                encoding of the file, detected with detect_encoding if
+                ``None``
+
+        Returns:    decoded text, ``unicode`` on Python 2, see decode_data
+    '''
+    with stats_phase('read'), open(file_path, 'rb') as raw_file:
+        size = os.fstat(raw_file.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            import mmap
+            data = mmap.mmap(raw_file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = raw_file.read()
+        try:
+            text = decode_data(data, encoding)
+        finally:
+            if size >= MMAP_THRESHOLD:
+                data.close()
+    if STATS is not None:
+        STATS.count('bytes_read', size)
+        STATS.count('lines_read', text.count('\n'))
+    return text
+
+
+def decode_data(data, encoding=None):
+    ''' Decodes the contents of a strings file. UTF-16 that cannot be
+        decoded is read as UTF-8 instead, like earlier versions did.
+
+        Keyword arguments:
+
+            data
+                ``bytes`` or a memory map of the file
+
+            encoding
+                encoding of the data, detected with detect_encoding if
+                ``None``
+
+        Returns:    decoded text, ``unicode`` on Python 2
+
+        Examples
+
+            >>> decode_data(codecs.BOM_UTF16_LE + '"k"'.encode('utf-16-le')) == u'"k"'
+            True
+            >>> decode_data(b'"k" = "\\xc3\\xa4";', 'utf16') == u'"k" = "\\xe4";'
+            True
+    '''
+    if encoding is None:
+        encoding = detect_encoding(data[:4])
+    logging.debug("Decoding File as {}".format(encoding))
+    try:
+        return codecs.lookup(encoding).decode(data)[0]
+    except UnicodeError:
+        if codecs.lookup(encoding).name not in ('utf-16', 'utf-16-le', 'utf-16-be'):
+            raise
+        logging.debug("Decoding File as utf-8 instead")
+        count_stat('encoding_retries')
+        return codecs.lookup('utf-8').decode(data)[0]
+
+
+def parse_file(file_path, encoding=None, parser='line', pool=None, duplicates=None):
+    ''' Parses a file and creates a dictionary containing all LocalizedStrings
+        elements in the file
+
+        Keyword arguments:
+
+            file_path
+                path to the file that should be parsed
+
+            encoding
+                encoding of the file, detected with detect_encoding if
+                ``None``
+
+            parser
+                ``line`` uses the LocalizedStringLineParser, ``lexer`` scans
+                the whole file in a single pass and also reads entries the
+                line parser drops
+
+            pool
+                optional StringPool shared with other tables
+
+            duplicates
+                optional ``list`` the keys found more than once are appended
+                to, see parse_text
+
+        Returns:    ``dict``
+    '''
+    logging.debug("Parsing File: {}".format(file_path))
+    return parse_text(read_file(file_path, encoding), parser, pool, duplicates)
+
+
+def parse_text(text, parser='line', pool=None, duplicates=None):
+    ''' Parses the decoded contents of a strings file
+
+        Keyword arguments:
+
+            text
+                contents of the file
+
+            parser
+                one of ``PARSERS``
+
+            pool
+                optional StringPool shared with other tables
+
+            duplicates
+                optional ``list`` every key that is found again is appended
+                to. The table keeps the last entry of a duplicate key.
+
+        Returns:    ``dict``
+
+        Examples
+
+            >>> text = '/* C1 */\\n"k1" = "v1";\\n/* C2 */\\n"k2" = "v2";\\n'
+            >>> sorted(parse_text(text))
+            ['k1', 'k2']
+            >>> parse_text(text, 'line') == parse_text(text, 'lexer')
+            True
+
+            >>> pool = StringPool()
+            >>> german = parse_text(text.replace('v1', 'w1'), pool=pool)
+            >>> french = parse_text(text.replace('v1', 'u1'), pool=pool)
+            >>> german['k2'].comment is french['k2'].comment
+            True
+
+            >>> duplicates = []
+            >>> str(parse_text(text + '/* C3 */\\n"k1" = "v3";', duplicates=duplicates)['k1'].value)
+            'v3'
+            >>> duplicates
+            ['k1']
+    '''
+    with stats_phase('parse'):
+        parsed_strings = get_backend(PARSERS, parser)().parse(text)
+        localized_strings = {}
+        for localized_string in parsed_strings:
+            if pool is not None:
+                pool.intern_string(localized_string)
+            if duplicates is not None and localized_string.key in localized_strings:
+                duplicates.append(localized_string.key)
+            localized_strings[localized_string.key] = localized_string
+    count_stat('entries_parsed', len(localized_strings))
+    return localized_strings
+
+
+def render_strings(strings, encoding='utf16', serializer=None):
+    '''Renders the strings sorted by key and encodes the whole file at once
+
+    Keyword arguments:
+
+        serializer
+            name of one of ``SERIALIZERS``, ``SERIALIZER`` if ``None``
+
+    Returns:    encoded contents of the file
+
+    Examples
+
+        >>> strings = {'k': LocalizedString('k', 'v', 'c')}
+        >>> render_strings(strings, 'utf8') == b'/* c */\\n"k" = "v";\\n\\n'
+        True
+        >>> render_strings({}) == b''
+        True
+    '''
+    render = get_backend(SERIALIZERS, serializer or SERIALIZER).render
+    sorted_strings = sort_strings(strings)
+    with stats_phase('encode'):
+        text = render(sorted_strings)
+        if not text:
+            # Like a codecs writer that never wrote, without byte order mark
+            return b''
+        return text.encode(encoding)
+
+
+def write_file(file_path, strings, encoding='utf16', expected=False):
+    '''Writes the strings to the given file, see write_data
+
+    Returns:    ``unchanged``, ``updated`` or ``created``
+    '''
+    return write_data(file_path, render_strings(strings, encoding), expected)
+
+
+def write_data(file_path, data, expected=False):
+    '''Writes data to a file unless the file already has exactly this content,
+    so that unchanged files keep their modification time. The data is
+    written to a temporary file next to it that then replaces the file, so
+    nobody ever reads a partially written file.
+
+    Keyword Arguments
+
+        expected
+            file_signature the file must still have, ``None`` if it must
+            not exist, ``False`` to write whatever the file is now. The file
+            is checked right before it is replaced and FileChangedError is
+            raised if it differs.
+
+    Returns:    ``unchanged``, ``updated`` or ``created``
+
+    Examples:
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> path = os.path.join(directory, 'Main.strings')
+        >>> write_data(path, b'"a" = "a";\\n', expected=None)
+        'created'
+        >>> try:
+        ...     write_data(path, b'"b" = "b";\\n', expected=None)
+        ... except FileChangedError:
+        ...     print('changed')
+        changed
+        >>> write_data(path, b'"b" = "b";\\n', expected=file_signature(path))
+        'updated'
+        >>> shutil.rmtree(directory)
+    '''
+    import hashlib
+    with stats_phase('write'):
+        path = os.path.realpath(file_path)
+        stat = stat_or_none(path)
+        check_unchanged(path, stat, expected)
+        if (stat is not None and stat.st_size == len(data) and
+                file_digest(path) == hashlib.sha1(data).hexdigest()):
+            return 'unchanged'
+        count_stat('bytes_written', len(data))
+        temporary_path = write_temporary(path, [data])[0]
+        return replace_file(temporary_path, path, stat, expected)
+
+
+def write_chunks(file_path, chunks, expected=False):
+    '''Like write_data, for data that is produced piece by piece. Because the
+    data is only known once it has been written, it always goes to a
+    temporary file, which is dropped again if the content did not change.
+
+    Returns:    ``unchanged``, ``updated`` or ``created``
+    '''
+    path = os.path.realpath(file_path)
+    stat = stat_or_none(path)
+    check_unchanged(path, stat, expected)
+    temporary_path, size, digest = write_temporary(path, chunks)
+    if stat is not None and stat.st_size == size and file_digest(path) == digest:
+        os.remove(temporary_path)
+        return 'unchanged'
+    return replace_file(temporary_path, path, stat, expected)
+
+
+def compare_data(file_path, data):
+    '''Tells what write_data would do with data, without writing anything
+
+    Returns:    ``unchanged``, ``updated`` or ``created``
+    '''
+    import hashlib
+    path = os.path.realpath(file_path)
+    stat = stat_or_none(path)
+    if stat is None:
+        return 'created'
+    if stat.st_size == len(data) and file_digest(path) == hashlib.sha1(data).hexdigest():
+        return 'unchanged'
+    return 'updated'
+
+
+def path_bytes(path):
+    '''Returns a path as bytes for hashing, paths that are not bytes yet are
+    encoded with the file system encoding
+    '''
+    if isinstance(path, bytes):
+        return path
+    return path.encode(sys.getfilesystemencoding())
+
+
+def stat_or_none(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def file_signature(file_path, stat=False):
+    '''Returns size, modification time and inode of a file, ``None`` if it
+    does not exist. A stat of the file that was already taken can be given.
+    '''
+    if stat is False:
+        stat = stat_or_none(file_path)
+    if stat is None:
+        return None
+    return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+
+def check_unchanged(path, stat, expected=False):
+    '''Raises FileChangedError unless the stat of path has the expected
+    file_signature, see write_data
+    '''
+    if expected is not False and file_signature(path, stat) != expected:
+        raise FileChangedError(path)
+
+
+def write_temporary(path, chunks):
+    '''Writes the chunks to a new temporary file next to path and syncs it
+    to disk. The temporary file is removed again if anything fails.
+
+    Returns:    ``tuple`` with the temporary path, the size and the SHA-1
+    '''
+    import hashlib
+    import tempfile
+    handle, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix='.' + os.path.basename(path) + '.', suffix='.tmp'
+    )
+    sha1 = hashlib.sha1()
+    size = 0
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+                sha1.update(chunk)
+                size += len(chunk)
+            output.flush()
+            os.fsync(output.fileno())
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return temporary_path, size, sha1.hexdigest()
+
+
+def replace_file(temporary_path, path, stat, expected=False):
+    '''Moves the temporary file over path, keeping the mode of the replaced
+    file given by its stat, or applying the umask to a new file. The
+    temporary file is dropped if path no longer has the expected
+    file_signature, see write_data.
+
+    Returns:    ``updated`` or ``created``
+    '''
+    try:
+        check_unchanged(path, stat_or_none(path), expected)
+        if stat is not None:
+            mode = stat.st_mode & 0o7777
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(temporary_path, mode)
+        os.rename(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    if stat is None:
+        return 'created'
+    return 'updated'
+
+
+def file_digest(file_path):
+    '''Returns the SHA-1 of the contents of a file
+    '''
+    import hashlib
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as contents:
+        for block in iter(lambda: contents.read(1024 * 1024), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def sort_strings(strings):
+    '''Returns an array that contains all LocalizedStrings objects of the
+    dictionary, sorted alphabetically
+    '''
+    with stats_phase('sort'):
+        values = [strings[key] for key in sorted(strings)]
+    return values
+
+
+class UnsortedStringsError(ValueError):
+    ''' Raised by check_sorted when a file is not sorted by key '''
+    def __init__(self, file_path, key):
+        super(UnsortedStringsError, self).__init__(
+            'Not sorted by key: {} at {}'.format(file_path, key)
+        )
+        self.file_path = file_path
+
+
+class LockTimeoutError(OSError):
+    ''' Raised by FileLock when another merge holds the lock too long '''
+    def __init__(self, file_path, timeout):
+        super(LockTimeoutError, self).__init__(
+            'Gave up waiting {:g} seconds for the lock of {}'.format(timeout, file_path)
+        )
+        self.file_path = file_path
+
+
+class FileChangedError(OSError):
+    ''' Raised by write_data and write_chunks when the file they replace
+    changed since it was read '''
+    def __init__(self, file_path):
+        super(FileChangedError, self).__init__('Changed while merging: {}'.format(file_path))
+        self.file_path = file_path
+
+
+def iter_file_chunks(file_path, encoding=None, chunk_size=CHUNK_SIZE):
+    '''Reads a file piece by piece and decodes it incrementally, the encoding
+    is detected from the first piece as in read_file
+
+    Returns
+
+        generator of decoded text chunks
+    '''
+    with open(file_path, 'rb') as raw_file:
+        data = raw_file.read(chunk_size)
+        if encoding is None:
+            encoding = detect_encoding(data[:4])
+        decoder = codecs.getincrementaldecoder(encoding)()
+        while data:
+            text = decoder.decode(data)
+            if text:
+                yield text
+            data = raw_file.read(chunk_size)
+        text = decoder.decode(b'', True)
+        if text:
+            yield text
+
+
+def check_sorted(strings, file_path=None):
+    '''Passes on a sequence of strings that is sorted by key. Of several
+    strings with the same key only the last one is kept, like parse_file
+    does.
+
+    Raises UnsortedStringsError as soon as a key is smaller than the one
+    before it.
+
+    Examples:
+
+        >>> strings = [LocalizedString('a', '1'), LocalizedString('b', '2'),
+        ...            LocalizedString('b', '3')]
+        >>> [string.value for string in check_sorted(strings)]
+        ['1', '3']
+        >>> try:
+        ...     list(check_sorted(reversed(strings), 'file'))
+        ... except UnsortedStringsError as error:
+        ...     print(error)
+        Not sorted by key: file at a
+    '''
+    previous = None
+    for string in strings:
+        if previous is not None:
+            if string.key < previous.key:
+                raise UnsortedStringsError(file_path, string.key)
+            if string.key != previous.key:
+                yield previous
+        previous = string
+    if previous is not None:
+        yield previous
+
+
+def external_sort(strings, run_size=RUN_SIZE):
+    '''Sorts strings by key with no more than run_size of them in memory.
+    Sorted runs are written to temporary files and merged again. Of several
+    strings with the same key only the last one is kept, like parse_file
+    does.
+
+    Examples:
+
+        >>> strings = [LocalizedString(key, str(number))
+        ...            for number, key in enumerate('dbcab')]
+        >>> [(s.key, s.value) for s in external_sort(strings, run_size=2)]
+        [('a', '3'), ('b', '4'), ('c', '2'), ('d', '0')]
+    '''
+    import heapq
+    import marshal
+    import tempfile
+    runs = []
+    batch = []
+    try:
+        # The position in the file keeps equal keys in file order
+        for position, string in enumerate(strings):
+            batch.append((string.key, position, string.value, string.comment))
+            if len(batch) >= run_size:
+                batch.sort()
+                run = tempfile.TemporaryFile()
+                for entry in batch:
+                    marshal.dump(entry, run)
+                run.seek(0)
+                runs.append(run)
+                batch = []
+        batch.sort()
+
+        def read_run(run):
+            while True:
+                try:
+                    yield marshal.load(run)
+                except EOFError:
+                    return
+
+        entries = heapq.merge(iter(batch), *[read_run(run) for run in runs])
+        merged = (LocalizedString(key, value, comment)
+                  for key, position, value, comment in entries)
+        for string in check_sorted(merged):
+            yield string
+    finally:
+        for run in runs:
+            run.close()
+
+
+def iter_sorted_strings(file_path, presorted=True, run_size=RUN_SIZE, parser='line'):
+    '''Streams the strings of a file sorted by key, with only one entry per
+    key. Files written by write_file are sorted already and are checked
+    while they are read, any other file has to be sorted with
+    external_sort. A missing file has no strings.
+
+    Keyword Arguments
+
+        presorted
+            Expect the file to be sorted, raising UnsortedStringsError
+            otherwise
+
+        parser
+            one of ``PARSERS``, the file is read with its ``parse_chunks``
+    '''
+    if not os.path.exists(file_path):
+        return iter([])
+    strings = get_backend(PARSERS, parser)().parse_chunks(iter_file_chunks(file_path))
+    if presorted:
+        return check_sorted(strings, file_path)
+    return external_sort(strings, run_size)
+
+
+def merge_sorted_strings(old_strings, new_strings, keep_comment=False, replace_value=False,
+                         delta=None):
+    '''Merge-joins two streams of strings sorted by key with the semantics of
+    merge_strings and yields the merged strings sorted by key. The optional
+    delta ``dict`` is filled with the changed keys as they are merged, see
+    compute_delta.
+
+    Examples:
+
+        >>> old = [LocalizedString('key1', 'value1', 'comment1'),
+        ...        LocalizedString('key2', 'value2', 'comment2'),
+        ...        LocalizedString('key3', 'key3', 'comment3')]
+        >>> new = [LocalizedString('key1', 'key1', 'comment1'),
+        ...        LocalizedString('key3', 'value3', 'comment3'),
+        ...        LocalizedString('key4', 'key4', 'comment4')]
+        >>> delta = {}
+        >>> [(s.key, s.value) for s in merge_sorted_strings(old, new, delta=delta)]
+        [('key1', 'value1'), ('key3', 'value3'), ('key4', 'key4')]
+        >>> old_dict = dict((s.key, s) for s in old)
+        >>> merged = merge_strings(old_dict, dict((s.key, s) for s in new))
+        >>> delta == compute_delta(old_dict, merged)
+        True
+    '''
+    if delta is not None:
+        delta.update(compute_delta({}, {}))
+    old_strings = iter(old_strings)
+    new_strings = iter(new_strings)
+    old_string = next(old_strings, None)
+    for new_string in new_strings:
+        # Strings only in the old file have been removed
+        while old_string is not None and old_string.key < new_string.key:
+            if delta is not None:
+                delta['removed'].append(old_string.key)
+            old_string = next(old_strings, None)
+        if old_string is not None and old_string.key == new_string.key:
+            merged_string = merge_string(old_string, new_string, keep_comment, replace_value)
+            if delta is not None:
+                if merged_string.value != old_string.value:
+                    delta['value_changed'].append(merged_string.key)
+                if merged_string.comment != old_string.comment:
+                    delta['comment_changed'].append(merged_string.key)
+            yield merged_string
+            old_string = next(old_strings, None)
+        else:
+            if delta is not None:
+                delta['added'].append(new_string.key)
+            yield new_string
+    if delta is not None:
+        while old_string is not None:
+            delta['removed'].append(old_string.key)
+            old_string = next(old_strings, None)
+
+
+def encode_strings(strings, encoding='utf16', serializer=None):
+    '''Renders and encodes a stream of strings in pieces of RENDER_BATCH
+    entries. The result is the same as render_strings for the same strings
+    in the same order.
+
+    Examples
+
+        >>> strings = [LocalizedString('k', 'v', 'c')]
+        >>> b''.join(encode_strings(strings)) == render_strings({'k': strings[0]})
+        True
+    '''
+    import itertools
+    render = get_backend(SERIALIZERS, serializer or SERIALIZER).render
+    encoder = codecs.getincrementalencoder(encoding)()
+    strings = iter(strings)
+    while True:
+        batch = list(itertools.islice(strings, RENDER_BATCH))
+        if not batch:
+            break
+        yield encoder.encode(render(batch))
+
+
+def merge_files_streaming(new_file_path, old_file_path, keep_comment=False,
+                          replace_value=False, parser='line', run_size=RUN_SIZE, delta=None):
+    '''Merges two files like merge_files, but never holds more than a few
+    entries of a sorted file in memory. Both files are read as sorted
+    streams, merge-joined and written while they are read. A file that turns
+    out not to be sorted is sorted with external_sort, keeping no more than
+    run_size entries in memory, and the merge starts over.
+
+    The optional delta ``dict`` is filled with the changed keys, see
+    compute_delta.
+
+    Keyword Arguments
+
+        parser
+            Parser used for both files, one of ``PARSERS``
+
+    Returns
+
+        ``unchanged``, ``updated`` or ``created``, see write_data
+
+    Examples:
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> new_path = os.path.join(directory, 'New.strings')
+        >>> text = u'/* a */\\n"a" = "a";\\n"b" = "b";\\n/* c */\\n"c" = "c";\\n'
+        >>> write_data(new_path, text.encode('utf-16'))
+        'created'
+        >>> for parser in sorted(PARSERS):
+        ...     paths = [os.path.join(directory, '{}-{}.strings'.format(parser, way))
+        ...              for way in ('files', 'streaming')]
+        ...     for path in paths:
+        ...         status = write_data(path, u'/* b */\\n"b" = "old";\\n'.encode('utf-16'))
+        ...     status = merge_files(new_path, paths[0], parser=parser)
+        ...     status = merge_files_streaming(new_path, paths[1], parser=parser)
+        ...     data = [open(path, 'rb').read() for path in paths]
+        ...     print('{} {} {}'.format(parser, len(parse_file(paths[0], parser=parser)),
+        ...                             data[0] == data[1]))
+        lexer 3 True
+        line 2 True
+        >>> shutil.rmtree(directory)
+    '''
+    logging.debug('Streaming merge: {} into {}'.format(new_file_path, old_file_path))
+    unsorted = set()
+
+    def merge(expected):
+        while True:
+            try:
+                new_strings = iter_sorted_strings(new_file_path, new_file_path not in unsorted,
+                                                  run_size, parser)
+                old_strings = iter_sorted_strings(old_file_path, old_file_path not in unsorted,
+                                                  run_size, parser)
+                if delta is not None:
+                    delta.clear()
+                merged_strings = merge_sorted_strings(old_strings, new_strings, keep_comment,
+                                                      replace_value, delta)
+                with stats_phase('stream'):
+                    return write_chunks(old_file_path, encode_strings(merged_strings),
+                                        expected)
+            except UnsortedStringsError as error:
+                logging.debug('{}, sorting externally'.format(error))
+                count_stat('external_sorts')
+                unsorted.add(error.file_path)
+    return locked_merge(old_file_path, merge)
+
+
+def copy_strings(strings):
+    '''Returns a copy of a dictionary of LocalizedStrings that can be
+    modified without changing the original
+
+    Examples:
+
+        >>> strings = {'key1': LocalizedString('key1', 'value1', 'comment1')}
+        >>> copied = copy_strings(strings)
+        >>> copied['key1'].value = 'value2'
+        >>> strings['key1'].value
+        'value1'
+    '''
+    return dict(
+        (key, LocalizedString(string.key, string.value, string.comment))
+        for key, string in strings.items()
+    )
+
+
+def table_size(tables):
+    '''Returns the memory in bytes taken by dictionaries of LocalizedStrings,
+    including the strings they hold. Objects shared between entries or
+    tables are counted once.
+
+    Examples:
+
+        >>> text = '/* Generated */\\n"k1" = "v1";\\n/* Generated */\\n"k2" = "k2";\\n'
+        >>> plain = [parse_text(text), parse_text(text)]
+        >>> pool = StringPool()
+        >>> pooled = [parse_text(text, pool=pool), parse_text(text, pool=pool)]
+        >>> table_size(pooled) < table_size(plain)
+        True
+    '''
+    seen = set()
+    objects = []
+    for table in tables:
+        objects.append(table)
+        for key, string in table.items():
+            objects.extend((key, string, string.key, string.value, string.comment))
+            # Instances of classes without __slots__
+            objects.append(getattr(string, '__dict__', None))
+    size = 0
+    for obj in objects:
+        if obj is not None and id(obj) not in seen:
+            seen.add(id(obj))
+            size += sys.getsizeof(obj)
+    return size
+
+
+def measure_memory(file_paths, parser='line'):
+    '''Parses all files into memory at once, like a whole project, and
+    measures the tables with and without a shared StringPool
+
+    Returns
+
+        ``dict`` with the number of ``files`` and ``entries``, the table
+        sizes in ``bytes`` and ``bytes_interned`` and the number of
+        ``interned`` strings
+    '''
+    plain = [parse_file(file_path, parser=parser) for file_path in file_paths]
+    plain_size = table_size(plain)
+    entries = sum(len(table) for table in plain)
+    del plain
+    pool = StringPool()
+    pooled = [parse_file(file_path, parser=parser, pool=pool) for file_path in file_paths]
+    return {
+        'files': len(file_paths),
+        'entries': entries,
+        'bytes': plain_size,
+        'bytes_interned': table_size(pooled),
+        'interned': len(pool),
+    }
+
+
+def merge_files(new_file_path, old_file_path, keep_comment=False, replace_value=False,
+                parser='line', cache=None, delta=None, pool=None):
+    '''Scans the Strings in both files, merges them together and writes the
+    result to the old file
+
+    Keyword Arguments
+
+        new_file_path
+            Path to the new generated strings file
+
+        old_file_path
+            Path to the existing strings file, it is created if it does not
+            exist yet
+
+        parser
+            Parser used for both files, one of ``PARSERS``
+
+        cache
+            Optional StringsFileCache or ParseCache the files are parsed
+            through. The merged result is stored in it after writing.
+
+        delta
+            Optional ``dict`` that is filled with the changed keys, see
+            compute_delta
+
+        pool
+            Optional StringPool both files are parsed with, see
+            parse_function
+
+    Returns
+
+        ``unchanged``, ``updated`` or ``created``, see write_data
+    '''
+    parse = parse_function(parser, cache, pool)
+    new_strings = parse(new_file_path)
+    return merge_parsed(new_strings, old_file_path, keep_comment, replace_value, parse, cache,
+                        delta)
+
+
+def merge_files_fanout(new_file_path, old_file_paths, keep_comment=False, replace_value=False,
+                       parser='line', cache=None, deltas=None, pool=None, errors=None):
+    '''Merges one new strings file into several old ones, like the copies of
+    a base language table in each ``<lang>.lproj`` folder. The new file is
+    parsed only once and its Strings are shared by all merges. All files
+    are parsed with one StringPool, a new one if pool is ``None``, so the
+    old tables share the key objects of the new one.
+
+    Keyword Arguments
+
+        old_file_paths
+            ``list`` of paths to the existing strings files, see merge_files
+
+        deltas
+            Optional ``list`` that gets one ``dict`` with the changed keys
+            per old file appended, see compute_delta
+
+        errors
+            Optional ``list`` that gets the error message of each old file
+            appended, ``None`` if it was merged. With errors an old file
+            that fails to merge does not stop the others and gets the
+            status ``failed``, without them the error is raised.
+
+    The other arguments are the same as for merge_files.
+
+    Returns
+
+        ``list`` with the status of each old file, see write_data
+
+    Examples:
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> paths = [os.path.join(directory, name) for name in ('new', 'de', 'fr')]
+        >>> write_file(paths[0], parse_text('/* c */\\n"a" = "a";\\n'))
+        'created'
+        >>> write_file(paths[1], parse_text('/* c */\\n"a" = "A";\\n'))
+        'created'
+        >>> merge_files_fanout(paths[0], paths[1:])
+        ['unchanged', 'created']
+        >>> [str(parse_file(path)['a'].value) for path in paths[1:]]
+        ['A', 'a']
+        >>> pool = StringPool()
+        >>> merge_files_fanout(paths[0], paths[1:], pool=pool)
+        ['unchanged', 'unchanged']
+        >>> len(pool)
+        2
+        >>> errors = []
+        >>> merge_files_fanout(paths[0], [directory, paths[1]], errors=errors)
+        ['failed', 'unchanged']
+        >>> errors[1] is None
+        True
+        >>> shutil.rmtree(directory)
+    '''
+    if pool is None:
+        pool = StringPool()
+    parse = parse_function(parser, cache, pool)
+    new_strings = parse(new_file_path)
+    statuses = []
+    for old_file_path in old_file_paths:
+        delta = None
+        if deltas is not None:
+            delta = {}
+            deltas.append(delta)
+        try:
+            statuses.append(merge_parsed(new_strings, old_file_path, keep_comment,
+                                         replace_value, parse, cache, delta))
+        except Exception as error:
+            if errors is None:
+                raise
+            logging.error('Failed to merge {}: {}'.format(old_file_path, error))
+            statuses.append('failed')
+            errors.append(str(error))
+            continue
+        if errors is not None:
+            errors.append(None)
+    return statuses
+
+
+def parse_function(parser='line', cache=None, pool=None):
+    '''Returns a function that parses a file path into a dictionary of
+    Strings, through the cache if there is one. The path ``-`` reads
+    standard input. Files that are parsed intern their strings in the
+    optional StringPool, tables from the cache are returned as they are.
+    '''
+    def parse(file_path):
+        if file_path == '-':
+            return parse_buffer(read_input(file_path), parser, pool)
+        if cache is not None:
+            return cache.parse(file_path)
+        return parse_file(file_path, parser=parser, pool=pool)
+    return parse
+
+
+def merge_parsed(new_strings, old_file_path, keep_comment=False, replace_value=False,
+                 parse=parse_file, cache=None, delta=None):
+    '''Merges already parsed new Strings into an old file and writes it, see
+    merge_files. The new Strings are not modified.
+    '''
+    logging.debug('Current File: {}'.format(old_file_path))
+
+    def merge(expected):
+        if expected is not None:
+            old_strings = parse(old_file_path)
+        else:
+            old_strings = {}
+        if delta is not None:
+            delta.clear()
+        final_strings = merge_tables(old_strings, new_strings, keep_comment, replace_value,
+                                     delta)
+        status = write_file(old_file_path, final_strings, expected=expected)
+        # Still under the lock, so the file is the one that was just written
+        if cache is not None:
+            cache.store(old_file_path, final_strings)
+        return status
+    status = locked_merge(old_file_path, merge)
+    logging.debug('{}: {}'.format(status.capitalize(), old_file_path))
+    return status
+
+
+def merge_tables(old_strings, new_strings, keep_comment=False, replace_value=False,
+                 delta=None):
+    '''Merges two dictionaries of Strings like merge_strings and fills the
+    optional delta ``dict`` with the changed keys, see compute_delta
+    '''
+    with stats_phase('merge'):
+        final_strings = merge_strings(old_strings, new_strings, keep_comment, replace_value)
+        if delta is not None:
+            delta.update(compute_delta(old_strings, final_strings))
+    return final_strings
+
+
+def merge_buffers(new_data, old_data=None, keep_comment=False, replace_value=False,
+                  parser='line', encoding='utf16', delta=None):
+    '''Merges strings files held in memory, without touching the file system
+
+    Keyword Arguments
+
+        new_data
+            Contents of the new generated strings file, encoded ``bytes``
+            or decoded text
+
+        old_data
+            Contents of the existing strings file like new_data, ``None``
+            if there is none
+
+        encoding
+            Encoding of the result
+
+    The other arguments are the same as for merge_files.
+
+    Returns
+
+        Encoded contents of the merged file
+
+    Examples:
+
+        >>> new = '/* c2 */\\n"k1" = "k1";\\n"k2" = "k2";\\n'.encode('utf-16')
+        >>> old = b'/* c1 */\\n"k1" = "v1";\\n'
+        >>> merged = merge_buffers(new, old, encoding='utf8', parser='lexer')
+        >>> merged == b'/* c2 */\\n"k1" = "v1";\\n\\n"k2" = "k2";\\n\\n'
+        True
+    '''
+    new_strings = parse_buffer(new_data, parser)
+    old_strings = {}
+    if old_data is not None:
+        old_strings = parse_buffer(old_data, parser)
+    final_strings = merge_tables(old_strings, new_strings, keep_comment, replace_value, delta)
+    return render_strings(final_strings, encoding)
+
+
+def merge_data(new_data, old_file_path, keep_comment=False, replace_value=False,
+               parser='line', delta=None):
+    '''Merges the contents of a new strings file into an old file like
+    merge_buffers and writes the result with write_data. The old file and
+    its folder are created if they do not exist.
+
+    Returns:    ``unchanged``, ``updated`` or ``created``
+    '''
+    directory = os.path.dirname(old_file_path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    def merge(expected):
+        old_data = None
+        if expected is not None:
+            old_data = read_input(old_file_path)
+        if delta is not None:
+            delta.clear()
+        data = merge_buffers(new_data, old_data, keep_comment, replace_value, parser,
+                             delta=delta)
+        return write_data(old_file_path, data, expected)
+    return locked_merge(old_file_path, merge)
+
+
+def locked_merge(old_file_path, merge, timeout=None):
+    '''Runs a merge into old_file_path while holding its FileLock, so that
+    merges of the same file in other processes wait for it. merge is called
+    with the file_signature of the old file before it is read and has to
+    pass it on to write_data or write_chunks. Should the file still change,
+    for example by a program that does not lock, the merge starts over up
+    to LOCK_RETRIES times.
+
+    Returns:    what merge returns
+
+    Examples:
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> path = os.path.join(directory, 'Main.strings')
+        >>> def merge(expected):
+        ...     if not os.path.exists(path):
+        ...         write_data(path, b'"other" = "other";\\n')
+        ...     return write_data(path, b'"a" = "a";\\n', expected)
+        >>> locked_merge(path, merge)
+        'updated'
+        >>> shutil.rmtree(directory)
+    '''
+    with FileLock(old_file_path, timeout):
+        for attempt in range(LOCK_RETRIES):
+            try:
+                return merge(file_signature(old_file_path))
+            except FileChangedError as error:
+                logging.debug('{}, merging again'.format(error))
+                count_stat('merge_retries')
+        return merge(file_signature(old_file_path))
+
+
+def find_old_files(new_file_path, old_paths):
+    '''Replaces the folders among old_paths by the tables named like the new
+    file in all ``.lproj`` folders below them, see KeyIndex.find_tables. The
+    new file itself is left out.
+
+    Returns:    ``list`` of paths
+
+    Examples:
+
+        >>> import shutil, tempfile
+        >>> root = tempfile.mkdtemp()
+        >>> for language in ('en', 'de'):
+        ...     os.mkdir(os.path.join(root, language + '.lproj'))
+        ...     for name in ('Main.strings', 'Other.strings'):
+        ...         status = write_data(os.path.join(root, language + '.lproj', name), b'')
+        >>> new_path = os.path.join(root, 'en.lproj', 'Main.strings')
+        >>> old_paths = find_old_files(new_path, [root, 'x'])
+        >>> os.path.relpath(old_paths[0], root), old_paths[1:]
+        ('de.lproj/Main.strings', ['x'])
+        >>> shutil.rmtree(root)
+    '''
+    name = os.path.basename(new_file_path)
+    new_file_path = os.path.realpath(new_file_path)
+    file_paths = []
+    for old_path in old_paths:
+        if not os.path.isdir(old_path):
+            file_paths.append(old_path)
+            continue
+        for path, table_name, language in KeyIndex.find_tables(old_path):
+            if os.path.basename(path) == name and os.path.realpath(path) != new_file_path:
+                file_paths.append(path)
+    return file_paths
+
+
+def check_merge(new_file_path, old_file_path, keep_comment=False, replace_value=False,
+                parser='line', cache=None, delta=None, new_data=None, new_strings=None,
+                pool=None):
+    '''Merges like merge_files, or like merge_data if new_data is given, but
+    only in memory, and tells what writing the result would do to the old
+    file. Nothing is written and no lock is taken. The Strings of the new
+    file can be given already parsed as new_strings, they are not modified.
+    Files are parsed with the optional StringPool.
+
+    Returns
+
+        ``unchanged``, ``updated`` or ``created``, see write_data
+
+    Examples:
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> new_path = os.path.join(directory, 'new')
+        >>> old_path = os.path.join(directory, 'old')
+        >>> write_file(new_path, parse_text('/* c */\\n"a" = "a";\\n/* c */\\n"b" = "b";\\n'))
+        'created'
+        >>> write_file(old_path, parse_text('/* c */\\n"a" = "A";\\n'))
+        'created'
+        >>> delta = {}
+        >>> check_merge(new_path, old_path, delta=delta), delta['added'] == ['b']
+        ('updated', True)
+        >>> len(parse_file(old_path))
+        1
+        >>> shutil.rmtree(directory)
+    '''
+    parse = parse_function(parser, cache, pool)
+    if new_strings is None and new_data is None:
+        new_strings = parse(new_file_path)
+    elif new_strings is None:
+        new_strings = parse_buffer(new_data, parser, pool)
+    old_strings = {}
+    if os.path.exists(old_file_path):
+        old_strings = parse(old_file_path)
+    final_strings = merge_tables(old_strings, new_strings, keep_comment, replace_value, delta)
+    return compare_data(old_file_path, render_strings(final_strings))
+
+
+def parse_buffer(data, parser='line', pool=None):
+    '''Parses the contents of a strings file, decoding them first if they
+    are ``bytes``, see decode_data, and interning keys and comments in the
+    optional StringPool
+
+    Returns:    ``dict``
+    '''
+    if isinstance(data, bytes):
+        data = decode_data(data)
+    return parse_text(data, parser, pool)
+
+
+def read_input(file_path):
+    '''Returns the raw contents of a file, or of standard input if the path
+    is ``-``
+    '''
+    if file_path == '-':
+        return getattr(sys.stdin, 'buffer', sys.stdin).read()
+    with open(file_path, 'rb') as input_file:
+        return input_file.read()
+
+
+def write_output(file_path, data):
+    '''Writes data to a file like write_data, or to standard output if the
+    path is ``-``
+
+    Returns:    ``unchanged``, ``updated``, ``created`` or ``written``
+    '''
+    if file_path == '-':
+        stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+        stdout.write(data)
+        stdout.flush()
+        return 'written'
+    return write_data(file_path, data)
+
+
+def unescape_string(text):
+    '''Replaces the escape sequences of a key or value in a strings file by
+    the characters they stand for
+
+    Examples:
+
+        >>> unescape_string(r'Say \\"hi\\"\\n\\\\') == 'Say "hi"\\n\\\\'
+        True
+        >>> unescape_string(r'\\U00e4\\101') == u'\\xe4A'
+        True
+    '''
+    if '\\' not in text:
+        return text
+    return ESCAPE_EXPR.sub(replace_escape, text)
+
+
+def replace_escape(match):
+    hexadecimal, octal, character = match.groups()
+    if hexadecimal is not None:
+        return (b'\\u' + hexadecimal.encode('ascii')).decode('unicode-escape')
+    if octal is not None:
+        return (b'\\' + octal.encode('ascii')).decode('unicode-escape')
+    return ESCAPES.get(character, character)
+
+
+def compile_strings(strings, compile_format='binary'):
+    '''Compiles a table for shipping, without comments
+
+    Keyword Arguments
+
+        strings
+            Dictionary with the Strings
+
+        compile_format
+            ``binary`` for a binary property list, ``utf8`` for compact
+            UTF-8 text, see COMPILE_FORMATS
+
+    Returns
+
+        Encoded contents of the compiled file
+
+    Examples:
+
+        >>> strings = parse_text('/* c */\\n"k" = "v";\\n')
+        >>> compile_strings(strings, 'utf8') == b'"k" = "v";\\n'
+        True
+        >>> compile_strings(strings)[:8] == b'bplist00'
+        True
+    '''
+    if compile_format == 'utf8':
+        text = ''.join([u'"{}" = "{}";\n'.format(string.key, string.value)
+                        for string in sort_strings(strings)])
+        return text.encode('utf-8')
+    if compile_format == 'binary':
+        return write_binary_plist(dict(
+            (unescape_string(string.key), unescape_string(string.value))
+            for string in strings.values()
+        ))
+    raise ValueError('Unknown compile format {}'.format(compile_format))
+
+
+def decompile_strings(data, compile_format='binary'):
+    '''Reads a file written by compile_strings back. Compact UTF-8 text has
+    no comments, so it is read with the lexer, which reads entries without
+    a leading comment.
+
+    Returns
+
+        ``dict`` of keys to values, unescaped for binary property lists
+
+    Examples:
+
+        >>> strings = parse_text('/* c */\\n"k\\\\"" = "v\\\\n";\\n')
+        >>> decompile_strings(compile_strings(strings)) == {u'k"': u'v\\n'}
+        True
+        >>> strings = parse_text('/* c */\\n"k" = "say "hi"";\\n/* d */\\n"l" = "v";\\n')
+        >>> decompile_strings(compile_strings(strings, 'utf8'), 'utf8') == {
+        ...     u'k': u'say "hi"', u'l': u'v'}
+        True
+    '''
+    if compile_format == 'utf8':
+        return dict((key, string.value)
+                    for key, string in parse_text(data.decode('utf-8'), 'lexer').items())
+    return read_binary_plist(data)
+
+
+def verify_compiled(strings, data, compile_format='binary'):
+    '''Checks that a compiled file holds exactly the keys and values of the
+    table it was compiled from and raises ``ValueError`` if it does not
+    '''
+    expected = dict((key, string.value) for key, string in strings.items())
+    if compile_format == 'binary':
+        expected = dict((unescape_string(key), unescape_string(value))
+                        for key, value in expected.items())
+    compiled = decompile_strings(data, compile_format)
+    if not compiled == expected:
+        different = set(compiled.items()) ^ set(expected.items())
+        raise ValueError('Compiled table differs in {} keys, for example {!r}'.format(
+            len(set(key for key, value in different)), min(different)[0]
+        ))
+
+
+def compile_file(source_path, compiled_path, compile_format='binary', parser='line'):
+    '''Compiles a strings file for shipping and verifies that the compiled
+    file reads back as the parsed source, see compile_strings. The source
+    file stays as it is.
+
+    Returns
+
+        ``unchanged``, ``updated``, ``created`` or ``written``, see
+        write_output
+    '''
+    logging.debug('Compiling {}'.format(source_path))
+    return compile_table(parse_file(source_path, parser=parser), compiled_path, compile_format)
+
+
+def compile_table(strings, compiled_path, compile_format='binary'):
+    '''Compiles a parsed table to a file like compile_file
+
+    Returns
+
+        ``unchanged``, ``updated``, ``created`` or ``written``, see
+        write_output
+    '''
+    with stats_phase('compile'):
+        data = compile_strings(strings, compile_format)
+        verify_compiled(strings, data, compile_format)
+    logging.debug('Compiled {} entries to {}'.format(len(strings), compiled_path))
+    return write_output(compiled_path, data)
+
+
+def write_binary_plist(table):
+    '''Encodes a dictionary of strings as a binary property list, the format
+    the Xcode build compiles strings files into. Equal strings are stored
+    once.
+
+    Examples:
+
+        >>> data = write_binary_plist({'k': 'v', u'\\xe4': 'v'})
+        >>> read_binary_plist(data) == {'k': 'v', u'\\xe4': 'v'}
+        True
+    '''
+    import struct
+    keys = sorted(table)
+    # Object 0 is the dictionary, then every distinct string once
+    references = {}
+    strings = []
+    for text in keys + [table[key] for key in keys]:
+        if text not in references:
+            references[text] = len(strings) + 1
+            strings.append(text)
+    count = len(strings) + 1
+    reference_size = int_size(count)
+    reference_format = INT_FORMATS[reference_size]
+
+    def marker(kind, length):
+        if length < 15:
+            return struct.pack('>B', kind << 4 | length)
+        return struct.pack('>BBQ', kind << 4 | 15, 0x13, length)
+
+    objects = [marker(0xD, len(keys)) + b''.join(
+        struct.pack(reference_format, references[text])
+        for text in keys + [table[key] for key in keys]
+    )]
+    for text in strings:
+        try:
+            encoded = text.encode('ascii')
+            objects.append(marker(0x5, len(encoded)) + encoded)
+        except UnicodeError:
+            encoded = text.encode('utf-16-be')
+            objects.append(marker(0x6, len(encoded) // 2) + encoded)
+
+    offsets = []
+    position = len(BPLIST_HEADER)
+    for encoded in objects:
+        offsets.append(position)
+        position += len(encoded)
+    offset_size = int_size(position)
+    offset_format = INT_FORMATS[offset_size]
+    trailer = struct.pack('>6xBBQQQ', offset_size, reference_size, count, 0, position)
+    return b''.join([BPLIST_HEADER] + objects +
+                    [struct.pack(offset_format, offset) for offset in offsets] + [trailer])
+
+
+def int_size(limit):
+    '''Returns the number of bytes a binary property list needs for
+    integers below limit
+    '''
+    for size in (1, 2, 4):
+        if limit < 1 << 8 * size:
+            return size
+    return 8
+
+
+def read_binary_plist(data):
+    '''Decodes a binary property list of a dictionary of strings as written
+    by write_binary_plist. Other objects raise ``ValueError``.
+    '''
+    import struct
+    if data[:len(BPLIST_HEADER)] != BPLIST_HEADER or len(data) < 40:
+        raise ValueError('Not a binary property list')
+    offset_size, reference_size, count, top, table_offset = struct.unpack(
+        '>6xBBQQQ', data[-32:])
+
+    def read_int(start, size):
+        return struct.unpack(INT_FORMATS[size], data[start:start + size])[0]
+
+    offsets = [read_int(table_offset + index * offset_size, offset_size)
+               for index in range(count)]
+
+    def read_object(reference):
+        start = offsets[reference]
+        marker = struct.unpack('>B', data[start:start + 1])[0]
+        kind = marker >> 4
+        length = marker & 15
+        start += 1
+        if length == 15:
+            size = 1 << (struct.unpack('>B', data[start:start + 1])[0] & 15)
+            length = read_int(start + 1, size)
+            start += 1 + size
+        if kind == 0x5:
+            return data[start:start + length].decode('ascii')
+        if kind == 0x6:
+            return data[start:start + 2 * length].decode('utf-16-be')
+        if kind == 0xD:
+            references = [read_int(start + index * reference_size, reference_size)
+                          for index in range(2 * length)]
+            return dict(zip([read_object(key) for key in references[:length]],
+                            [read_object(value) for value in references[length:]]))
+        raise ValueError('Unsupported binary property list object {:#x}'.format(marker))
+
+    table = read_object(top)
+    if not isinstance(table, dict):
+        raise ValueError('Binary property list does not hold a dictionary')
+    return table
+
+
+def parse_manifest(text, **defaults):
+    '''Parses a manifest of merge jobs. The manifest is either a JSON list
+    of jobs or has one JSON job per line. Each job needs ``new_path`` and
+    ``old_path``, the flags in JOB_FLAGS are optional and default to the
+    given keyword arguments or to JOB_FLAGS.
+
+    Keyword Arguments
+
+        text
+            Contents of the manifest
+
+    Returns
+
+        ``list`` of job dictionaries
+
+    Examples:
+
+        >>> jobs = parse_manifest('[{"new_path": "n", "old_path": "o"}]')
+        >>> jobs[0]['new_path'] == 'n', jobs[0]['keep_comment']
+        (True, False)
+
+        >>> job1 = '{"new_path": "n1", "old_path": "o1"}'
+        >>> job2 = '{"new_path": "n2", "old_path": "o2", "replace_value": true}'
+        >>> [j['replace_value'] for j in parse_manifest(job1 + '\\n\\n' + job2)]
+        [False, True]
+        >>> [j['replace_value'] for j in parse_manifest(job1, replace_value=True)]
+        [True]
+
+        >>> parse_manifest('[{"new_path": "n"}]')
+        Traceback (most recent call last):
+        ...
+        ValueError: Manifest job 1 has no old_path
+    '''
+    import json
+    try:
+        entries = json.loads(text)
+        if isinstance(entries, dict):
+            entries = [entries]
+    except ValueError:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+
+    return [
+        make_job(entry, number, **defaults)
+        for number, entry in enumerate(entries, 1)
+    ]
+
+
+def make_job(entry, number=1, **defaults):
+    '''Validates a single manifest entry and fills in the flags it does not
+    set from the keyword arguments or JOB_FLAGS
+
+    Returns
+
+        job ``dict``
+    '''
+    for path in ('new_path', 'old_path'):
+        if not entry.get(path):
+            raise ValueError('Manifest job {} has no {}'.format(number, path))
+    job = {
+        'new_path': entry['new_path'],
+        'old_path': entry['old_path'],
+    }
+    for flag, default in JOB_FLAGS.items():
+        job[flag] = bool(entry.get(flag, defaults.get(flag, default)))
+    return job
+
+
+def read_manifest(manifest_path, **defaults):
+    '''Reads a manifest file of merge jobs, see parse_manifest
+    '''
+    with codecs.open(manifest_path, mode='r', encoding='utf8') as manifest:
+        return parse_manifest(manifest.read(), **defaults)
+
+
+def merge_job(job, parser='line', cache=None, pool=None):
+    '''Runs a single manifest job and returns its result. Errors are
+    recorded in the result instead of being raised. Jobs with ``new_data``
+    merge those contents instead of reading ``new_path``. Jobs with the
+    ``check`` flag only find out whether the merge would change the old
+    file, see check_merge. Files are parsed with the optional StringPool.
+
+    Returns
+
+        ``dict`` with ``new_path``, ``old_path``, ``status`` (``merged``,
+        ``checked`` or ``failed``), ``error``, ``write``, what happened or
+        would happen to the old file (see write_data) and for jobs with the
+        ``delta`` or ``check`` flag ``delta``, the changed keys (see
+        compute_delta)
+    '''
+    result = {
+        'new_path': job['new_path'],
+        'old_path': job['old_path'],
+        'status': 'merged',
+        'error': None,
+        'write': None,
+    }
+    delta = None
+    if job['delta'] or job['check']:
+        delta = result['delta'] = {}
+    try:
+        if job['check']:
+            result['write'] = check_merge(
+                job['new_path'], job['old_path'], job['keep_comment'], job['replace_value'],
+                parser, cache, delta, job.get('new_data'), job.get('new_strings'), pool
+            )
+            result['status'] = 'checked'
+        elif job['streaming']:
+            result['write'] = merge_files_streaming(
+                job['new_path'], job['old_path'], job['keep_comment'], job['replace_value'],
+                parser, delta=delta
+            )
+        elif 'new_data' in job:
+            result['write'] = merge_data(
+                job['new_data'], job['old_path'], job['keep_comment'], job['replace_value'],
+                parser, delta
+            )
+        else:
+            result['write'] = merge_files(
+                job['new_path'], job['old_path'], job['keep_comment'], job['replace_value'],
+                parser, cache, delta, pool
+            )
+    except Exception as error:
+        logging.error('Failed to merge {}: {}'.format(job['old_path'], error))
+        result['status'] = 'failed'
+        result['error'] = str(error)
+    return result
+
+
+def group_jobs(jobs):
+    '''Groups the jobs by the file they write to. Jobs writing to the same
+    file depend on each other and have to run one after another, the groups
+    are independent. Both the groups and the jobs keep the manifest order.
+
+    Returns
+
+        ``list`` of groups, each a ``list`` of (index, job) tuples
+
+    Examples:
+
+        >>> jobs = [{'old_path': 'a'}, {'old_path': 'b'}, {'old_path': 'a'}]
+        >>> [[index for index, job in group] for group in group_jobs(jobs)]
+        [[0, 2], [1]]
+    '''
+    groups = []
+    groups_by_path = {}
+    for index, job in enumerate(jobs):
+        path = os.path.abspath(job['old_path'])
+        if path not in groups_by_path:
+            groups_by_path[path] = []
+            groups.append(groups_by_path[path])
+        groups_by_path[path].append((index, job))
+    return groups
+
+
+def merge_job_group(arguments):
+    '''Runs a group of jobs from group_jobs in a worker process
+
+    Keyword Arguments
+
+        arguments
+            ``tuple`` of the group, the parser name and the ParseCache or
+            ``None``
+
+    Returns
+
+        ``list`` of (index, result) tuples
+    '''
+    group, parser, cache = arguments
+    pool = StringPool()
+    return [(index, merge_job(job, parser, cache, pool)) for index, job in group]
+
+
+def merge_batch(jobs, parser='line', processes=1, cache=None):
+    '''Runs all merge jobs, one after another or spread over a pool of
+    worker processes. A failing job does not stop the others. Jobs that
+    run one after another, all of them or those of one group in a worker,
+    parse their files with one StringPool, so the tables of all languages
+    share their keys.
+
+    Keyword Arguments
+
+        jobs
+            ``list`` of job dictionaries as returned by parse_manifest
+
+        processes
+            Number of worker processes, ``None`` or 0 uses one per CPU
+
+        cache
+            Optional ParseCache for all jobs
+
+    Returns
+
+        ``list`` with one result per job in the order of the jobs, see
+        merge_job
+    '''
+    import multiprocessing
+    if not processes:
+        processes = multiprocessing.cpu_count()
+    groups = group_jobs(jobs)
+    processes = min(processes, len(groups))
+    if processes <= 1:
+        pool = StringPool()
+        return [merge_job(job, parser, cache, pool) for job in jobs]
+
+    logging.debug('Merging {} files in {} processes'.format(len(jobs), processes))
+    return run_job_groups(merge_job_group, groups, len(jobs), parser, processes, cache)
+
+
+def run_job_groups(function, groups, count, parser='line', processes=1, cache=None):
+    '''Runs function, merge_job_group or check_job_group, on every group of
+    jobs in a pool of worker processes
+
+    Returns:    ``list`` with the results of the count jobs by index
+    '''
+    import multiprocessing
+    results = [None] * count
+    pool = multiprocessing.Pool(processes)
+    try:
+        arguments = [(group, parser, cache) for group in groups]
+        for group_results in pool.imap_unordered(function, arguments):
+            for index, result in group_results:
+                results[index] = result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def check_job_group(arguments):
+    '''Runs a group of check jobs in a worker process like merge_job_group.
+    Jobs in a row that check the same new file share its parsed Strings,
+    all files of the group are parsed with one StringPool.
+    '''
+    group, parser, cache = arguments
+    pool = StringPool()
+    parse = parse_function(parser, cache, pool)
+    results = []
+    new_path = new_strings = None
+    for index, job in group:
+        if job['new_path'] != new_path:
+            new_path = job['new_path']
+            try:
+                if 'new_data' in job:
+                    new_strings = parse_buffer(job['new_data'], parser, pool)
+                else:
+                    new_strings = parse(new_path)
+            except Exception:
+                # Reported by merge_job
+                new_path = new_strings = None
+        # Checks never write, whatever the job says
+        job = dict(job, check=True)
+        if new_strings is not None:
+            job['new_strings'] = new_strings
+        results.append((index, merge_job(job, parser, cache, pool)))
+    return results
+
+
+def check_batch(jobs, parser='line', processes=1, cache=None):
+    '''Runs check jobs like merge_batch. Nothing is written, so instead of
+    grouping the jobs by old file they are split into one slice of
+    consecutive jobs per worker, and each worker parses the new files of
+    its slice only once. Every job is checked, also those whose ``check``
+    flag is off.
+
+    Returns:    ``list`` with one result per job, see merge_job
+
+    Examples:
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> new_path = os.path.join(directory, 'new.strings')
+        >>> old_path = os.path.join(directory, 'old.strings')
+        >>> write_file(new_path, parse_text('/* c */\\n"a" = "a";\\n'))
+        'created'
+        >>> write_file(old_path, parse_text('/* c */\\n"b" = "b";\\n'))
+        'created'
+        >>> before = read_input(old_path)
+        >>> manifest = '{{"new_path": "{}", "old_path": "{}", "check": false}}'
+        >>> jobs = parse_manifest(manifest.format(new_path, old_path), check=True)
+        >>> [(str(result['status']), str(result['write'])) for result in check_batch(jobs)]
+        [('checked', 'updated')]
+        >>> read_input(old_path) == before
+        True
+        >>> shutil.rmtree(directory)
+    '''
+    import multiprocessing
+    if not processes:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(jobs)))
+    indexed = list(enumerate(jobs))
+    groups = [indexed[number * len(jobs) // processes:(number + 1) * len(jobs) // processes]
+              for number in range(processes)]
+    if processes == 1:
+        return [result for index, result in check_job_group((indexed, parser, cache))]
+    logging.debug('Checking {} files in {} processes'.format(len(jobs), processes))
+    return run_job_groups(check_job_group, groups, len(jobs), parser, processes, cache)
+
+
+def iter_archive(archive_path):
+    '''Generates the name and contents of every strings file in a zip or tar
+    archive, compressed or not. Members are read one after another straight
+    from the archive, nothing is extracted to disk.
+
+    Returns
+
+        generator of (member name, ``bytes``) tuples
+    '''
+    import zipfile
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for member in archive.infolist():
+                if member.filename.endswith('.strings'):
+                    yield member.filename, archive.read(member)
+        return
+    import tarfile
+    # Stream mode reads the archive sequentially, compressed or not
+    archive = tarfile.open(archive_path, 'r|*')
+    try:
+        for member in archive:
+            if member.isfile() and member.name.endswith('.strings'):
+                yield member.name, archive.extractfile(member).read()
+    finally:
+        archive.close()
+
+
+def archive_target(member_name, root='.'):
+    '''Maps the name of an archive member to the strings file it is merged
+    into, ``<root>/<language>.lproj/<table>.strings``. The language is taken
+    from a ``<language>.lproj`` folder or else the folder the member is in.
+
+    Returns
+
+        path of the target file or ``None`` if the member has no language
+
+    Examples:
+
+        >>> archive_target('de.lproj/Main.strings', 'App')
+        'App/de.lproj/Main.strings'
+        >>> archive_target('export/zh-Hans/Main.strings', 'App')
+        'App/zh-Hans.lproj/Main.strings'
+        >>> archive_target('Main.strings', 'App')
+        >>> archive_target('../Main.strings', 'App')
+    '''
+    parts = [part for part in member_name.replace('\\', '/').split('/') if part]
+    if len(parts) < 2:
+        return None
+    language = parts[-2]
+    for part in parts[:-1]:
+        if part.endswith('.lproj'):
+            language = part
+    if language.endswith('.lproj'):
+        language = language[:-len('.lproj')]
+    if not LANGUAGE_EXPR.match(language):
+        return None
+    return os.path.join(root, language + '.lproj', parts[-1])
+
+
+def read_archive_jobs(archive_path, root='.', **defaults):
+    '''Reads the strings files of a downloaded translation archive into merge
+    jobs for merge_batch, with ``replace_value`` semantics unless
+    overridden. Each job holds the contents of its member as ``new_data``.
+
+    Returns
+
+        (jobs, results) ``tuple``, results holding a failed result for every
+        member that could not be mapped to a language, see archive_target
+    '''
+    defaults.setdefault('replace_value', True)
+    jobs = []
+    failures = []
+    for name, data in iter_archive(archive_path):
+        new_path = '{}:{}'.format(archive_path, name)
+        target = archive_target(name, root)
+        if target is None:
+            logging.error('Cannot tell the language of {}'.format(new_path))
+            failures.append({
+                'new_path': new_path,
+                'old_path': None,
+                'status': 'failed',
+                'error': 'No language folder',
+                'write': None,
+            })
+            continue
+        job = make_job({'new_path': new_path, 'old_path': target}, len(jobs) + 1, **defaults)
+        job['new_data'] = data
+        jobs.append(job)
+    return jobs, failures
+
+
+def ingest_archive(archive_path, root='.', parser='line', processes=1, **defaults):
+    '''Merges every strings file of a downloaded translation archive into the
+    matching ``<language>.lproj`` folder below root, see read_archive_jobs.
+    Missing folders and files are created. The languages are merged in
+    parallel with processes workers, like merge_batch.
+
+    Returns
+
+        ``list`` with one result per member, see merge_job
+
+    Examples:
+
+        >>> import shutil, tempfile, zipfile
+        >>> root = tempfile.mkdtemp()
+        >>> os.mkdir(os.path.join(root, 'de.lproj'))
+        >>> path = os.path.join(root, 'de.lproj', 'Main.strings')
+        >>> write_file(path, parse_text('/* c */\\n"k" = "old";\\n"x" = "x";\\n'))
+        'created'
+        >>> archive_path = os.path.join(root, 'translations.zip')
+        >>> with zipfile.ZipFile(archive_path, 'w') as archive:
+        ...     archive.writestr('de/Main.strings', '/* c */\\n"k" = "neu";\\n'.encode('utf-16'))
+        ...     archive.writestr('fr.lproj/Main.strings', b'/* c */\\n"k" = "nouveau";\\n')
+        >>> results = ingest_archive(archive_path, root)
+        >>> [(os.path.relpath(r['old_path'], root), r['write']) for r in results]
+        [('de.lproj/Main.strings', 'updated'), ('fr.lproj/Main.strings', 'created')]
+        >>> [str(string.value) for string in parse_file(path).values()]
+        ['neu']
+        >>> shutil.rmtree(root)
+    '''
+    jobs, failures = read_archive_jobs(archive_path, root, **defaults)
+    logging.debug('Ingesting {} files from {}'.format(len(jobs), archive_path))
+    return merge_batch(jobs, parser, processes) + failures
+
+
+def summarize(results):
+    '''Counts the results of merge jobs by what happened to the old files
+
+    Returns
+
+        ``dict`` with the number of ``unchanged``, ``updated``, ``created``
+        and ``failed`` files
+
+    Examples:
+
+        >>> summary = summarize([{'status': 'merged', 'write': 'unchanged'},
+        ...                      {'status': 'checked', 'write': 'updated'},
+        ...                      {'status': 'failed', 'write': None}])
+        >>> summary['unchanged'], summary['updated'], summary['failed']
+        (1, 1, 1)
+    '''
+    summary = {'unchanged': 0, 'updated': 0, 'created': 0, 'failed': 0}
+    for result in results:
+        if result['status'] in ('merged', 'checked'):
+            summary[result['write']] += 1
+        else:
+            summary['failed'] += 1
+    return summary
+
+
+def log_summary(results):
+    '''Logs the counts of summarize'''
+    logging.info('{unchanged} unchanged, {updated} updated, {created} created, '
+                 '{failed} failed'.format(**summarize(results)))
+
+
+def report_results(results, delta_path=None):
+    '''Prints merge results as JSON lines, writes their deltas to delta_path
+    if given and logs the summary
+
+    Returns:    exit status, 1 if any merge failed
+    '''
+    import json
+    if delta_path:
+        write_deltas(delta_path, results)
+    for result in results:
+        result = dict((key, value) for key, value in result.items() if key != 'delta')
+        sys.stdout.write(json.dumps(result, sort_keys=True) + '\n')
+    log_summary(results)
+    failed = [result for result in results if result['status'] != 'merged']
+    return failed and 1 or 0
+
+
+def report_check(results, delta_path=None):
+    '''Prints a JSON line for every file a check found out of date, with
+    the keys that would change, and for every failed check. The deltas are
+    written to delta_path if given, see write_deltas.
+
+    Returns:    exit status, 1 if any file is out of date or failed
+    '''
+    import json
+    if delta_path:
+        write_deltas(delta_path, results)
+    outdated = failed = 0
+    for result in results:
+        if result['status'] != 'checked':
+            failed += 1
+        elif result['write'] != 'unchanged':
+            outdated += 1
+        else:
+            continue
+        entry = {'new_path': result['new_path'], 'old_path': result['old_path'],
+                 'write': result['write'], 'error': result['error']}
+        for change, keys in (result.get('delta') or {}).items():
+            if keys:
+                entry[change] = keys
+        sys.stdout.write(json.dumps(entry, sort_keys=True) + '\n')
+    logging.info('{} of {} files out of date, {} failed'.format(outdated, len(results), failed))
+    return (outdated or failed) and 1 or 0
+
+
+def write_deltas(file_path, results):
+    '''Writes the deltas of merge results as a JSON list with one object per
+    merged file, holding ``new_path``, ``old_path`` and the lists of
+    compute_delta. Failed merges are left out.
+    '''
+    import json
+    deltas = []
+    for result in results:
+        if (result.get('delta') is None or
+                result.get('status', 'merged') not in ('merged', 'checked')):
+            continue
+        entry = {'new_path': result['new_path'], 'old_path': result['old_path']}
+        entry.update(result['delta'])
+        deltas.append(entry)
+    with codecs.open(file_path, 'w', 'utf8') as output:
+        output.write(json.dumps(deltas, sort_keys=True, indent=2, ensure_ascii=False))
+
+
+def lookup_keys(file_paths, keys, index_directory=None, parser='line'):
+    '''Prints key, value and comment of the given keys in each file as JSON
+    lines, reading only those entries with the parser, see LazyStringsTable
+
+    Returns:    exit code, 1 if a key is missing in a file
+    '''
+    import json
+    status = 0
+    for file_path in file_paths:
+        with LazyStringsTable(file_path, index_directory, parser) as table:
+            for key in keys:
+                localized_string = table.get(key)
+                if localized_string is None:
+                    logging.error('No key {} in {}'.format(key, file_path))
+                    status = 1
+                    continue
+                sys.stdout.write(json.dumps({
+                    'path': file_path,
+                    'key': localized_string.key,
+                    'value': localized_string.value,
+                    'comment': localized_string.comment,
+                }, sort_keys=True) + '\n')
+    return status
+
+
+def query_index(database_path, root, query=None, base_language='en', parser='line'):
+    '''Updates the KeyIndex of the tables below root and prints the rows of
+    a query as JSON lines, see INDEX_QUERIES
+    '''
+    import json
+    index = KeyIndex(database_path, parser)
+    try:
+        counts = index.update(root)
+        logging.debug('Index: {indexed} indexed, {unchanged} unchanged, {removed} removed'.format(
+            **counts))
+        if query == 'raw':
+            rows = index.raw_keys()
+        elif query is not None:
+            rows = getattr(index, INDEX_QUERIES[query])(base_language)
+        else:
+            rows = []
+        for row in rows:
+            sys.stdout.write(json.dumps(row, sort_keys=True) + '\n')
+    finally:
+        index.close()
+    return 0
+
+
+# -- Validation ----------------------------------------------------------------
+
+
+def placeholder_signature(text):
+    '''Returns the format specifiers of a value as a sorted ``tuple`` of
+    (argument position, type) pairs. Positional specifiers like ``%2$@``
+    count by their position, so translations may reorder the arguments.
+
+    Examples:
+
+        >>> placeholder_signature('%@ has %d new, %%')
+        ((1, '@'), (2, 'd'))
+        >>> placeholder_signature('%2$d new for %1$@') == placeholder_signature('%@ %d')
+        True
+        >>> placeholder_signature('%.2f of %ld, 50 % off')
+        ((1, 'f'), (2, 'ld'))
+    '''
+    if '%' not in text:
+        return ()
+    arguments = []
+    position = 0
+    for match in PLACEHOLDER_EXPR.finditer(text):
+        conversion = match.group('conversion')
+        if conversion == '%':
+            continue
+        if match.group('position'):
+            index = int(match.group('position'))
+        else:
+            position += 1
+            index = position
+        arguments.append((index, (match.group('length') or '') + conversion))
+    return tuple(sorted(arguments))
+
+
+def describe_signature(signature):
+    '''Formats a placeholder_signature for messages
+
+    Examples:
+
+        >>> describe_signature(((1, '@'), (2, 'd')))
+        '%1$@ %2$d'
+        >>> describe_signature(())
+        'none'
+    '''
+    return ' '.join('%{}${}'.format(*argument) for argument in signature) or 'none'
+
+
+def broken_escapes(text):
+    '''Returns the escape sequences of a key or value that strings files do
+    not allow, like a backslash before an arbitrary character or at the end
+
+    Examples:
+
+        >>> broken_escapes(r'Say \\"hi\\"\\n\\U00e4\\\\')
+        []
+        >>> broken_escapes(r'C:\\path\\U00')
+        ['\\\\p', '\\\\U']
+    '''
+    if '\\' not in text:
+        return []
+    return [match.group(0) for match in STRING_ESCAPE_EXPR.finditer(text)
+            if match.group('broken') is not None]
+
+
+def validate_strings(strings, duplicates=(), base_strings=None, signatures=None):
+    '''Checks one table for the problems in VALIDATION_CHECKS
+
+    Keyword Arguments
+
+        strings
+            Dictionary with the Strings
+
+        duplicates
+            keys found more than once while parsing, see parse_text
+
+        base_strings
+            table of the base language, ``None`` to check the base table
+            itself. Placeholders are only compared and empty values are
+            only reported where the base value is not empty.
+
+        signatures
+            placeholder_signature of every base value by key, computed once
+            for all languages
+
+    Returns
+
+        generator of (key, check, detail) tuples
+
+    Examples:
+
+        >>> base = parse_text('"a" = "%@ has %d";\\n"b" = "B";\\n"c" = "C";\\n', 'lexer')
+        >>> signatures = dict((k, placeholder_signature(s.value)) for k, s in base.items())
+        >>> duplicates = []
+        >>> text = '"a" = "%d hat %@";\\n"b" = "";\\n"c" = "\\\\q";\\n"c" = "%@";\\n'
+        >>> german = parse_text(text, 'lexer', duplicates=duplicates)
+        >>> for issue in sorted(validate_strings(german, duplicates, base, signatures)):
+        ...     print(' '.join(issue))
+        a placeholders expected %1$@ %2$d, found %1$d %2$@
+        b empty_value base value is not empty
+        c duplicate_key found 2 times
+        c placeholders expected none, found %1$@
+    '''
+    for key in sorted(set(duplicates)):
+        yield key, 'duplicate_key', 'found {} times'.format(duplicates.count(key) + 1)
+    for key, string in strings.items():
+        if '\\' in key or '\\' in string.value:
+            broken = broken_escapes(key) + broken_escapes(string.value)
+            if broken:
+                yield key, 'broken_escape', ' '.join(broken)
+        if base_strings is None:
+            continue
+        base_string = base_strings.get(key)
+        if base_string is None:
+            # Orphaned keys are the KeyIndex's business
+            continue
+        if not string.value:
+            if base_string.value:
+                yield key, 'empty_value', 'base value is not empty'
+            continue
+        expected = signatures[key]
+        # Most values have no placeholders, which needs no expression at all
+        if expected or '%' in string.value:
+            found = placeholder_signature(string.value)
+            if found != expected:
+                yield key, 'placeholders', 'expected {}, found {}'.format(
+                    describe_signature(expected), describe_signature(found))
+
+
+def validate_tables(root, base_language='en', parser='line'):
+    '''Validates the tables of all languages below root in one sweep, see
+    validate_strings. Every table is parsed once and the placeholders of the
+    base language are extracted once per table, not once per language.
+
+    Returns
+
+        sorted ``list`` of ``dict``s with ``table_name``, ``language``,
+        ``key``, ``check`` and ``detail``
+
+    Examples:
+
+        >>> import shutil, tempfile
+        >>> root = tempfile.mkdtemp()
+        >>> for language, text in [('en', '"a" = "%@ of %d";\\n"b" = "B";\\n'),
+        ...                        ('de', '"a" = "%2$d von %1$@";\\n"b" = "";\\n'),
+        ...                        ('fr', '"a" = "%@ de %@";\\n"b" = "B";\\n')]:
+        ...     os.mkdir(os.path.join(root, language + '.lproj'))
+        ...     path = os.path.join(root, language + '.lproj', 'Main.strings')
+        ...     status = write_file(path, parse_text(text, 'lexer'))
+        >>> for issue in validate_tables(root, parser='lexer'):
+        ...     print('{language} {key} {check}'.format(**issue))
+        de b empty_value
+        fr a placeholders
+        >>> shutil.rmtree(root)
+    '''
+    tables = {}
+    for path, table_name, language in KeyIndex.find_tables(root):
+        tables.setdefault(table_name, {})[language] = path
+    issues = []
+    for table_name, paths in sorted(tables.items()):
+        base_strings = signatures = None
+        if base_language in paths:
+            duplicates = []
+            base_strings = parse_file(paths[base_language], parser=parser,
+                                      duplicates=duplicates)
+            signatures = dict((key, placeholder_signature(string.value))
+                              for key, string in base_strings.items())
+            with stats_phase('validate'):
+                issues.extend(validation_issues(table_name, base_language,
+                                                validate_strings(base_strings, duplicates)))
+        else:
+            logging.debug('No {} version of {}, only checking each language'.format(
+                base_language, table_name))
+        for language, path in sorted(paths.items()):
+            if language == base_language:
+                continue
+            duplicates = []
+            strings = parse_file(path, parser=parser, duplicates=duplicates)
+            with stats_phase('validate'):
+                issues.extend(validation_issues(table_name, language, validate_strings(
+                    strings, duplicates, base_strings, signatures)))
+        logging.debug('Validated {} languages of {}'.format(len(paths), table_name))
+    issues.sort(key=lambda issue: (issue['table_name'], issue['language'], issue['key'],
+                                   issue['check']))
+    return issues
+
+
+def validation_issues(table_name, language, problems):
+    return [{'table_name': table_name, 'language': language, 'key': key,
+             'check': check, 'detail': detail} for key, check, detail in problems]
+
+
+def validate(root, base_language='en', parser='line'):
+    '''Prints the problems validate_tables finds as JSON lines
+
+    Returns:    exit code, 1 if there are problems
+    '''
+    import json
+    issues = validate_tables(root, base_language, parser)
+    for issue in issues:
+        sys.stdout.write(json.dumps(issue, sort_keys=True) + '\n')
+    logging.info('{} problems found'.format(len(issues)))
+    return issues and 1 or 0
+
+
+# -- Server --------------------------------------------------------------------
+
+
+class MergeServer(object):
+    ''' Answers merge and parse requests, one JSON object per line, either on
+    a pipe or on a Unix domain socket. Parsed files stay in memory between
+    requests so repeated merges of unchanged files skip the parsing.
+
+    Requests have a ``command`` and an optional ``id`` that is copied to the
+    response:
+
+        ``{"command": "merge", "new_path": ..., "old_path": ...,
+        "keep_comment": false, "replace_value": false, "delta": false,
+        "check": false}``
+            Merges one pair of files, see make_job for the flags. With
+            ``check`` the old file is left as it is and ``write`` and
+            ``delta`` tell what the merge would change.
+
+        ``{"command": "batch", "jobs": [...]}``
+            Merges all jobs, see parse_manifest
+
+        ``{"command": "parse", "path": ...}``
+            Returns the strings of a file as a list sorted by key
+
+        ``{"command": "ping"}``, ``{"command": "shutdown"}``
+
+    Every response has a ``status`` of ``ok`` or ``error``. Flags a merge
+    request leaves out default to the keyword arguments the server was
+    created with, like the flags of a manifest, see parse_manifest.
+    '''
+    def __init__(self, parser='line', idle_timeout=600, **defaults):
+        self.cache = StringsFileCache(parser)
+        self.parser = parser
+        self.idle_timeout = idle_timeout or None
+        self.defaults = defaults
+        self.running = False
+
+    def handle_request(self, request):
+        ''' Executes a single request and returns the response
+
+        Examples
+
+            >>> server = MergeServer()
+            >>> server.handle_request({'command': 'ping', 'id': 1}) == {'status': 'ok', 'id': 1}
+            True
+            >>> server.handle_request({'command': 'nothing'})['error']
+            'Unknown command: nothing'
+            >>> server.handle_request({'command': 'shutdown'})['status']
+            'ok'
+            >>> server.running
+            False
+
+            >>> import shutil, tempfile
+            >>> directory = tempfile.mkdtemp()
+            >>> new_path = os.path.join(directory, 'new.strings')
+            >>> old_path = os.path.join(directory, 'old.strings')
+            >>> write_file(new_path, parse_text('/* New */\\n"a" = "a";\\n'))
+            'created'
+            >>> write_file(old_path, parse_text('/* Old */\\n"a" = "A";\\n'))
+            'created'
+            >>> server = MergeServer(keep_comment=True)
+            >>> request = {'command': 'merge', 'new_path': new_path, 'old_path': old_path}
+            >>> server.handle_request(request)['status']
+            'ok'
+            >>> str(parse_file(old_path)['a'].comment)
+            'Old'
+
+        Checks only report what a merge would do
+
+            >>> request = {'command': 'merge', 'new_path': new_path, 'old_path': old_path,
+            ...            'replace_value': True, 'check': True}
+            >>> response = server.handle_request(request)
+            >>> response['status'] == 'ok', response['write'] == 'updated'
+            (True, True)
+            >>> response['delta']['value_changed'] == ['a']
+            True
+            >>> str(parse_file(old_path)['a'].value)
+            'A'
+            >>> shutil.rmtree(directory)
+        '''
+        command = request.get('command')
+        response = {'status': 'ok', 'id': request.get('id')}
+        if command == 'ping':
+            pass
+        elif command == 'shutdown':
+            self.running = False
+        elif command == 'merge':
+            result = merge_job(make_job(request, **self.defaults), self.parser, self.cache)
+            response['write'] = result['write']
+            if 'delta' in result:
+                response['delta'] = result['delta']
+            if result['status'] == 'failed':
+                response['status'] = 'error'
+                response['error'] = result['error']
+        elif command == 'batch':
+            response['results'] = [
+                merge_job(make_job(entry, number, **self.defaults), self.parser, self.cache)
+                for number, entry in enumerate(request.get('jobs', []), 1)
+            ]
+        elif command == 'parse':
+            strings = self.cache.parse(request['path'])
+            response['strings'] = [
+                {'key': string.key, 'value': string.value, 'comment': string.comment}
+                for string in sort_strings(strings)
+            ]
+        else:
+            response['status'] = 'error'
+            response['error'] = 'Unknown command: {}'.format(command)
+        return response
+
+    def handle_line(self, line):
+        ''' Decodes a request line and returns the encoded response line. A
+        request that fails still gets the id it was sent with.
+
+        Examples
+
+            >>> import json
+            >>> server = MergeServer()
+            >>> response = server.handle_line(b'{"command": "merge", "id": 7}')
+            >>> response = json.loads(response.decode('utf8'))
+            >>> response['status'] == 'error', response['id']
+            (True, 7)
+            >>> json.loads(server.handle_line(b'[7]').decode('utf8'))['id']
+        '''
+        import json
+        request = {}
+        try:
+            request = json.loads(line.decode('utf8'))
+            if not isinstance(request, dict):
+                request = {}
+                raise ValueError('Request is no JSON object')
+            response = self.handle_request(request)
+        except Exception as error:
+            logging.error('Failed to handle request: {}'.format(error))
+            response = {'status': 'error', 'error': str(error), 'id': request.get('id')}
+        return (json.dumps(response, sort_keys=True) + '\n').encode('utf8')
+
+    def serve_pipe(self, input_file, output_file):
+        ''' Answers requests read from input_file until it is closed, a
+        shutdown request arrives or nothing was received for idle_timeout
+        seconds
+        '''
+        import select
+        input_fd = input_file.fileno()
+        buffer = b''
+        self.running = True
+        while self.running:
+            readable = select.select([input_fd], [], [], self.idle_timeout)[0]
+            if not readable:
+                logging.debug('Idle timeout, shutting down')
+                break
+            data = os.read(input_fd, 65536)
+            if not data:
+                break
+            buffer += data
+            while self.running and b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                if line.strip():
+                    output_file.write(self.handle_line(line))
+                    output_file.flush()
+
+    def serve_socket(self, socket_path):
+        ''' Answers requests from any number of clients connected to a Unix
+        domain socket until a shutdown request arrives or no request was
+        received for idle_timeout seconds. A client that goes away is
+        dropped without affecting the others. A stale socket file is
+        replaced, but if a server still listens on it IOError is raised. The
+        socket file is removed when the server stops.
+
+        Examples
+
+            >>> import shutil, socket, tempfile, threading
+            >>> directory = tempfile.mkdtemp()
+            >>> path = os.path.join(directory, 'server.sock')
+            >>> server = MergeServer()
+            >>> thread = threading.Thread(target=server.serve_socket, args=(path,))
+            >>> thread.start()
+            >>> while not server.running:
+            ...     time.sleep(0.01)
+            >>> def connect():
+            ...     client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            ...     client.connect(path)
+            ...     return client
+            >>> gone = connect()
+            >>> gone.sendall(b'{"command": "ping"}\\n' * 1000)
+            >>> gone.close()
+            >>> try:
+            ...     MergeServer().serve_socket(path)
+            ... except IOError:
+            ...     print('in use')
+            in use
+            >>> client = connect()
+            >>> client.sendall(b'{"command": "shutdown", "id": 1}\\n')
+            >>> b'"ok"' in client.recv(65536)
+            True
+            >>> client.close()
+            >>> thread.join()
+            >>> os.listdir(directory)
+            []
+            >>> shutil.rmtree(directory)
+        '''
+        import errno
+        import select
+        import socket
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+            except socket.error:
+                # Left behind by a server that is gone
+                os.remove(socket_path)
+            else:
+                raise IOError(errno.EADDRINUSE,
+                              'A server already listens on {}'.format(socket_path))
+            finally:
+                probe.close()
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(socket_path)
+        # connection -> buffered partial request
+        clients = {}
+        try:
+            listener.listen(5)
+            self.running = True
+            while self.running:
+                readable = select.select([listener] + list(clients), [], [], self.idle_timeout)[0]
+                if not readable:
+                    logging.debug('Idle timeout, shutting down')
+                    break
+                for connection in readable:
+                    if connection is listener:
+                        clients[listener.accept()[0]] = b''
+                        continue
+                    try:
+                        data = connection.recv(65536)
+                        if data:
+                            clients[connection] += data
+                            while self.running and b'\n' in clients[connection]:
+                                line, clients[connection] = clients[connection].split(b'\n', 1)
+                                if line.strip():
+                                    connection.sendall(self.handle_line(line))
+                            continue
+                    except socket.error as error:
+                        # Only this client is gone
+                        logging.debug('Dropping client: {}'.format(error))
+                    del clients[connection]
+                    connection.close()
+        finally:
+            for connection in clients:
+                connection.close()
+            listener.close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+
+def serve(parser='line', idle_timeout=600, socket_path=None, **defaults):
+    '''Runs a MergeServer on stdin/stdout or on a Unix domain socket until it
+    is shut down. SIGTERM stops the server the same way a shutdown request
+    does. The keyword arguments are the defaults of the job flags.
+    '''
+    import signal
+    server = MergeServer(parser, idle_timeout, **defaults)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if socket_path:
+            server.serve_socket(socket_path)
+        else:
+            output_file = getattr(sys.stdout, 'buffer', sys.stdout)
+            server.serve_pipe(sys.stdin, output_file)
+    except KeyboardInterrupt:
+        pass
+    logging.debug('Served {} cached and {} parsed files'.format(
+        server.cache.hits, server.cache.misses))
+
+
+# -- Watch ---------------------------------------------------------------------
+
+
+class PollingWatcher(object):
+    ''' Notices changes of files by comparing their size, modification time
+    and inode every interval seconds
+
+    Examples
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> path = os.path.join(directory, 'Main.strings')
+        >>> watcher = PollingWatcher([path], interval=0.01)
+        >>> watcher.wait(0) == set()
+        True
+        >>> write_file(path, parse_text('"k" = "v";'))
+        'created'
+        >>> watcher.wait(1) == set([path])
+        True
+        >>> shutil.rmtree(directory)
+    '''
+    def __init__(self, paths, interval=0.5):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.interval = interval
+        self.signatures = dict((path, file_signature(path)) for path in self.paths)
+
+    def wait(self, timeout=None):
+        ''' Waits until at least one of the files changed or timeout seconds
+        passed, forever if timeout is ``None``
+
+        Returns:    ``set`` of the paths that changed
+        '''
+        end = timeout is not None and time.time() + timeout or None
+        while True:
+            changed = set()
+            for path in self.paths:
+                signature = file_signature(path)
+                if signature != self.signatures[path]:
+                    self.signatures[path] = signature
+                    changed.add(path)
+            if changed or (end is not None and time.time() >= end):
+                return changed
+            delay = self.interval
+            if end is not None:
+                delay = max(0, min(delay, end - time.time()))
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    ''' Notices changes of files through Linux inotify. The folders of the
+    files are watched, so files that editors or write_data replace by
+    renaming are noticed as well.
+    '''
+    # Events from <sys/inotify.h>
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_NONBLOCK = 0x800
+    IN_CLOEXEC = 0x80000
+    EVENT_HEADER = 'iIII'
+
+    def __init__(self, paths):
+        import ctypes
+        import ctypes.util
+        self.paths = set(os.path.abspath(path) for path in paths)
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.descriptor = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.descriptor < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        mask = (self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO |
+                self.IN_CREATE | self.IN_DELETE)
+        # Watch descriptor -> folder
+        self.folders = {}
+        encoding = sys.getfilesystemencoding()
+        for folder in set(os.path.dirname(path) for path in self.paths):
+            watch = libc.inotify_add_watch(self.descriptor, folder.encode(encoding), mask)
+            if watch < 0:
+                self.close()
+                raise OSError(ctypes.get_errno(), 'Cannot watch {}'.format(folder))
+            self.folders[watch] = folder
+
+    def wait(self, timeout=None):
+        ''' Waits like PollingWatcher.wait '''
+        import select
+        import struct
+        header_size = struct.calcsize(self.EVENT_HEADER)
+        end = timeout is not None and time.time() + timeout or None
+        while True:
+            remaining = None
+            if end is not None:
+                remaining = max(0, end - time.time())
+            if not select.select([self.descriptor], [], [], remaining)[0]:
+                return set()
+            data = os.read(self.descriptor, 64 * 1024)
+            changed = set()
+            offset = 0
+            while offset + header_size <= len(data):
+                watch, mask, cookie, length = struct.unpack_from(self.EVENT_HEADER, data, offset)
+                name = data[offset + header_size:offset + header_size + length].rstrip(b'\0')
+                offset += header_size + length
+                if watch in self.folders:
+                    path = os.path.join(self.folders[watch],
+                                        name.decode(sys.getfilesystemencoding()))
+                    if path in self.paths:
+                        changed.add(path)
+            if changed:
+                return changed
+
+    def close(self):
+        if self.descriptor >= 0:
+            os.close(self.descriptor)
+            self.descriptor = -1
+
+
+def make_watcher(paths, interval=0.5):
+    '''Returns an InotifyWatcher for the files where inotify is available
+    and a PollingWatcher otherwise
+    '''
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as error:
+            logging.debug('Polling for changes, inotify failed: {}'.format(error))
+    return PollingWatcher(paths, interval)
+
+
+def affected_files(new_file_path, old_file_paths, changed):
+    '''Returns the old files that have to be merged again after the files in
+    changed changed: all of them if the new file changed, otherwise the
+    changed old files
+
+    Examples:
+
+        >>> affected_files('new', ['de', 'fr'], set(['new']))
+        ['de', 'fr']
+        >>> affected_files('new', ['de', 'fr'], set(['fr']))
+        ['fr']
+    '''
+    if new_file_path in changed:
+        return list(old_file_paths)
+    return [path for path in old_file_paths if path in changed]
+
+
+def watch(new_file_path, old_file_paths, keep_comment=False, replace_value=False,
+          parser='line', interval=0.5, debounce=0.2, rounds=None):
+    '''Merges the new file into the old files and merges again whenever
+    they change, until interrupted or rounds merges are done
+
+    Parsed tables are kept in a StringsFileCache between merges, so only
+    files that changed are parsed again. A burst of changes is merged once
+    the files were quiet for debounce seconds. The merged files written
+    here are not counted as changes.
+
+    Keyword Arguments
+
+        interval
+            Seconds between checks when polling for changes
+
+        debounce
+            Seconds without changes before merging
+
+        rounds
+            Number of merges after the first one, forever if ``None``
+
+    The other arguments are the same as for merge_files_fanout.
+    '''
+    new_file_path = os.path.abspath(new_file_path)
+    old_file_paths = [os.path.abspath(path) for path in old_file_paths]
+    cache = StringsFileCache(parser)
+    merge_files_fanout(new_file_path, old_file_paths, keep_comment, replace_value,
+                       parser, cache)
+    signatures = dict((path, file_signature(path))
+                      for path in [new_file_path] + old_file_paths)
+    watcher = make_watcher(list(signatures), interval)
+    logging.info('Watching {} for changes'.format(new_file_path))
+    try:
+        while rounds is None or rounds > 0:
+            changed = watcher.wait()
+            while True:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changed |= more
+            # Only real changes, not the files merged here
+            changed = set(path for path in changed
+                          if file_signature(path) != signatures[path])
+            targets = affected_files(new_file_path, old_file_paths, changed)
+            if not targets or not os.path.exists(new_file_path):
+                continue
+            start = time.time()
+            parse = cache.parse
+            new_strings = parse(new_file_path)
+            statuses = []
+            for old_file_path in targets:
+                try:
+                    statuses.append(merge_parsed(new_strings, old_file_path, keep_comment,
+                                                 replace_value, parse, cache))
+                except Exception as error:
+                    logging.error('Failed to merge {}: {}'.format(old_file_path, error))
+            for path in signatures:
+                signatures[path] = file_signature(path)
+            logging.info('Merged {} of {} files in {:.0f} ms, {} updated'.format(
+                len(targets), len(old_file_paths), (time.time() - start) * 1000,
+                statuses.count('updated') + statuses.count('created')))
+            if rounds is not None:
+                rounds -= 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+# -- Self-Test -----------------------------------------------------------------
+
+# Share of the startup overhead with all DEFERRED_MODULES imported eagerly
+# that the script may take to start on top of a bare interpreter. Both are
+# measured on the same machine, so the check does not depend on its speed
+STARTUP_RATIO = 0.75
+# Modules that must not be imported for a plain merge
+DEFERRED_MODULES = ['json', 'multiprocessing', 'socket', 'doctest', 'subprocess', 'sqlite3']
+# Starts the script given as first argument with --help after importing the
+# modules given as further arguments
+STARTUP_COMMAND = '''import runpy, sys
+for name in sys.argv[2:]:
+    try:
+        __import__(name)
+    except ImportError:
+        pass
+sys.argv = sys.argv[1:2] + ['--help']
+runpy.run_path(sys.argv[0], run_name='__main__')
+'''
+
+
+def measure_startup(runs=5):
+    '''Starts the merge_files.py script the plugin runs in fresh interpreters,
+    once as it is and once with the DEFERRED_MODULES imported first, and
+    measures how long both take compared to a bare interpreter, taking the
+    best of several runs
+
+    Returns
+
+        ``tuple`` with the startup overhead and the overhead with eager
+        imports in seconds, and the list of DEFERRED_MODULES that were
+        imported
+    '''
+    import subprocess
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'merge_files.py')
+    # The plugin runs with byte code caching, which the first run sets up
+    environment = dict(os.environ)
+    environment.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    def best_time(arguments):
+        timings = []
+        with open(os.devnull, 'w') as devnull:
+            for run in range(runs):
+                start = time.time()
+                subprocess.check_call(arguments, stdout=devnull, env=environment)
+                timings.append(time.time() - start)
+        return min(timings)
+
+    bare = best_time([sys.executable, '-c', 'pass'])
+    lazy = best_time([sys.executable, '-c', STARTUP_COMMAND, script])
+    eager = best_time([sys.executable, '-c', STARTUP_COMMAND, script] + DEFERRED_MODULES)
+    imported = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys; sys.path.insert(0, sys.argv[1]); __import__(sys.argv[2]); '
+        'print(",".join(m for m in sys.argv[3:] if m in sys.modules))',
+        os.path.dirname(script),
+        os.path.splitext(os.path.basename(script))[0]
+    ] + DEFERRED_MODULES).decode('utf8').strip()
+    return lazy - bare, eager - bare, [module for module in imported.split(',') if module]
+
+
+def selftest(verbose=False):
+    '''Runs the doctests of this module and checks that startup takes at most
+    STARTUP_RATIO of the startup with eager imports, without importing any
+    of the DEFERRED_MODULES
+
+    Returns
+
+        Number of failures
+    '''
+    import doctest
+    failures = doctest.testmod(sys.modules[__name__], verbose=verbose)[0]
+    overhead, eager, imported = measure_startup()
+    logging.info('Startup overhead: {:.1f} ms, {:.1f} ms with eager imports'.format(
+        overhead * 1000, eager * 1000))
+    if overhead > eager * STARTUP_RATIO:
+        logging.error('Startup is not faster than with eager imports')
+        failures += 1
+    if imported:
+        logging.error('Imported at startup: {}'.format(', '.join(imported)))
+        failures += 1
+    return failures
+
+
+def main(argv=None):
+    ''' Parse the command line and execute the programm with the parameters
+
+    Keyword Arguments
+
+        argv
+            ``list`` of arguments without the program name, ``sys.argv``
+            if None
+
+    Examples:
+
+        >>> import shutil, tempfile
+        >>> directory = tempfile.mkdtemp()
+        >>> new_path = os.path.join(directory, 'New.strings')
+        >>> old_path = os.path.join(directory, 'Old.strings')
+        >>> compiled_path = os.path.join(directory, 'Compiled.strings')
+        >>> write_data(new_path, u'/* c */\\n"k" = "v";\\n/* d */\\n"l" = "w";\\n'.encode('utf-16'))
+        'created'
+        >>> main(['-n', new_path, '-o', old_path, '--compile', compiled_path,
+        ...       '--compile_format', 'utf8'])
+        0
+        >>> main(['-n', new_path, '-o', old_path, '--report'])  # doctest: +ELLIPSIS
+        {"error": null, ..., "status": "merged", "write": "unchanged"}
+        0
+        >>> open(compiled_path, 'rb').read() == b'"k" = "v";\\n"l" = "w";\\n'
+        True
+        >>> shutil.rmtree(directory)
+    '''
+
+    parser = optparse.OptionParser(
+        'usage: %prog [options] [output folder] [source folders] [ignore patterns]'
+    )
+    parser.add_option(
+        '-o',
+        '--old_path',
+        action='append',
+        dest='old_path',
+        default=None,
+        help='Old file path for merging, repeat to merge the new file into several old files'
+    )
+    parser.add_option(
+        '-n',
+        '--new_path',
+        action='store',
+        dest='new_path',
+        default='.',
+        help='New file path for merging, - reads standard input'
+    )
+    parser.add_option(
+        '-v',
+        '--verbose',
+        action='store_true',
+        dest='verbose',
+        default=False,
+        help='Show debug messages'
+    )
+    
+    parser.add_option(
+        '-r',
+        '--replace_value',
+        action='store_true',
+        dest='replace_value',
+        default=False,
+        help='Force replace string values with ones in new file'
+    )
+    
+    parser.add_option(
+        '-k',
+        '--keep_comment',
+        action='store_true',
+        dest='keep_comment',
+        default=True,
+        help='Keep comment from the old string'
+    )
+
+    parser.add_option(
+        '-p',
+        '--parser',
+        action='store',
+        dest='parser',
+        type='choice',
+        choices=sorted(PARSERS),
+        default='line',
+        help='Parser for the strings files: %s, line by default' % ', '.join(sorted(PARSERS))
+    )
+
+    parser.add_option(
+        '--serializer',
+        action='store',
+        dest='serializer',
+        type='choice',
+        choices=sorted(SERIALIZERS),
+        default=SERIALIZER,
+        help='Serializer for writing strings files: %s' % ', '.join(sorted(SERIALIZERS))
+    )
+
+    parser.add_option(
+        '-m',
+        '--manifest',
+        action='store',
+        dest='manifest',
+        default=None,
+        help='Merge all jobs of a JSON or JSON-lines manifest and print the results'
+    )
+
+    parser.add_option(
+        '-j',
+        '--jobs',
+        action='store',
+        dest='jobs',
+        type='int',
+        default=1,
+        help='Number of processes for merging or checking several files, 0 uses one per CPU'
+    )
+
+    parser.add_option(
+        '--serve',
+        action='store_true',
+        dest='serve',
+        default=False,
+        help='Answer JSON-lines merge requests on stdin/stdout or on --socket'
+    )
+
+    parser.add_option(
+        '--socket',
+        action='store',
+        dest='socket',
+        default=None,
+        help='Unix domain socket path for --serve'
+    )
+
+    parser.add_option(
+        '--idle_timeout',
+        action='store',
+        dest='idle_timeout',
+        type='float',
+        default=600,
+        help='Seconds without requests after which --serve stops, 0 never stops'
+    )
+
+    parser.add_option(
+        '--selftest',
+        action='store_true',
+        dest='selftest',
+        default=False,
+        help='Run the doctests and check the startup time'
+    )
+
+    parser.add_option(
+        '--measure_memory',
+        action='store_true',
+        dest='measure_memory',
+        default=False,
+        help='Load all files given as arguments and print the memory their tables take'
+    )
+
+    parser.add_option(
+        '--cache_dir',
+        action='store',
+        dest='cache_dir',
+        default=None,
+        help='Directory of a cache of parsed files, unchanged files are not parsed again'
+    )
+
+    parser.add_option(
+        '--lookup',
+        action='append',
+        dest='lookup',
+        default=[],
+        help='Print value and comment of this key in the files given as arguments, '
+             'without parsing them; the index is kept in --cache_dir'
+    )
+
+    parser.add_option(
+        '--cache_size',
+        action='store',
+        dest='cache_size',
+        type='float',
+        default=256,
+        help='Maximum size of the parse cache in megabytes'
+    )
+
+    parser.add_option(
+        '--cache_verify',
+        action='store_true',
+        dest='cache_verify',
+        default=False,
+        help='Compare the content hash before using a cached file'
+    )
+
+    parser.add_option(
+        '--streaming',
+        action='store_true',
+        dest='streaming',
+        default=False,
+        help='Merge sorted streams with bounded memory instead of loading both files'
+    )
+
+    parser.add_option(
+        '--delta',
+        action='store',
+        dest='delta',
+        default=None,
+        help='Write the added, removed and changed keys of each merge as JSON to this file'
+    )
+
+    parser.add_option(
+        '--report',
+        action='store_true',
+        dest='report',
+        default=False,
+        help='Print what happened to each old file as JSON lines and log a summary'
+    )
+
+    parser.add_option(
+        '--output',
+        action='store',
+        dest='output',
+        default=None,
+        help='Write the merged file here instead of replacing the old file, - for stdout'
+    )
+
+    parser.add_option(
+        '--compile',
+        action='store',
+        dest='compile',
+        default=None,
+        help='Also compile the merged file for shipping to this path, - for stdout'
+    )
+
+    parser.add_option(
+        '--compile_format',
+        action='store',
+        dest='compile_format',
+        type='choice',
+        choices=COMPILE_FORMATS,
+        default='binary',
+        help='Format of the compiled file: ' + ', '.join(COMPILE_FORMATS)
+    )
+
+    parser.add_option(
+        '--index',
+        action='store',
+        dest='index',
+        default=None,
+        help='Update the SQLite key index in this file with the tables below --index_root'
+    )
+
+    parser.add_option(
+        '--index_root',
+        action='store',
+        dest='index_root',
+        default='.',
+        help='Project directory whose .lproj folders are indexed'
+    )
+
+    parser.add_option(
+        '--query',
+        action='store',
+        dest='query',
+        type='choice',
+        choices=sorted(INDEX_QUERIES),
+        default=None,
+        help='Print the result of a query on the key index as JSON lines: ' +
+             ', '.join(sorted(INDEX_QUERIES))
+    )
+
+    parser.add_option(
+        '--base_language',
+        action='store',
+        dest='base_language',
+        default='en',
+        help='Base language the key index queries and --validate compare with'
+    )
+
+    parser.add_option(
+        '--validate',
+        action='store',
+        dest='validate',
+        default=None,
+        help='Check the tables of all languages below this folder for broken '
+             'placeholders, duplicate keys, broken escapes and empty values'
+    )
+
+    parser.add_option(
+        '--ingest',
+        action='store',
+        dest='ingest',
+        default=None,
+        help='Merge the strings files of a zip or tar archive of translations into the '
+             'language folders below --ingest_root'
+    )
+
+    parser.add_option(
+        '--ingest_root',
+        action='store',
+        dest='ingest_root',
+        default='.',
+        help='Folder holding the <language>.lproj folders archives are merged into'
+    )
+
+    parser.add_option(
+        '--watch',
+        action='store_true',
+        dest='watch',
+        default=False,
+        help='Merge again whenever the new or old files change, until interrupted'
+    )
+
+    parser.add_option(
+        '--watch_interval',
+        action='store',
+        type='float',
+        dest='watch_interval',
+        default=0.5,
+        help='Seconds between checks for changes where inotify is not available'
+    )
+
+    parser.add_option(
+        '--debounce',
+        action='store',
+        type='float',
+        dest='debounce',
+        default=0.2,
+        help='Seconds the files have to stay unchanged before merging again'
+    )
+
+    parser.add_option(
+        '--lock_timeout',
+        action='store',
+        type='float',
+        dest='lock_timeout',
+        default=LOCK_TIMEOUT,
+        help='Seconds a merge waits for other merges of the same file to finish'
+    )
+
+    parser.add_option(
+        '--check',
+        action='store_true',
+        dest='check',
+        default=False,
+        help='Only report the files a merge would change and exit with 1 if there are any, '
+             'old folders stand for the tables named like the new file in all languages'
+    )
+
+    parser.add_option(
+        '--stats',
+        action='store',
+        dest='stats',
+        default=None,
+        help='Write timings and counters of the run as JSON to this file, - for stderr'
+    )
+
+    (options, args) = parser.parse_args(argv)
+
+    # Create Logger
+    logging.basicConfig(
+        format='%(message)s',
+        level=options.verbose and logging.DEBUG or logging.INFO
+    )
+
+    if not options.stats:
+        return run(options, args)
+    with collect_stats() as stats:
+        with stats.phase('total'):
+            status = run(options, args)
+    write_stats(options.stats, stats)
+    return status
+
+
+def write_stats(file_path, stats):
+    ''' Writes Stats as JSON to a file, or to stderr if the path is ``-`` '''
+    import json
+    output = json.dumps(stats.as_dict(), sort_keys=True, indent=2)
+    if file_path == '-':
+        sys.stderr.write(output + '\n')
+    else:
+        with open(file_path, 'w') as stats_file:
+            stats_file.write(output)
+
+
+def run(options, args):
+    ''' Executes the programm with the parsed command line '''
+    use_serializer(options.serializer)
+    use_lock_timeout(options.lock_timeout)
+    if options.selftest:
+        return selftest(options.verbose) and 1 or 0
+
+    if options.measure_memory:
+        import json
+        result = measure_memory(args, options.parser)
+        sys.stdout.write(json.dumps(result, sort_keys=True) + '\n')
+        return 0
+
+    if options.serve:
+        serve(options.parser, options.idle_timeout, options.socket,
+              keep_comment=options.keep_comment, replace_value=options.replace_value,
+              streaming=options.streaming)
+        return 0
+
+    if options.index:
+        return query_index(options.index, options.index_root, options.query,
+                           options.base_language, options.parser)
+
+    if options.validate:
+        return validate(options.validate, options.base_language, options.parser)
+
+    if options.lookup:
+        return lookup_keys(args, options.lookup, options.cache_dir, options.parser)
+
+    cache = None
+    if options.cache_dir:
+        cache = ParseCache(options.cache_dir, options.parser,
+                           int(options.cache_size * 1024 * 1024), options.cache_verify)
+
+    if options.ingest:
+        results = ingest_archive(options.ingest, options.ingest_root, options.parser,
+                                 options.jobs, keep_comment=options.keep_comment,
+                                 delta=bool(options.delta), check=options.check)
+        if options.check:
+            return report_check(results, options.delta)
+        return report_results(results, options.delta)
+
+    if options.manifest:
+        jobs = read_manifest(options.manifest, keep_comment=options.keep_comment,
+                             replace_value=options.replace_value,
+                             streaming=options.streaming, delta=bool(options.delta),
+                             check=options.check)
+        if options.check:
+            return report_check(check_batch(jobs, options.parser, options.jobs, cache),
+                                options.delta)
+        results = merge_batch(jobs, options.parser, options.jobs, cache)
+        return report_results(results, options.delta)
+
+    old_paths = options.old_path or ['.']
+    if '-' in old_paths:
+        logging.error('The old file cannot be read from standard input, use --output -')
+        return 2
+    if options.compile and len(old_paths) > 1:
+        logging.error('--compile takes a single old file')
+        return 2
+    if options.check:
+        jobs = [
+            make_job({'new_path': options.new_path, 'old_path': old_path}, number,
+                     keep_comment=options.keep_comment, replace_value=options.replace_value,
+                     check=True)
+            for number, old_path in enumerate(find_old_files(options.new_path, old_paths), 1)
+        ]
+        if options.new_path == '-':
+            new_data = read_input(options.new_path)
+            for job in jobs:
+                job['new_data'] = new_data
+        return report_check(check_batch(jobs, options.parser, options.jobs, cache),
+                            options.delta)
+    if options.watch:
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        watch(options.new_path, old_paths, options.keep_comment, options.replace_value,
+              options.parser, options.watch_interval, options.debounce)
+        return 0
+    deltas = None
+    if options.delta:
+        deltas = []
+    if options.output:
+        if len(old_paths) > 1:
+            logging.error('--output takes a single old file')
+            return 2
+        old_data = None
+        if os.path.exists(old_paths[0]):
+            old_data = read_input(old_paths[0])
+        delta = None
+        if deltas is not None:
+            delta = {}
+            deltas.append(delta)
+        data = merge_buffers(read_input(options.new_path), old_data, options.keep_comment,
+                             options.replace_value, options.parser, delta=delta)
+        write_output(options.output, data)
+        if options.delta:
+            write_deltas(options.delta, [
+                {'new_path': options.new_path, 'old_path': old_paths[0], 'delta': deltas[0]}
+            ])
+    else:
+        if options.streaming:
+            if options.new_path == '-':
+                logging.error('Streaming merges cannot read standard input')
+                return 2
+            results = [
+                merge_job(make_job({'new_path': options.new_path, 'old_path': old_path},
+                                   number, keep_comment=options.keep_comment,
+                                   replace_value=options.replace_value, streaming=True,
+                                   delta=bool(options.delta)), options.parser)
+                for number, old_path in enumerate(old_paths, 1)
+            ]
+        else:
+            errors = []
+            statuses = merge_files_fanout(options.new_path, old_paths, options.keep_comment,
+                                          options.replace_value, options.parser, cache,
+                                          deltas, errors=errors)
+            results = [
+                {'new_path': options.new_path, 'old_path': old_path,
+                 'status': error is None and 'merged' or 'failed', 'error': error,
+                 'write': error is None and status or None}
+                for old_path, status, error in zip(old_paths, statuses, errors)
+            ]
+            if deltas is not None:
+                for result, delta in zip(results, deltas):
+                    result['delta'] = delta
+        if options.report:
+            status = report_results(results, options.delta)
+        else:
+            if options.delta:
+                write_deltas(options.delta, results)
+            status = [result for result in results if result['status'] != 'merged'] and 1 or 0
+        if status:
+            return status
+    if options.compile:
+        if options.output == '-':
+            compile_table(parse_buffer(data, options.parser), options.compile,
+                          options.compile_format)
+        else:
+            compile_file(options.output or old_paths[0], options.compile,
+                         options.compile_format, options.parser)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
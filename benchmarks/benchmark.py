@@ -0,0 +1,514 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Benchmarks for merge_files.py
+
+Generates a reproducible corpus of synthetic strings files and measures the
+time and peak memory of parsing, merging, sorting and writing them with
+every parser. Every case runs in a fresh interpreter so that the peak RSS
+belongs to that case alone. The adversarial corpus adds entries that are
+slow to scan. The results are written as JSON and can be compared with an
+earlier run to find regressions:
+
+    python benchmarks/benchmark.py --sizes 100,10000 --output before.json
+    python benchmarks/benchmark.py --sizes 100,10000 --compare before.json
+    python benchmarks/benchmark.py --sizes 10000 --corpora adversarial --parsers lexer
+'''
+# -- Import --------------------------------------------------------------------
+# Operation Systems and Path Operations
+import os
+# System Utilities
+import sys
+# Opening Files with different Encodings
+import codecs
+# Commandline Options parser
+import optparse
+# Logging
+import logging
+# Measuring Durations
+import time
+# Reproducible corpora
+import random
+# Reading and writing results
+import json
+# Running every case in a fresh interpreter
+import subprocess
+# Describing the machine the results come from
+import platform
+
+RESOURCES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir,
+    'OneSkyPlugin.xcplugin', 'Contents', 'Resources'
+)
+sys.path.insert(0, os.path.normpath(RESOURCES))
+
+import merge_files
+
+# -- Corpus --------------------------------------------------------------------
+
+SIZES = [100, 1000, 10000, 100000, 1000000]
+CORPUS_ENCODINGS = ['utf16', 'utf8']
+OPERATIONS = ['parse_file', 'merge_strings', 'sort_strings', 'write_file', 'merge_files',
+              'merge_streaming']
+# Operations measured once per parser, the others only with the reference parser
+PARSER_OPERATIONS = ['parse_file', 'merge_files', 'merge_streaming']
+# Relative frequency of each kind of entry in a corpus
+ENTRY_KINDS = [
+    ('plain', 40),
+    ('raw', 15),
+    ('storyboard', 20),
+    ('multiline', 8),
+    ('trailing_comment', 7),
+    ('quotes', 5),
+    ('unicode', 5),
+]
+# Kinds of entries only the lexer reads, the line parser drops them. Not
+# part of the default corpus, so both parsers can be benchmarked on it.
+LEXER_ONLY_KINDS = [
+    ('line_comment', 7),
+]
+# Kinds of entries that are slow to scan: long lines of quotes that never
+# form a pair, and long values full of escapes, some of which cross the
+# boundary of a CHUNK_SIZE piece read when streaming. Both parsers read
+# them alike.
+ADVERSARIAL_KINDS = [
+    ('unmatched_quotes', 5),
+    ('escapes', 5),
+]
+# Kinds of entries of each corpus
+CORPORA = {
+    'default': ENTRY_KINDS,
+    'adversarial': ENTRY_KINDS + ADVERSARIAL_KINDS,
+}
+# Bumped whenever generated entries change, so cached corpora are not reused
+CORPUS_VERSION = 2
+WORDS = [
+    'account', 'cancel', 'delete', 'download', 'error', 'file', 'message',
+    'network', 'open', 'password', 'save', 'settings', 'share', 'title',
+    'upload', 'user', 'welcome', 'window',
+]
+UNICODE_WORDS = [
+    u'Übersicht', u'paramètres', u'сохранить',
+    u'設定', u'ダウンロード', u'저장', u'حفظ',
+    u'\U0001f600',
+]
+UI_CLASSES = ['UILabel', 'UIButton', 'UITextField', 'UINavigationItem', 'UIBarButtonItem']
+UI_PROPERTIES = ['text', 'normalTitle', 'placeholder', 'title']
+# A case is slower than its baseline if it takes this much longer
+REGRESSION_THRESHOLD = 0.1
+
+
+def generate_entries(count, seed=0, kinds=None):
+    '''Generates the text of count synthetic strings entries. The same count
+    and seed always give the same entries. kinds are (kind, weight) tuples
+    like ENTRY_KINDS, which is used if ``None``.
+
+    Returns
+
+        ``list`` of (key, text) tuples, text being the complete entry with
+        its comment
+
+    Examples:
+
+        >>> entries = generate_entries(50, seed=1)
+        >>> entries == generate_entries(50, seed=1)
+        True
+        >>> text = u''.join(entry for key, entry in entries)
+        >>> sorted(merge_files.parse_text(text)) == sorted(key for key, entry in entries)
+        True
+        >>> sorted(merge_files.parse_text(text, 'line')) == sorted(key for key, entry in entries)
+        True
+        >>> entries = generate_entries(50, seed=1, kinds=LEXER_ONLY_KINDS)
+        >>> text = u''.join(entry for key, entry in entries)
+        >>> len(merge_files.parse_text(text, 'lexer')), len(merge_files.parse_text(text, 'line'))
+        (50, 0)
+        >>> entries = generate_entries(50, seed=1, kinds=ADVERSARIAL_KINDS)
+        >>> text = u''.join(entry for key, entry in entries)
+        >>> len(text) > 50 * 1000
+        True
+        >>> merge_files.parse_text(text, 'lexer') == merge_files.parse_text(text, 'line')
+        True
+        >>> sorted(merge_files.parse_text(text)) == sorted(key for key, entry in entries)
+        True
+    '''
+    generator = random.Random(seed)
+    weighted_kinds = []
+    for kind, weight in kinds or ENTRY_KINDS:
+        weighted_kinds.extend([kind] * weight)
+
+    def phrase(length):
+        return u' '.join(generator.choice(WORDS) for index in range(length))
+
+    entries = []
+    for number in range(count):
+        kind = generator.choice(weighted_kinds)
+        key = u'{} {}'.format(phrase(generator.randint(1, 4)), number)
+        value = phrase(generator.randint(1, 8)).capitalize()
+        comment = u'/* {} */'.format(phrase(generator.randint(2, 10)))
+        trailing = u''
+        if kind == 'raw':
+            value = key
+        elif kind == 'storyboard':
+            object_id = u'{:03x}-{:02x}-{:03x}'.format(
+                generator.randint(0, 0xfff), generator.randint(0, 0xff), number % 0xfff
+            )
+            ui_property = generator.choice(UI_PROPERTIES)
+            key = u'{}.{}'.format(object_id, ui_property)
+            comment = u'/* Class = "{}"; {} = "{}"; ObjectID = "{}"; */'.format(
+                generator.choice(UI_CLASSES), ui_property, value, object_id
+            )
+        elif kind == 'multiline':
+            value = u'{}\n{}'.format(value, phrase(generator.randint(2, 8)))
+            comment = u'/* {}\n   {} */'.format(phrase(3), phrase(5))
+        elif kind == 'trailing_comment':
+            # Like LocalizedString.LOCALIZED_STRING_TRAILING_COMMENT_EXPR
+            comment = u''
+            trailing = u' /* {} */'.format(phrase(2))
+        elif kind == 'line_comment':
+            trailing = u' // {}'.format(phrase(2))
+        elif kind == 'quotes':
+            key = u'\\"{}\\" {}'.format(phrase(2), number)
+            value = u'\\"{}\\" \\"{}\\" \\\\ \\"{}\\"'.format(phrase(1), phrase(2), phrase(1))
+        elif kind == 'unicode':
+            value = u'{} {}'.format(value, generator.choice(UNICODE_WORDS))
+        elif kind == 'escapes':
+            value = u''.join(generator.choice([u'\\"', u'\\\\', u'\\n', u'\\t', u' ', u'a'])
+                             for index in range(generator.randint(500, 2000)))
+        entry = u'"{}" = "{}";{}\n\n'.format(key, value, trailing)
+        if comment:
+            entry = comment + u'\n' + entry
+        if kind == 'unmatched_quotes':
+            # Neither a pair nor a comment, so both parsers skip the line
+            entry = u''.join(u'"{}" "{}" = '.format(phrase(1), phrase(1))
+                             for index in range(generator.randint(100, 500))) + u'\n' + entry
+        entries.append((key, entry))
+    return entries
+
+
+def generate_pair(count, seed=0, kinds=None):
+    '''Generates the text of a new strings file with count entries and of an
+    old one to merge it into. The old file misses some of the new keys, has
+    some removed keys and translated values for others. kinds are passed to
+    generate_entries.
+
+    Returns
+
+        (new text, old text) ``tuple``
+    '''
+    entries = generate_entries(count, seed, kinds)
+    generator = random.Random(seed + 1)
+    new_entries = []
+    old_entries = []
+    for key, text in entries:
+        chance = generator.random()
+        if chance < 0.05:
+            # Added since the last merge
+            new_entries.append(text)
+        elif chance < 0.1:
+            # Removed since the last merge
+            old_entries.append(text)
+        elif chance < 0.6:
+            # Translated
+            new_entries.append(text)
+            value_start = text.rindex(u'" = "') + 5
+            old_entries.append(text[:value_start] + u'Translated ' + text[value_start:])
+        else:
+            new_entries.append(text)
+            old_entries.append(text)
+    return u''.join(new_entries), u''.join(old_entries)
+
+
+def corpus_paths(directory, count, encoding, seed=0, corpus='default'):
+    '''Returns the paths of the new and old file of a corpus, generating
+    them if they do not exist yet
+
+    Keyword Arguments
+
+        corpus
+            Name in CORPORA of the kinds of entries
+
+    Returns
+
+        (new path, old path) ``tuple``
+    '''
+    name = 'corpus-v{}-{}-{}-{}-{}'.format(CORPUS_VERSION, corpus, count, encoding, seed)
+    paths = (
+        os.path.join(directory, name + '-new.strings'),
+        os.path.join(directory, name + '-old.strings'),
+    )
+    if not all(os.path.exists(path) for path in paths):
+        logging.info('Generating {} {} entries in {}'.format(count, corpus, encoding))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for path, text in zip(paths, generate_pair(count, seed, CORPORA[corpus])):
+            bom = encoding == 'utf16' and codecs.BOM_UTF16_LE or b''
+            codec = encoding == 'utf16' and 'utf-16-le' or 'utf-8'
+            with open(path, 'wb') as corpus_file:
+                corpus_file.write(bom + text.encode(codec))
+    return paths
+
+# -- Benchmark -----------------------------------------------------------------
+
+
+def run_case(operation, new_path, old_path, encoding='utf16', repeat=3, parser='line'):
+    '''Runs one operation on a corpus in the given encoding several times,
+    parsing with parser
+
+    Returns
+
+        ``dict`` with the best time in ``seconds``, all ``timings`` and the
+        ``peak_rss`` of the process in bytes
+    '''
+    import shutil
+    import tempfile
+    directory = tempfile.mkdtemp()
+    output_path = os.path.join(directory, 'output.strings')
+    timings = []
+    try:
+        new_strings = old_strings = merged_strings = None
+        if operation != 'parse_file':
+            new_strings = merge_files.parse_file(new_path, parser=parser)
+            old_strings = merge_files.parse_file(old_path, parser=parser)
+            merged_strings = merge_files.merge_strings(old_strings, new_strings)
+        for run in range(repeat):
+            if operation in ('merge_files', 'merge_streaming'):
+                shutil.copyfile(old_path, output_path)
+            elif operation == 'write_file' and os.path.exists(output_path):
+                os.remove(output_path)
+            start = time.time()
+            if operation == 'parse_file':
+                merge_files.parse_file(new_path, parser=parser)
+            elif operation == 'merge_strings':
+                merge_files.merge_strings(old_strings, new_strings)
+            elif operation == 'sort_strings':
+                merge_files.sort_strings(merged_strings)
+            elif operation == 'write_file':
+                merge_files.write_file(output_path, merged_strings, encoding)
+            elif operation == 'merge_files':
+                merge_files.merge_files(new_path, output_path, parser=parser)
+            elif operation == 'merge_streaming':
+                merge_files.merge_files_streaming(new_path, output_path, parser=parser)
+            else:
+                raise ValueError('Unknown operation {}'.format(operation))
+            timings.append(time.time() - start)
+    finally:
+        shutil.rmtree(directory)
+    return {'seconds': min(timings), 'timings': timings, 'peak_rss': merge_files.peak_rss()}
+
+
+def run_benchmarks(sizes, encodings, operations, corpus_dir, repeat=3, seed=0,
+                   corpora=('default',), parsers=('line',)):
+    '''Runs every operation on every corpus, each in a fresh interpreter.
+    The operations in PARSER_OPERATIONS run once with every parser, the
+    others with the reference parser only.
+
+    Returns
+
+        ``list`` of result ``dict``s with ``corpus``, ``size``,
+        ``encoding``, ``operation`` and ``parser`` besides the fields of
+        run_case
+    '''
+    results = []
+    for corpus in corpora:
+        for size in sizes:
+            for encoding in encodings:
+                new_path, old_path = corpus_paths(corpus_dir, size, encoding, seed, corpus)
+                for operation in operations:
+                    operation_parsers = parsers
+                    if operation not in PARSER_OPERATIONS:
+                        operation_parsers = [merge_files.REFERENCE_PARSER]
+                    for parser in operation_parsers:
+                        output = subprocess.check_output([
+                            sys.executable, os.path.abspath(__file__), '--case', operation,
+                            '--encodings', encoding, '--parsers', parser,
+                            '--repeat', str(repeat), new_path, old_path
+                        ])
+                        result = json.loads(output.decode('utf8'))
+                        result.update({'corpus': corpus, 'size': size, 'encoding': encoding,
+                                       'operation': operation, 'parser': parser})
+                        logging.info('{operation} {parser} {corpus} {size} {encoding}: '
+                                     '{seconds:.4f} s'.format(**result))
+                        results.append(result)
+    return results
+
+
+def compare_results(results, baseline, threshold=REGRESSION_THRESHOLD):
+    '''Compares results with those of an earlier run
+
+    Returns
+
+        ``list`` of (result, baseline result, ratio) tuples for the cases
+        that are more than threshold slower than in the baseline
+
+    Examples:
+
+        >>> old = [{'size': 10, 'encoding': 'utf8', 'operation': 'parse_file', 'seconds': 1.0}]
+        >>> new = [{'size': 10, 'encoding': 'utf8', 'operation': 'parse_file', 'seconds': 1.5}]
+        >>> [ratio for result, base, ratio in compare_results(new, old)]
+        [1.5]
+        >>> compare_results(old, new)
+        []
+    '''
+    def case(result):
+        # Results of runs before there were several corpora and parsers
+        return (result.get('corpus', 'default'), result['size'], result['encoding'],
+                result['operation'], result.get('parser', merge_files.REFERENCE_PARSER))
+
+    baseline_cases = dict((case(result), result) for result in baseline)
+    regressions = []
+    for result in results:
+        base = baseline_cases.get(case(result))
+        if base is None or not base['seconds']:
+            continue
+        ratio = result['seconds'] / base['seconds']
+        if ratio > 1 + threshold:
+            regressions.append((result, base, ratio))
+    return regressions
+
+
+def main():
+    ''' Parse the command line and run the benchmarks '''
+
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option(
+        '--sizes',
+        action='store',
+        dest='sizes',
+        default=','.join(str(size) for size in SIZES),
+        help='Comma separated numbers of entries of the corpora'
+    )
+    parser.add_option(
+        '--encodings',
+        action='store',
+        dest='encodings',
+        default=','.join(CORPUS_ENCODINGS),
+        help='Comma separated encodings of the corpora'
+    )
+    parser.add_option(
+        '--operations',
+        action='store',
+        dest='operations',
+        default=','.join(OPERATIONS),
+        help='Comma separated operations to measure'
+    )
+    parser.add_option(
+        '--corpora',
+        action='store',
+        dest='corpora',
+        default='default',
+        help='Comma separated corpora to measure on, one of {}'.format(
+            ', '.join(sorted(CORPORA)))
+    )
+    parser.add_option(
+        '--parsers',
+        action='store',
+        dest='parsers',
+        default=','.join(sorted(merge_files.PARSERS)),
+        help='Comma separated parsers to measure'
+    )
+    parser.add_option(
+        '--repeat',
+        action='store',
+        type='int',
+        dest='repeat',
+        default=3,
+        help='Runs per case, the best one counts'
+    )
+    parser.add_option(
+        '--seed',
+        action='store',
+        type='int',
+        dest='seed',
+        default=0,
+        help='Seed of the corpus generator'
+    )
+    parser.add_option(
+        '--corpus_dir',
+        action='store',
+        dest='corpus_dir',
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus'),
+        help='Directory the generated corpora are kept in'
+    )
+    parser.add_option(
+        '--output',
+        action='store',
+        dest='output',
+        default=None,
+        help='Write the results as JSON to this file'
+    )
+    parser.add_option(
+        '--compare',
+        action='store',
+        dest='compare',
+        default=None,
+        help='Compare with the results in this JSON file and fail on regressions'
+    )
+    parser.add_option(
+        '--case',
+        action='store',
+        dest='case',
+        default=None,
+        help=optparse.SUPPRESS_HELP
+    )
+    parser.add_option(
+        '-v',
+        '--verbose',
+        action='store_true',
+        dest='verbose',
+        default=False,
+        help='Show progress messages'
+    )
+
+    (options, args) = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(message)s',
+        level=options.verbose and logging.INFO or logging.WARNING
+    )
+
+    if options.case:
+        new_path, old_path = args
+        result = run_case(options.case, new_path, old_path, options.encodings, options.repeat,
+                          options.parsers)
+        sys.stdout.write(json.dumps(result))
+        return 0
+
+    results = run_benchmarks(
+        [int(size) for size in options.sizes.split(',')],
+        options.encodings.split(','),
+        options.operations.split(','),
+        options.corpus_dir,
+        options.repeat,
+        options.seed,
+        options.corpora.split(','),
+        options.parsers.split(',')
+    )
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': options.seed,
+        'results': results,
+    }
+    output = json.dumps(report, sort_keys=True, indent=2)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare_results(results, baseline)
+        for result, base, ratio in regressions:
+            logging.error('{} {} {} {} {}: {:.4f} s, was {:.4f} s ({:.0%} slower)'.format(
+                result['operation'], result['parser'], result['corpus'], result['size'],
+                result['encoding'], result['seconds'], base['seconds'], ratio - 1
+            ))
+        return regressions and 1 or 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
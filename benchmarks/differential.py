@@ -0,0 +1,505 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Differential tests of the parse and serialize backends of merge_files.py
+
+Runs every backend in PARSERS and SERIALIZERS over a generated corpus and
+over fuzzed files and checks that each one gives exactly the tables and
+bytes of the reference backends, the line parser and the format
+serializer. Entries that differ because they were read from an entry
+with one of the KNOWN_DIVERGENCES are counted and reported instead of
+failing the run, any other difference fails it. The lexer also has to
+give the same entries when it reads a file in buffers of any size. The
+throughput of every backend is measured as well. As long as the lexer has
+known divergences the line parser stays the default, however fast the
+lexer is:
+
+    python benchmarks/differential.py --size 10000 --fuzz 500
+'''
+# -- Import --------------------------------------------------------------------
+# System Utilities
+import sys
+# Commandline Options parser
+import optparse
+# Logging
+import logging
+# Measuring Durations
+import time
+# Reproducible corpora
+import random
+# Regular Expressions
+import re
+# Finding the part of the text an entry was read from
+import bisect
+# Reading and writing results
+import json
+# Describing the machine the results come from
+import platform
+
+# Also puts merge_files on the path
+from benchmark import ENTRY_KINDS, LEXER_ONLY_KINDS, generate_entries
+import merge_files
+
+# -- Corpus --------------------------------------------------------------------
+
+# Inputs the parser backends are known to read differently. Files that
+# contain them are still compared, an entry that differs only counts as a
+# known divergence if it was read from the text of an entry containing one.
+KNOWN_DIVERGENCES = {
+    'line_comment': 'The line parser drops entries followed by a // comment, the lexer '
+                    'reads them',
+    'empty_line': 'The line parser drops empty lines in multi-line values and comments, '
+                  'the lexer keeps them',
+    'quoted_semicolon': 'The line parser ends a multi-line value at any line ending in ";, '
+                        'even if the quote is escaped, the lexer reads on',
+    'multiline_quotes': 'The lexer reads unescaped quotes like the line parser only in '
+                        'entries on a single line',
+}
+# Pieces fuzzed keys and values are made of, including unescaped quotes
+# Xcode would reject but the parsers still have to read
+VALUE_PIECES = [
+    u'a', u'Z', u'7', u' ', u'  ', u'\t', u'=', u';', u',', u'.', u'!', u'?', u':', u"'",
+    u'/', u'-', u'_', u'(', u')', u'%', u'%@', u'%1$@', u'%d', u'%%', u'*', u'/*', u'//',
+    u'\\"', u'\\\\', u'\\n', u'\\t', u'\\U00e4', u'\xe4', u'設定', u'\U0001f600',
+    u'word', u'Title', u'"',
+]
+# Comments end at the first */, so they have no stars
+COMMENT_PIECES = [piece for piece in VALUE_PIECES if u'*' not in piece] + [u'" = "']
+# Quote after an even number of backslashes
+UNESCAPED_QUOTE_EXPR = re.compile(r'(?<!\\)(?:\\\\)*"')
+# Line end at which the line parser takes a value line for the last one
+VALUE_END_EXPR = re.compile(u'" ?; ?$')
+ENCODINGS = ['utf16', 'utf8']
+# Buffer sizes the lexer reads every file in, its entries must not depend on them
+CHUNK_SIZES = [1, 7, 64, 1000]
+
+
+def fuzz_text(seed, count=20):
+    '''Generates a random strings file. Keys and single-line values may
+    contain unescaped quotes, values and comments may span several lines
+    and entries may be followed by a trailing comment. Each of the
+    KNOWN_DIVERGENCES is only put into some of the files and there into
+    some of the entries, so that most entries still have to be read alike.
+    The same seed always gives the same file.
+
+    Returns
+
+        (text, features) ``tuple``, features being a ``list`` of (start,
+        end, names) tuples: the part of the text of every entry that
+        contains names in KNOWN_DIVERGENCES and the ``set`` of these names
+
+    Examples:
+
+        >>> fuzz_text(1) == fuzz_text(1)
+        True
+        >>> text, features = fuzz_text(2)
+        >>> start, end, names = features[0]
+        >>> names <= set(KNOWN_DIVERGENCES)
+        True
+        >>> text[start] in u'/"', text[end - 1] in u'/;'
+        (True, True)
+        >>> texts = [fuzz_text(seed) for seed in range(50)]
+        >>> len([text for text, features in texts if not features]) > 10
+        True
+        >>> all(len(features) < 20 for text, features in texts)
+        True
+        >>> found = set()
+        >>> for text, features in texts:
+        ...     found.update(*[names for start, end, names in features])
+        >>> len(found) == len(KNOWN_DIVERGENCES)
+        True
+    '''
+    generator = random.Random(seed)
+    allowed = set(feature for feature in sorted(KNOWN_DIVERGENCES) if generator.random() < 0.2)
+    features = []
+    escaped_pieces = [piece for piece in VALUE_PIECES if piece != u'"']
+
+    def pieces(choices, maximum):
+        return u''.join(generator.choice(choices) for index in range(generator.randint(1, maximum)))
+
+    def lines(choices, found):
+        parts = [pieces(choices, 10) for index in range(generator.choice([1, 1, 1, 2, 3]))]
+        if len(parts) > 1 and 'empty_line' in allowed and generator.random() < 0.3:
+            parts.insert(generator.randint(1, len(parts) - 1), generator.choice([u'', u'  ']))
+        if len(parts) > 1 and not all(part.strip() for part in parts):
+            if 'empty_line' in allowed:
+                found.add('empty_line')
+            else:
+                parts = [part.strip() and part or part + u'x' for part in parts]
+        return parts
+
+    entries = []
+    length = 0
+    for number in range(count):
+        # Names in KNOWN_DIVERGENCES this entry contains
+        found = set()
+        key = u'{} {}'.format(pieces(VALUE_PIECES, 6), number)
+        value = lines(VALUE_PIECES, found)
+        if len(value) > 1 and any(UNESCAPED_QUOTE_EXPR.search(part) for part in value + [key]):
+            if 'multiline_quotes' in allowed:
+                found.add('multiline_quotes')
+            else:
+                key = u'{} {}'.format(pieces(escaped_pieces, 6), number)
+                value = [pieces(escaped_pieces, 10) for part in value]
+        if len(value) > 1 and 'quoted_semicolon' in allowed and generator.random() < 0.3:
+            value[0] += u'\\";'
+        if any(VALUE_END_EXPR.search(part) for part in value[:-1]):
+            if 'quoted_semicolon' in allowed:
+                found.add('quoted_semicolon')
+            else:
+                value[:-1] = [VALUE_END_EXPR.search(part) and part + u'x' or part
+                              for part in value[:-1]]
+        comment = lines(COMMENT_PIECES, found)
+        value, comment = u'\n'.join(value), u'\n'.join(comment)
+        equals = generator.choice([u'=', u' =', u'= ', u' = '])
+        chance = generator.random()
+        if u'\n' not in value + comment and chance < 0.2:
+            entry = u'"{}"{}"{}"; /* {} */\n'.format(key, equals, value, comment)
+        elif u'\n' not in value and 'line_comment' in allowed and chance < 0.3:
+            entry = u'/* {} */\n"{}"{}"{}"; // {}\n'.format(comment, key, equals, value,
+                                                           pieces(VALUE_PIECES, 4))
+            found.add('line_comment')
+        else:
+            entry = u'/* {} */\n"{}"{}"{}";\n'.format(comment, key, equals, value)
+        if found:
+            features.append((length, length + len(entry.rstrip()), found))
+        entries.append(entry + u'\n' * generator.randint(0, 2))
+        length += len(entries[-1])
+    return u''.join(entries), features
+
+
+def corpora(size, fuzz, fuzz_size, seed=0):
+    '''Generates the texts the backends are compared on: one generated
+    corpus of size entries, the same with the LEXER_ONLY_KINDS of entries
+    and fuzz fuzzed files of fuzz_size entries
+
+    Returns
+
+        generator of (name, text, features) tuples, features being the
+        entries with names in KNOWN_DIVERGENCES like fuzz_text returns them
+    '''
+    entries = generate_entries(size, seed)
+    yield 'generated-{}'.format(size), u''.join(text for key, text in entries), []
+    entries = generate_entries(size, seed, ENTRY_KINDS + LEXER_ONLY_KINDS)
+    features = []
+    length = 0
+    for key, text in entries:
+        if u' // ' in text:
+            features.append((length, length + len(text.rstrip()), set(['line_comment'])))
+        length += len(text)
+    yield ('generated-lexer-only-{}'.format(size), u''.join(text for key, text in entries),
+           features)
+    for number in range(fuzz):
+        text, features = fuzz_text(seed + number, fuzz_size)
+        yield 'fuzz-{}'.format(seed + number), text, features
+
+# -- Differential --------------------------------------------------------------
+
+
+def read_entries(text, parser):
+    '''Parses text with a parser backend and finds the part of the text
+    every entry was read from, without the whitespace around it
+
+    Returns
+
+        (table, spans) ``tuple``, spans being a ``dict`` of the keys to
+        (start, end) tuples. Text after the last entry the parser skipped
+        is under ``None``.
+
+    Examples:
+
+        >>> text = u'/* a */\\n"a" = "b";\\n\\n/* c */\\n"c" = "d";\\n'
+        >>> for parser in sorted(merge_files.PARSERS):
+        ...     table, spans = read_entries(text, parser)
+        ...     start, end = spans[u'c']
+        ...     print(text[start:end] == u'/* c */\\n"c" = "d";')
+        True
+        True
+        >>> table, spans = read_entries(text + u'/* e */\\n"e" = ;\\n', 'lexer')
+        >>> start, end = spans[None]
+        >>> len(table), (text + u'/* e */\\n"e" = ;\\n')[start:end] == u'/* e */\\n"e" = ;'
+        (2, True)
+    '''
+    positions = []
+    parse_chunks = merge_files.get_backend(merge_files.PARSERS, parser)().parse_chunks
+    table = {}
+    spans = {}
+    strings = list(parse_chunks([text], positions))
+    for key, start, end in zip([string.key for string in strings] + [None],
+                               [0] + positions, positions + [len(text)]):
+        part = text[start:end]
+        if part.strip():
+            spans[key] = (start + len(part) - len(part.lstrip()),
+                          end - len(part) + len(part.rstrip()))
+    for string in strings:
+        table[string.key] = string
+    return table, spans
+
+
+def describe(string):
+    if string is None:
+        return 'missing'
+    return repr((string.value, string.comment))
+
+
+def compare_parsers(name, text, features=()):
+    '''Parses text with every parser backend and compares the tables with
+    the one of the reference parser. An entry that differs is a known
+    divergence if one of the parsers read it from text that overlaps one of
+    the entries in features, see fuzz_text, directly or through the text
+    other entries were read from: a parser that reads past the end of such
+    an entry also reads the entries after it differently. Every other
+    entry that differs is a mismatch.
+
+    Returns
+
+        (mismatches, divergences) ``tuple``: ``list`` of mismatch messages
+        and ``list`` of the ``set``s of names in KNOWN_DIVERGENCES of every
+        entry that differs in a known way
+
+    Examples:
+
+        >>> text = u'/* a */\\n"a" = "b"; // c\\n'
+        >>> len(compare_parsers('text', text)[0])
+        1
+        >>> mismatches, divergences = compare_parsers(
+        ...     'text', text, [(0, len(text) - 1, set(['line_comment']))])
+        >>> mismatches, [sorted(names) for names in divergences]
+        ([], [['line_comment']])
+    '''
+    reference, reference_spans = read_entries(text, merge_files.REFERENCE_PARSER)
+    mismatches = []
+    divergences = []
+    for parser in sorted(merge_files.PARSERS):
+        table, spans = read_entries(text, parser)
+        # Parts of the text the parsers read across, joined where they
+        # overlap, with the names in KNOWN_DIVERGENCES they contain
+        regions = []
+        parts = sorted([(start, end, set()) for start, end in
+                        list(spans.values()) + list(reference_spans.values())] +
+                       [(start, end, set(names)) for start, end, names in features])
+        for start, end, names in parts:
+            if regions and start < regions[-1][1]:
+                regions[-1][1] = max(regions[-1][1], end)
+                regions[-1][2].update(names)
+            else:
+                regions.append([start, end, names])
+        starts = [region[0] for region in regions]
+        for key in sorted(set(reference) | set(table)):
+            if reference.get(key) == table.get(key):
+                continue
+            names = set()
+            for span in (spans.get(key), reference_spans.get(key)):
+                if span is not None:
+                    names.update(regions[bisect.bisect_right(starts, span[0]) - 1][2])
+            message = '{}: parser {} differs at {!r}, {} instead of {}'.format(
+                name, parser, key, describe(table.get(key)), describe(reference.get(key))
+            )
+            if names:
+                logging.info('{} (known: {})'.format(message, ', '.join(sorted(names))))
+                divergences.append(names)
+            else:
+                mismatches.append(message)
+    return mismatches, divergences
+
+
+def compare_chunks(name, text):
+    '''Parses text with the lexer in buffers of every size in CHUNK_SIZES and
+    compares the entries with those of the whole text
+
+    Returns
+
+        ``list`` of mismatch messages
+
+    Examples
+
+        >>> compare_chunks('fuzz-4', fuzz_text(4)[0])
+        []
+    '''
+    lexer = merge_files.LocalizedStringLexer()
+    expected = list(lexer.parse(text))
+    mismatches = []
+    for size in CHUNK_SIZES:
+        chunks = [text[index:index + size] for index in range(0, len(text), size)]
+        if list(lexer.parse_chunks(chunks)) != expected:
+            mismatches.append('{}: lexer differs when reading {} characters at a time'.format(
+                name, size
+            ))
+    return mismatches
+
+
+def compare_serializers(name, text):
+    '''Renders the table of text with every serializer backend, at once and
+    streamed, and compares the bytes with those of the reference serializer
+
+    Returns
+
+        ``list`` of mismatch messages
+    '''
+    table = merge_files.parse_text(text, merge_files.REFERENCE_PARSER)
+    sorted_strings = merge_files.sort_strings(table)
+    mismatches = []
+    for encoding in ENCODINGS:
+        reference = merge_files.render_strings(table, encoding, merge_files.REFERENCE_SERIALIZER)
+        for serializer in sorted(merge_files.SERIALIZERS):
+            rendered = merge_files.render_strings(table, encoding, serializer)
+            streamed = b''.join(merge_files.encode_strings(sorted_strings, encoding, serializer))
+            for way, data in [('render_strings', rendered), ('encode_strings', streamed)]:
+                if data != reference:
+                    offset = next((index for index, (a, b) in enumerate(zip(data, reference))
+                                   if a != b), min(len(data), len(reference)))
+                    mismatches.append('{}: serializer {} {} in {} differs at byte {}'.format(
+                        name, serializer, way, encoding, offset
+                    ))
+    return mismatches
+
+# -- Throughput ----------------------------------------------------------------
+
+
+def best_time(function, repeat=3):
+    timings = []
+    for run in range(repeat):
+        start = time.time()
+        function()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def measure_throughput(text, repeat=3):
+    '''Measures how many entries per second every backend parses or renders
+
+    Returns
+
+        ``list`` of ``dict``s with ``kind``, ``backend``, ``seconds`` and
+        ``entries_per_second``
+    '''
+    table = merge_files.parse_text(text, merge_files.REFERENCE_PARSER)
+    sorted_strings = merge_files.sort_strings(table)
+    results = []
+    for parser in sorted(merge_files.PARSERS):
+        seconds = best_time(lambda: merge_files.parse_text(text, parser), repeat)
+        results.append({'kind': 'parser', 'backend': parser, 'seconds': seconds})
+    for serializer in sorted(merge_files.SERIALIZERS):
+        render = merge_files.SERIALIZERS[serializer].render
+        seconds = best_time(lambda: render(sorted_strings), repeat)
+        results.append({'kind': 'serializer', 'backend': serializer, 'seconds': seconds})
+    for result in results:
+        result['entries_per_second'] = len(table) / max(result['seconds'], 1e-9)
+    return results
+
+
+def main():
+    ''' Parse the command line, compare the backends and measure them '''
+
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option(
+        '--size',
+        action='store',
+        type='int',
+        dest='size',
+        default=10000,
+        help='Entries of the generated corpus, also used for the throughput'
+    )
+    parser.add_option(
+        '--fuzz',
+        action='store',
+        type='int',
+        dest='fuzz',
+        default=500,
+        help='Number of fuzzed files'
+    )
+    parser.add_option(
+        '--fuzz_size',
+        action='store',
+        type='int',
+        dest='fuzz_size',
+        default=20,
+        help='Entries per fuzzed file'
+    )
+    parser.add_option(
+        '--seed',
+        action='store',
+        type='int',
+        dest='seed',
+        default=0,
+        help='Seed of the corpus generator and the first fuzzed file'
+    )
+    parser.add_option(
+        '--repeat',
+        action='store',
+        type='int',
+        dest='repeat',
+        default=3,
+        help='Runs per throughput measurement, the best one counts'
+    )
+    parser.add_option(
+        '--output',
+        action='store',
+        dest='output',
+        default=None,
+        help='Write the mismatches and throughput as JSON to this file'
+    )
+    parser.add_option(
+        '-v',
+        '--verbose',
+        action='store_true',
+        dest='verbose',
+        default=False,
+        help='Show progress messages'
+    )
+
+    (options, args) = parser.parse_args()
+
+    logging.basicConfig(
+        format='%(message)s',
+        level=options.verbose and logging.INFO or logging.WARNING
+    )
+
+    mismatches = []
+    # Differing entries per name in KNOWN_DIVERGENCES they contain
+    divergences = dict((feature, 0) for feature in KNOWN_DIVERGENCES)
+    diverging = 0
+    texts = 0
+    corpus = corpora(options.size, options.fuzz, options.fuzz_size, options.seed)
+    for name, text, features in corpus:
+        logging.info('Comparing backends on {}'.format(name))
+        parser_mismatches, parser_divergences = compare_parsers(name, text, features)
+        mismatches.extend(parser_mismatches)
+        for names in parser_divergences:
+            for feature in names:
+                divergences[feature] += 1
+        diverging += len(parser_divergences)
+        mismatches.extend(compare_chunks(name, text))
+        mismatches.extend(compare_serializers(name, text))
+        texts += 1
+    for mismatch in mismatches:
+        logging.error(mismatch)
+
+    entries = generate_entries(options.size, options.seed)
+    throughput = measure_throughput(u''.join(text for key, text in entries), options.repeat)
+    for result in throughput:
+        sys.stdout.write('{kind:<10} {backend:<8} {entries_per_second:>10.0f} entries/s\n'.format(
+            **result))
+    sys.stdout.write('{} entries with known divergences in {} files\n'.format(diverging, texts))
+    for feature in sorted(divergences):
+        sys.stdout.write('  {:<18} {:>6} entries  {}\n'.format(
+            feature, divergences[feature], KNOWN_DIVERGENCES[feature]))
+    sys.stdout.write('{} mismatches in {} files\n'.format(len(mismatches), texts))
+
+    if options.output:
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': options.seed,
+            'mismatches': mismatches,
+            'divergences': divergences,
+            'throughput': throughput,
+        }
+        with open(options.output, 'w') as output_file:
+            output_file.write(json.dumps(report, sort_keys=True, indent=2))
+    return mismatches and 1 or 0
+
+if __name__ == '__main__':
+    sys.exit(main())